@@ -0,0 +1,148 @@
+""" Benchmark suite of the library, run against the emulator.
+
+Runs the codec, CRC, decode, bus and memory benchmarks and prints a JSON
+report of flat metrics. Each metric has a value, a unit and whether
+higher is better. Throughputs are the best of several repetitions, so
+the report is stable from run to run on the same machine.
+
+With --compare, the report is compared to a saved baseline report. The
+metrics which got worse by more than the threshold are listed and the
+exit status is 1.
+
+Usage:
+    python -m benchmarks [--quick] [--output report.json]
+    python -m benchmarks --compare baseline.json [--threshold 0.15] [--output report.json]
+    python -m benchmarks --compare baseline.json --report report.json
+"""
+import argparse
+import json
+import platform
+import sys
+
+from smd import red
+from benchmarks import bench_bus, bench_codec, bench_crc, bench_decode, bench_registers
+
+REPORT_VERSION = 1
+
+
+def metric(value, unit, higher_is_better):
+    return {'value': float('{:.4g}'.format(value)), 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def best(fn, repeat):
+    """ Return the best of the results of fn, each a dict of {name: (value, unit, higher_is_better)}. """
+    results = [fn() for _ in range(repeat)]
+    merged = dict()
+    for name, (value, unit, higher) in results[0].items():
+        values = [result[name][0] for result in results]
+        merged[name] = metric(max(values) if higher else min(values), unit, higher)
+    return merged
+
+
+def codec(frames):
+    return {'encode.{}'.format(name): (after, 'frames/s', True)
+            for name, (_, after) in bench_codec.run(frames).items()}
+
+
+def crc(count):
+    return {'crc.{}B'.format(size): (table, 'us/frame', False)
+            for size, (_, table, _) in bench_crc.run(count).items()}
+
+
+def decode(replies):
+    return {'decode.{}'.format(name): (after, 'replies/s', True)
+            for name, (_, after) in bench_decode.run(replies).items()}
+
+
+def bus(seconds, baudrates):
+    metrics = dict()
+    for baudrate, result in bench_bus.run(seconds, baudrates).items():
+        metrics['bus.get_variables.{}'.format(baudrate)] = (result['round trips'], 'transactions/s', True)
+        metrics['bus.scan.{}'.format(baudrate)] = (result['scan'], 's', False)
+        for count, rate in result['sync'].items():
+            metrics['bus.set_variables_sync.{}.{}ids'.format(baudrate, count)] = (rate, 'calls/s', True)
+    return metrics
+
+
+def memory(devices):
+    return {'memory.attached_driver': (bench_registers.measure(lambda: red.Red(1), devices)[1], 'B', False)}
+
+
+def run(quick=False, repeat=3):
+    scale = 0.1 if quick else 1
+    baudrates = [1000000] if quick else bench_bus.BAUDRATES
+    metrics = dict()
+    metrics.update(best(lambda: codec(int(20000 * scale)), repeat))
+    metrics.update(best(lambda: crc(int(5000 * scale)), repeat))
+    metrics.update(best(lambda: decode(int(50000 * scale)), repeat))
+    metrics.update(best(lambda: bus(0.5 * scale, baudrates), 1))
+    metrics.update(best(lambda: memory(256), 1))
+    return {
+        'version': REPORT_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'metrics': dict(sorted(metrics.items())),
+    }
+
+
+def compare(report, baseline, threshold):
+    """ Compare the metrics of a report to a baseline report.
+
+    Args:
+        report (dict): New report
+        baseline (dict): Saved report
+        threshold (float): Relative change which is a regression, e.g. 0.15 for 15%
+
+    Returns:
+        list: [(name, baseline value, new value, relative change, regression)], a positive change is an improvement
+    """
+    rows = []
+    for name, new in report['metrics'].items():
+        old = baseline['metrics'].get(name)
+        if (old is None) or (old['value'] == 0):
+            continue
+        change = (new['value'] - old['value']) / old['value']
+        if not new['higher_is_better']:
+            change = -change
+        rows.append((name, old['value'], new['value'], change, change < -threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark suite of the SMD library.')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations and only 1 Mbps on the bus')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare to a saved report and flag regressions')
+    parser.add_argument('--report', help='compare this saved report instead of running the benchmarks')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative change flagged as a regression')
+    args = parser.parse_args(argv)
+
+    if args.report is not None:
+        with open(args.report, 'r') as file:
+            report = json.load(file)
+    else:
+        report = run(args.quick)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+    if args.compare is None:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return 0
+
+    with open(args.compare, 'r') as file:
+        baseline = json.load(file)
+    rows = compare(report, baseline, args.threshold)
+    print("{:<44}{:>14}{:>14}{:>10}".format('metric', 'baseline', 'new', 'change'))
+    for name, old, new, change, regression in rows:
+        print("{:<44}{:>14.4g}{:>14.4g}{:>+9.1f}%{}".format(name, old, new, change * 100,
+                                                           '  REGRESSION' if regression else ''))
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print("{} of {} metrics regressed by more than {:.0f}%".format(len(regressions), len(rows), args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+""" Frame builders and reply decoder of the library before the codec layer.
+
+Vendored from the baseline smd/red.py and smd/_internals.py, so the
+"before" columns of bench_codec, bench_decode and bench_registers measure
+the code which the codec layer replaced. Only the register types are
+taken from the current register table, they did not change.
+"""
+import enum
+import struct
+
+from crccheck.crc import Crc32Mpeg2 as CRC32
+
+from smd.red import Red, Index, Commands
+
+
+class _Data():
+    def __init__(self, index, var_type, rw=True, value=0):
+        self.__index = index
+        self.__type = var_type
+        self.__size = struct.calcsize(self.__type)
+        self.__value = value
+        self.__rw = rw
+
+    def value(self, value=None):
+        if value is None:
+            return self.__value
+        elif self.__rw:
+            if len(self.__type) > 1:
+                self.__value = list(struct.unpack('<' + self.__type, struct.pack('<' + self.__type, *value)))
+            else:
+                self.__value = struct.unpack('<' + self.__type, struct.pack('<' + self.__type, value))[0]
+
+    def index(self) -> enum.IntEnum:
+        return self.__index
+
+    def size(self) -> int:
+        return self.__size
+
+    def type(self) -> str:
+        return self.__type
+
+
+class LegacyRed():
+    """ Red of the baseline, with the frame builders of the benchmarks and
+    the decoder of Master.__parse as parse.
+    """
+    _PRODUCT_TYPE = 0xBA
+
+    def __init__(self, ID: int) -> None:
+        self.__ack_size = 0
+        self.vars = [_Data(index, var_type) for index, var_type in zip(Index, Red._REGISTERS.types)]
+        self.vars[Index.Header] = _Data(Index.Header, 'B', False, 0x55)
+        self.vars[Index.DeviceFamily] = _Data(Index.DeviceFamily, 'B', False, self.__class__._PRODUCT_TYPE)
+
+        if ID > 255 or ID < 0:
+            raise ValueError("Device ID can not be higher than 254 or lower than 0!")
+        else:
+            self.vars[Index.DeviceID].value(ID)
+
+    def get_ack_size(self):
+        return self.__ack_size
+
+    def set_variables(self, index_list=[], value_list=[], ack=False):
+        self.vars[Index.Command].value(Commands.WRITE_ACK if ack else Commands.WRITE)
+
+        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
+        for index, value in zip(index_list, value_list):
+            self.vars[int(index)].value(value)
+            fmt_str += 'B' + self.vars[int(index)].type()
+
+        self.__ack_size = struct.calcsize(fmt_str)
+
+        struct_out = list(struct.pack(fmt_str, *[*[var.value() for var in self.vars[:6]], *[val for pair in zip(index_list, [self.vars[int(index)].value() for index in index_list]) for val in pair]]))
+
+        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[int(Index.CRCValue)].size()
+
+        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+
+        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+
+    def get_variables(self, index_list=[]):
+        self.vars[Index.Command].value(Commands.READ)
+
+        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
+        fmt_str += 'B' * len(index_list)
+
+        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type()) \
+            + struct.calcsize('<' + ''.join(self.vars[idx].type() for idx in index_list))
+
+        struct_out = list(struct.pack(fmt_str, *[*[var.value() for var in self.vars[:6]], *[int(idx) for idx in index_list]]))
+
+        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
+
+        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+
+        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+
+    def reboot(self):
+        self.vars[Index.Command].value(Commands.REBOOT)
+        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
+        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
+        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
+        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+        self.__ack_size = 0
+
+        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+
+    def ping(self):
+        self.vars[Index.Command].value(Commands.PING)
+        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
+        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
+        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
+        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type())
+        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+
+    def reset_encoder(self):
+        self.vars[Index.Command].value(Commands.RESET_ENC)
+        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
+        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
+        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
+        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type())
+        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+
+    def scan_modules(self):
+        self.vars[Index.Command].value(Commands.MODULE_SCAN)
+        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
+        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
+        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
+        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type())
+        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+
+    def parse(self, data: bytes):
+        """ Parse the data which has passed the CRC check, as Master.__parse did. """
+        data = data[6:-4]
+
+        i = 0
+        while i < len(data):
+            fmt_str = '<B' + self.vars[data[i]].type()
+
+            sdata = data[i: i + self.vars[data[i]].size() + 1]
+            unpacked = list(struct.unpack(fmt_str, sdata))
+
+            self.vars[unpacked[0]].value(unpacked[1] if len(unpacked) <= 2 else unpacked[1::])
+            i += self.vars[data[i]].size() + 1
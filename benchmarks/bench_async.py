@@ -0,0 +1,117 @@
+""" Event loop latency of AsyncMaster while the bus is saturated.
+
+A ticker task sleeps 1 ms in a loop and records how late it wakes up,
+while other tasks poll the position of every driver as fast as the bus
+allows. The same load run through the blocking Master shows what the
+supervisor loop would suffer without the asyncio API.
+
+Usage:
+    python -m benchmarks.bench_async [seconds]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+from smd import red
+from smd.aio import AsyncMaster
+from smd._internals import _FrameReceiver, _crc32_mpeg2
+
+IDS = list(range(8))
+BAUDRATE = 1000000
+
+
+def respond(fd):
+    """ Reply to every READ package with zero values. """
+    receiver = _FrameReceiver(0x55, 0xBA, 10)
+    devices = {id: red.Red(id) for id in IDS}
+    while True:
+        try:
+            receiver.feed(os.read(fd, 256))
+        except OSError:
+            return
+        frame = receiver.next_frame()
+        while frame is not None:
+            if (frame[red.Index.DeviceID] in devices) and (frame[red.Index.Command] == red.Commands.READ):
+                dev = devices[frame[red.Index.DeviceID]]
+                index_list = list(frame[6:-4])
+                reply = bytearray(dev.set_variables(index_list, [dev.vars[index].value() for index in index_list]))
+                reply[red.Index.Command] = red.Commands.READ
+                reply[-4:] = _crc32_mpeg2(reply[:-4]).to_bytes(4, 'little')
+                os.write(fd, reply)
+            frame = receiver.next_frame()
+
+
+async def ticker(lateness, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lateness.append(time.perf_counter() - start - 0.001)
+
+
+async def run_async(port, seconds):
+    master = AsyncMaster(port, BAUDRATE)
+    for id in IDS:
+        master.attach(red.Red(id))
+
+    lateness, stop, transactions = [], asyncio.Event(), [0]
+
+    async def poll(id):
+        while not stop.is_set():
+            await master.get_position(id)
+            transactions[0] += 1
+
+    tasks = [asyncio.ensure_future(poll(id)) for id in IDS] + [asyncio.ensure_future(ticker(lateness, stop))]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    master.close()
+    return lateness, transactions[0]
+
+
+async def run_blocking(master, seconds):
+    lateness, stop, transactions = [], asyncio.Event(), [0]
+
+    async def poll():
+        while not stop.is_set():
+            for id in IDS:
+                master.get_variables(id, [red.Index.PresentPosition])
+                transactions[0] += 1
+            await asyncio.sleep(0)
+
+    tasks = [asyncio.ensure_future(poll()), asyncio.ensure_future(ticker(lateness, stop))]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return lateness, transactions[0]
+
+
+def summary(name, lateness, transactions, seconds):
+    lateness = sorted(lateness)
+    return "{:<10}{:>10.0f}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+        name, transactions / seconds, statistics.median(lateness) * 1e3,
+        lateness[int(len(lateness) * 0.99)] * 1e3, lateness[-1] * 1e3)
+
+
+def run(seconds=2.0):
+    fd, slave = os.openpty()
+    port = os.ttyname(slave)
+    threading.Thread(target=respond, args=(fd,), daemon=True).start()
+
+    results = dict()
+    results['async'] = asyncio.run(run_async(port, seconds))
+
+    master = red.Master(port, BAUDRATE)
+    for id in IDS:
+        master.attach(red.Red(id))
+    results['blocking'] = asyncio.run(run_blocking(master, seconds))
+    return results
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    print("{:<10}{:>10}{:>10}{:>10}{:>10}".format('api', 'reads/s', 'p50 [ms]', 'p99 [ms]', 'max [ms]'))
+    for name, (lateness, transactions) in run(seconds).items():
+        print(summary(name, lateness, transactions, seconds))
@@ -0,0 +1,93 @@
+""" Transactions of Master on an emulated bus with baud accurate timing.
+
+Measures get_variables round trips per second, the wall time of a full
+scan() and set_variables_sync calls per second for a number of IDs, at
+each baudrate. The emulator delivers every reply when its last byte
+would arrive, so the numbers include the time on the wire.
+
+Usage:
+    python -m benchmarks.bench_bus [seconds]
+"""
+import sys
+import time
+
+from smd import red
+from smd.emulator import Emulator
+
+BAUDRATES = [115200, 460800, 1000000]
+SYNC_IDS = [1, 8, 32]
+SCAN_IDS = [0, 1, 2, 3]
+INDEXES = [red.Index.PresentPosition, red.Index.PresentVelocity, red.Index.MotorCurrent]
+
+
+def connect(baudrate, ids):
+    bus = Emulator(ids=ids, baudrate=baudrate)
+    master = red.Master(bus.transport(), baudrate)
+    for id in ids:
+        master.attach(red.Red(id))
+    return bus, master
+
+
+def calls_per_second(fn, seconds):
+    """ Call fn for the given seconds and return the calls per second. """
+    calls = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        fn()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def round_trips(baudrate, seconds):
+    bus, master = connect(baudrate, [1])
+    replies = [0]
+
+    def transaction():
+        if master.get_variables(1, INDEXES) is not None:
+            replies[0] += 1
+
+    rate = calls_per_second(transaction, seconds)
+    bus.close()
+    return rate if replies[0] else 0.0
+
+
+def scan(baudrate):
+    bus, master = connect(baudrate, SCAN_IDS)
+    start = time.perf_counter()
+    # The emulator replies without adapter latency, the probes only wait for the wire time
+    found = master.scan(timeout=0)
+    elapsed = time.perf_counter() - start
+    bus.close()
+    assert found == SCAN_IDS, found
+    return elapsed
+
+
+def sync_writes(baudrate, count, seconds):
+    ids = list(range(count))
+    bus, master = connect(baudrate, ids)
+    pairs = [[id, 100.0] for id in ids]
+    rate = calls_per_second(lambda: master.set_variables_sync(red.Index.SetVelocity, pairs), seconds)
+    assert bus.drivers[count - 1].vars[red.Index.SetVelocity].value() == 100.0
+    bus.close()
+    return rate
+
+
+def run(seconds=0.5, baudrates=BAUDRATES):
+    results = dict()
+    for baudrate in baudrates:
+        results[baudrate] = {
+            'round trips': round_trips(baudrate, seconds),
+            'scan': scan(baudrate),
+            'sync': {count: sync_writes(baudrate, count, seconds) for count in SYNC_IDS},
+        }
+    return results
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    print("{:<10}{:>14}{:>12}".format('baudrate', 'reads [1/s]', 'scan [s]')
+          + ''.join(["{:>14}".format('sync {} [1/s]'.format(count)) for count in SYNC_IDS]))
+    for baudrate, result in run(seconds).items():
+        print("{:<10}{:>14.0f}{:>12.3f}".format(baudrate, result['round trips'], result['scan'])
+              + ''.join(["{:>14.0f}".format(result['sync'][count]) for count in SYNC_IDS]))
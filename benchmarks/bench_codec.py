@@ -0,0 +1,50 @@
+""" Micro-benchmark of the Red frame builders.
+
+Compares the frames/sec of the precompiled codec against the frame
+builders of the baseline, vendored in benchmarks._legacy, which re-joined
+a format string, packed into a list and packed again for every frame.
+
+Usage:
+    python -m benchmarks.bench_codec [frames]
+"""
+import sys
+import time
+
+from smd.red import Red, Index
+from benchmarks._legacy import LegacyRed
+
+
+CASES = [
+    ('ping', lambda d: d.ping()),
+    ('reboot', lambda d: d.reboot()),
+    ('reset_encoder', lambda d: d.reset_encoder()),
+    ('scan_modules', lambda d: d.scan_modules()),
+    ('get_variables[1]', lambda d: d.get_variables([Index.PresentPosition])),
+    ('get_variables[3]', lambda d: d.get_variables([Index.PresentPosition, Index.PresentVelocity, Index.MotorCurrent])),
+    ('set_variables[1]', lambda d: d.set_variables([Index.SetVelocity], [100.0])),
+    ('set_variables[3]',
+     lambda d: d.set_variables([Index.SCurveTime, Index.SCurveMaxVelocity, Index.ScurveAccel], [1.0, 100.0, 50.0])),
+]
+
+def frames_per_second(fn, dev, frames):
+    start = time.perf_counter()
+    for _ in range(frames):
+        fn(dev)
+    return frames / (time.perf_counter() - start)
+
+
+def run(frames=20000):
+    dev = Red(1)
+    legacy = LegacyRed(1)
+    results = dict()
+    for name, build in CASES:
+        assert build(dev) == build(legacy), name
+        results[name] = (frames_per_second(build, legacy, frames), frames_per_second(build, dev, frames))
+    return results
+
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("{:<20}{:>14}{:>14}{:>10}".format('command', 'before [f/s]', 'after [f/s]', 'speedup'))
+    for name, (before, after) in run(frames).items():
+        print("{:<20}{:>14.0f}{:>14.0f}{:>9.1f}x".format(name, before, after, after / before))
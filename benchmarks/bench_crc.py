@@ -0,0 +1,46 @@
+""" Benchmark of the CRC32/MPEG-2 used on every outgoing and incoming frame.
+
+Reports µs/frame of crccheck against the table driven engine, with and
+without a pre-hashed header.
+
+Usage:
+    python -m benchmarks.bench_crc [frames]
+"""
+import random
+import sys
+import time
+
+from crccheck.crc import Crc32Mpeg2 as CRC32
+
+from smd._internals import _crc32_mpeg2
+
+FRAME_SIZES = [10, 16, 32, 64, 128, 251]
+
+
+def us_per_frame(fn, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        fn(frame)
+    return (time.perf_counter() - start) / len(frames) * 1e6
+
+
+def run(count=5000):
+    rng = random.Random(0)
+    results = dict()
+    for size in FRAME_SIZES:
+        frames = [bytes(rng.getrandbits(8) for _ in range(size)) for _ in range(count)]
+        header_crc = _crc32_mpeg2(frames[0][:3])
+        views = [memoryview(frame)[3:] for frame in frames]
+        results[size] = (
+            us_per_frame(CRC32.calc, frames),
+            us_per_frame(_crc32_mpeg2, frames),
+            us_per_frame(lambda view: _crc32_mpeg2(view, header_crc), views),
+        )
+    return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print("{:<8}{:>14}{:>14}{:>18}".format('bytes', 'crccheck [us]', 'table [us]', 'pre-hashed [us]'))
+    for size, (ref, table, prehashed) in run(count).items():
+        print("{:<8}{:>14.2f}{:>14.2f}{:>18.2f}".format(size, ref, table, prehashed))
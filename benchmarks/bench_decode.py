@@ -0,0 +1,66 @@
+""" Micro-benchmark of the reply decoder.
+
+Compares the replies/sec of Red.parse_reply, which checks a reply with one
+precompiled unpack and copies the packed values into the register store,
+against the decoder of the baseline, vendored in benchmarks._legacy, which
+built a format string, unpacked and re-packed every field.
+
+Usage:
+    python -m benchmarks.bench_decode [replies]
+"""
+import sys
+import time
+
+from smd.red import Red, Index, Commands
+from smd._internals import _crc32_mpeg2
+from benchmarks._legacy import LegacyRed
+
+
+def reply(index_list, value_list):
+    frame = bytearray(Red(1).set_variables(index_list, value_list))
+    frame[Index.Command] = Commands.READ
+    frame[-4:] = _crc32_mpeg2(frame[:-4]).to_bytes(4, 'little')
+    return bytes(frame)
+
+
+CASES = [
+    ('position', [Index.PresentPosition], [12.5]),
+    ('pos/vel/current', [Index.PresentPosition, Index.PresentVelocity, Index.MotorCurrent], [12.5, -3.0, 0.25]),
+    ('pid gains', [Index.PositionPGain, Index.PositionIGain, Index.PositionDGain, Index.PositionFF,
+                   Index.PositionDeadband, Index.PositionOutputLimit], [1.5, 0.1, 0.01, 0.0, 2.0, 100.0]),
+    ('joystick', [Index.Joystick_1], [[-100, 100, 1]]),
+]
+
+
+def replies_per_second(fn, replies, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(replies):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return replies / best
+
+
+def run(replies=50000):
+    results = dict()
+    for name, index_list, value_list in CASES:
+        data = reply(index_list, value_list)
+        dev = Red(1)
+        dev.get_variables(index_list)
+        legacy = LegacyRed(1)
+
+        legacy.parse(data)
+        dev.parse_reply(data)
+        assert [legacy.vars[index].value() for index in index_list] == [dev.vars[index].value() for index in index_list], name
+
+        results[name] = (replies_per_second(lambda: legacy.parse(data), replies),
+                         replies_per_second(lambda: dev.parse_reply(data), replies))
+    return results
+
+
+if __name__ == '__main__':
+    replies = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print("{:<20}{:>14}{:>14}{:>10}".format('reply', 'before [r/s]', 'after [r/s]', 'speedup'))
+    for name, (before, after) in run(replies).items():
+        print("{:<20}{:>14.0f}{:>14.0f}{:>9.1f}x".format(name, before, after, after / before))
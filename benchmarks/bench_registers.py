@@ -0,0 +1,83 @@
+""" Memory and construction time of the Red register file.
+
+Compares the shared register layout and packed value store against the
+list of one _Data object per register of the baseline, vendored in
+benchmarks._legacy, then measures the construction of a Master and a
+full scan() over a pty with tracemalloc.
+
+Usage:
+    python -m benchmarks.bench_registers [devices]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+from smd import red
+from benchmarks._legacy import _Data
+
+
+def legacy_vars():
+    layout = red.Red._REGISTERS
+    return [_Data(layout.indexes[i], layout.types[i], layout.rw[i], 0) for i in range(len(layout.indexes))]
+
+
+def compact_vars():
+    return red._RegisterFile(red.Red._REGISTERS)
+
+
+def measure(fn, count):
+    """ Return the seconds per call and the bytes retained per call. """
+    tracemalloc.start()
+    objects = [fn() for _ in range(count)]
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - start) / count, retained / count
+
+
+def measure_master(port):
+    tracemalloc.start()
+    start = time.perf_counter()
+    master = red.Master(port, 1000000)
+    construction = (time.perf_counter() - start, tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+
+    # A fresh trace starts the peak from zero, tracemalloc.reset_peak needs Python 3.9
+    tracemalloc.start()
+    start = time.perf_counter()
+    # The emulator replies without adapter latency, the probes only wait for the wire time
+    master.scan(timeout=0)
+    scan = (time.perf_counter() - start, construction[1] + tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    return construction, scan
+
+
+def run(devices=256):
+    results = dict()
+    results['register file'] = (measure(legacy_vars, devices), measure(compact_vars, devices))
+    fd, slave = os.openpty()
+    try:
+        results['master'] = measure_master(os.ttyname(slave))
+    finally:
+        os.close(fd)
+        os.close(slave)
+    return results
+
+
+if __name__ == '__main__':
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    results = run(devices)
+    (old_time, old_size), (new_time, new_size) = results['register file']
+    print("{:<24}{:>14}{:>14}{:>10}".format('register file', 'before', 'after', 'ratio'))
+    print("{:<24}{:>14.1f}{:>14.1f}{:>9.1f}x".format('construction [us]', old_time * 1e6, new_time * 1e6, old_time / new_time))
+    print("{:<24}{:>14.0f}{:>14.0f}{:>9.1f}x".format('memory [B/device]', old_size, new_size, old_size / new_size))
+    (master_time, master_size), (scan_time, scan_peak) = results['master']
+    print()
+    print("{:<24}{:>14}{:>14}".format('master', 'time [ms]', 'memory [kB]'))
+    print("{:<24}{:>14.2f}{:>14.1f}".format('construction', master_time * 1e3, master_size / 1024))
+    print("{:<24}{:>14.2f}{:>14.1f}".format('scan() peak', scan_time * 1e3, scan_peak / 1024))
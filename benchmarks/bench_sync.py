@@ -0,0 +1,58 @@
+""" Bytes on the wire and frames per control cycle of a coordinated
+S-curve move, written with unicast, single index sync, multi driver sync
+and bulk packages.
+
+Usage:
+    python -m benchmarks.bench_sync [baudrate]
+"""
+import sys
+
+from smd.red import Master, Red, Index
+from smd.emulator import Emulator
+
+AXES = [4, 8, 16, 32]
+MOVE = [Index.SCurveTime, Index.SCurveMaxVelocity, Index.ScurveAccel, Index.SCurveSetpoint]
+
+
+def unicast(master, ids):
+    for id in ids:
+        master.set_variables(id, [[index, 1.0] for index in MOVE])
+
+
+def sync(master, ids):
+    for index in MOVE:
+        master.set_variables_sync(index, [[id, 1.0] for id in ids])
+
+
+def sync_multi(master, ids):
+    master.set_variables_sync_multi({id: [[index, 1.0] for index in MOVE] for id in ids})
+
+
+def bulk(master, ids):
+    master.set_variables_bulk({id: [[index, 1.0] for index in MOVE] for id in ids})
+
+
+def run(baudrate=115200):
+    results = dict()
+    bus = Emulator(ids=range(max(AXES)))
+    transport = bus.transport()
+    master = Master(transport, baudrate)
+    for id in range(max(AXES)):
+        master.attach(Red(id))
+
+    for axes in AXES:
+        ids = list(range(axes))
+        for name, fn in [('unicast', unicast), ('sync', sync), ('sync_multi', sync_multi), ('bulk', bulk)]:
+            packages, written = bus.packages, transport.written
+            fn(master, ids)
+            frames, nbytes = bus.packages - packages, transport.written - written
+            results[(axes, name)] = (frames, nbytes, nbytes * 10 / baudrate * 1e3)
+    bus.close()
+    return results
+
+
+if __name__ == '__main__':
+    baudrate = int(sys.argv[1]) if len(sys.argv) > 1 else 115200
+    print("{:<6}{:<12}{:>8}{:>8}{:>12}".format('axes', 'method', 'frames', 'bytes', 'wire [ms]'))
+    for (axes, name), (frames, nbytes, wire) in run(baudrate).items():
+        print("{:<6}{:<12}{:>8}{:>8}{:>12.2f}".format(axes, name, frames, nbytes, wire))
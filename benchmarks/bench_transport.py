@@ -0,0 +1,62 @@
+""" Round trip latency of Master over each transport backend.
+
+Every backend talks to an emulated driver. The pyserial and termios
+backends open one side of a pty served by the emulator, the pty backend
+owns the pty itself, and the in-memory backend calls the emulator
+directly.
+
+Usage:
+    python -m benchmarks.bench_transport [round trips]
+"""
+import os
+import statistics
+import sys
+import time
+
+from smd import red
+from smd.emulator import Emulator
+from smd.transport import SerialTransport, TermiosTransport, PtyTransport
+
+ID = 1
+BAUDRATE = 1000000
+INDEXES = [red.Index.PresentPosition, red.Index.PresentVelocity, red.Index.MotorCurrent]
+
+
+def serve_transport(transport):
+    peer = os.open(transport.name, os.O_RDWR | os.O_NOCTTY)
+    Emulator(ids=[ID]).serve(peer)
+    return transport
+
+
+BACKENDS = [
+    ('pyserial', lambda: SerialTransport(Emulator(ids=[ID]).pty(), BAUDRATE)),
+    ('termios', lambda: TermiosTransport(Emulator(ids=[ID]).pty(), BAUDRATE)),
+    ('pty', lambda: serve_transport(PtyTransport(BAUDRATE))),
+    ('memory', lambda: Emulator(ids=[ID]).transport()),
+]
+
+
+def round_trips(transport, count: int) -> list:
+    master = red.Master(transport, BAUDRATE)
+    master.attach(red.Red(ID))
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        if master.get_variables(ID, INDEXES) is not None:
+            latencies.append(time.perf_counter() - start)
+    transport.close()
+    return latencies
+
+
+def run(count=2000):
+    return {name: round_trips(open_transport(), count) for name, open_transport in BACKENDS}
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("{:<10}{:>10}{:>10}{:>10}{:>10}".format('backend', 'replies', 'p50 [us]', 'p99 [us]', 'mean [us]'))
+    for name, latencies in run(count).items():
+        latencies.sort()
+        print("{:<10}{:>10}{:>10.0f}{:>10.0f}{:>10.0f}".format(
+            name, len(latencies), statistics.median(latencies) * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6, statistics.mean(latencies) * 1e6))
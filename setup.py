@@ -20,7 +20,13 @@ setuptools.setup(
         "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",
         "Operating System :: OS Independent",
     ],
-    packages=setuptools.find_packages(exclude=['tests', 'test']),
-    install_requires=["pyserial>=3.5", "stm32loader>=0.5.1", "crccheck>=1.3.0", "requests>=2.31.0", "packaging>=23.2"],
-    python_requires=">=3.7"
+    packages=setuptools.find_packages(exclude=['tests', 'test', 'benchmarks']),
+    install_requires=["pyserial>=3.5", "stm32loader>=0.5.1", "requests>=2.31.0", "packaging>=23.2"],
+    # crccheck is the reference CRC implementation of the tests and benchmarks
+    extras_require={"test": ["crccheck>=1.3.0"], "benchmark": ["crccheck>=1.3.0"]},
+    python_requires=">=3.7",
+    entry_points={
+        "console_scripts": ["smd-capture=smd.capture:main", "smd-replay=smd.replay:main",
+                            "smd-busd=smd.busd:main"],
+    },
 )
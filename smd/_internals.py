@@ -32,6 +32,14 @@ class MotorConstants():
     MAX_ACCEL = 999999.9999
 
 
+class CachePolicy():
+    """ How long the master may answer reads of a register from the value
+    it read or wrote last. Any other value is a TTL in seconds.
+    """
+    NEVER = 0.0
+    UNTIL_WRITE = float('inf')
+
+
 Index = enum.IntEnum('Index', [
     'Header',
     'DeviceID',
@@ -152,28 +160,256 @@ Index = enum.IntEnum('Index', [
     ], start=0)
 
 
-class _Data():
-    def __init__(self, index, var_type, rw=True, value=0):
+def _crc32_mpeg2_table() -> tuple:
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if (crc & 0x80000000) else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return tuple(table)
+
+
+_CRC32_MPEG2_INIT = 0xFFFFFFFF
+_CRC32_MPEG2_TABLE = _crc32_mpeg2_table()
+
+
+def _crc32_mpeg2(data, crc=_CRC32_MPEG2_INIT) -> int:
+    """ Table driven CRC32/MPEG-2 over bytes, bytearray or memoryview.
+    The result of a call can be passed back as crc to continue hashing,
+    so a fixed prefix only needs to be hashed once.
+
+    Args:
+        data (bytes-like): Data to be hashed
+        crc (int, optional): Running CRC value. Defaults to the initial value.
+
+    Returns:
+        int: CRC value of the data
+    """
+    table = _CRC32_MPEG2_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ byte]
+    return crc
+
+
+class _RegisterLayout():
+    """ Immutable table of the register types, sizes, offsets and access
+    rights, shared by every device of a product. Values of a device are
+    stored packed at these offsets in a single bytearray.
+    """
+    __slots__ = ('indexes', 'types', 'sizes', 'offsets', 'structs', 'rw', 'defaults', 'size', 'cache')
+
+    def __init__(self, registers):
+        """
+        Args:
+            registers (list): (index, type, rw, default[, CachePolicy]) of every register in index order,
+                              registers without a cache policy are never cached
+        """
+        self.indexes = tuple([register[0] for register in registers])
+        self.types = tuple([register[1] for register in registers])
+        self.structs = tuple([struct.Struct('<' + register[1]) for register in registers])
+        self.sizes = tuple([packer.size for packer in self.structs])
+        self.rw = tuple([register[2] for register in registers])
+        self.cache = tuple([register[4] if len(register) > 4 else CachePolicy.NEVER for register in registers])
+
+        offsets = []
+        self.size = 0
+        for size in self.sizes:
+            offsets.append(self.size)
+            self.size += size
+        self.offsets = tuple(offsets)
+
+        defaults = bytearray(self.size)
+        for i, register in enumerate(registers):
+            if register[3]:
+                self.structs[i].pack_into(defaults, self.offsets[i], register[3])
+        self.defaults = bytes(defaults)
+
+
+class _RegisterFile():
+    """ Values of the registers of a device, packed in a bytearray with
+    the offsets of a shared _RegisterLayout. Indexing returns a _Register
+    view with the value/index/size/type accessors of a register.
+    """
+    __slots__ = ('__layout', '__values')
+
+    def __init__(self, layout: _RegisterLayout):
+        self.__layout = layout
+        self.__values = bytearray(layout.defaults)
+
+    def __len__(self) -> int:
+        return len(self.__layout.indexes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [_Register(self, i) for i in range(*key.indices(len(self)))]
+        key = int(key)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("Register index out of range!")
+        return _Register(self, key)
+
+    def __iter__(self):
+        return (_Register(self, i) for i in range(len(self)))
+
+    def layout(self) -> _RegisterLayout:
+        return self.__layout
+
+    def get(self, index):
+        layout = self.__layout
+        value = layout.structs[index].unpack_from(self.__values, layout.offsets[index])
+        return value[0] if len(value) == 1 else list(value)
+
+    def load(self, data, fields):
+        """ Copy packed values into the store without unpacking them.
+
+        Args:
+            data (memoryview): Buffer holding the values
+            fields (iterable): (offset in data, offset in the store, size) of each value
+        """
+        values = self.__values
+        for src, dst, size in fields:
+            values[dst:dst + size] = data[src:src + size]
+
+    def buffer(self) -> bytearray:
+        """ Return the packed values, for decoders which write into the store directly. """
+        return self.__values
+
+    def set(self, index, value):
+        """ Store a value of a writable register. The value is coerced to
+        the register type, e.g. floats are rounded to single precision.
+        """
+        layout = self.__layout
+        if layout.rw[index]:
+            if len(layout.types[index]) > 1:
+                layout.structs[index].pack_into(self.__values, layout.offsets[index], *value)
+            else:
+                layout.structs[index].pack_into(self.__values, layout.offsets[index], value)
+
+
+class _Register():
+    """ View of a single register of a _RegisterFile. """
+    __slots__ = ('__file', '__index')
+
+    def __init__(self, file: _RegisterFile, index: int):
+        self.__file = file
         self.__index = index
-        self.__type = var_type
-        self.__size = struct.calcsize(self.__type)
-        self.__value = value
-        self.__rw = rw
 
     def value(self, value=None):
         if value is None:
-            return self.__value
-        elif self.__rw:
-            if len(self.__type) > 1:
-                self.__value = list(struct.unpack('<' + self.__type, struct.pack('<' + self.__type, *value)))
-            else:
-                self.__value = struct.unpack('<' + self.__type, struct.pack('<' + self.__type, value))[0]
+            return self.__file.get(self.__index)
+        self.__file.set(self.__index, value)
 
     def index(self) -> enum.IntEnum:
-        return self.__index
+        return self.__file.layout().indexes[self.__index]
 
     def size(self) -> int:
-        return self.__size
+        return self.__file.layout().sizes[self.__index]
 
     def type(self) -> str:
-        return self.__type
+        return self.__file.layout().types[self.__index]
+
+
+class _FrameReceiver():
+    """ Streaming receiver which reassembles frames in a preallocated
+    ring buffer. Bytes which do not start a frame with a correct CRC are
+    skipped, so the receiver resynchronizes on the next header and
+    device family bytes.
+    """
+    __slots__ = ('__buffer', '__view', '__mask', '__head', '__tail',
+                 '__header', '__family', '__min_size', 'discarded', 'crc_errors', 'stale')
+
+    def __init__(self, header: int, family: int, min_size: int, size=4096):
+        if size & (size - 1):
+            raise ValueError("Receiver buffer size must be a power of two!")
+        self.__buffer = bytearray(size)
+        self.__view = memoryview(self.__buffer)
+        self.__mask = size - 1
+        self.__head = 0
+        self.__tail = 0
+        self.__header = header
+        self.__family = family
+        self.__min_size = min_size
+        self.discarded = 0
+        self.crc_errors = 0
+        self.stale = 0
+
+    def available(self) -> int:
+        return self.__tail - self.__head
+
+    def clear(self):
+        self.discarded += self.__tail - self.__head
+        self.__head = self.__tail
+
+    def writable(self, size: int) -> memoryview:
+        """ Return a contiguous free region of at most size bytes to read into.
+        The oldest bytes are dropped if the buffer is full.
+        """
+        capacity = len(self.__buffer)
+        if self.__tail - self.__head == capacity:
+            self.__head += 1
+            self.discarded += 1
+        start = self.__tail & self.__mask
+        end = min(capacity, start + size, start + capacity - (self.__tail - self.__head))
+        return self.__view[start:end]
+
+    def commit(self, size: int):
+        """ Mark size bytes of the last writable region as received. """
+        self.__tail += size
+
+    def feed(self, data):
+        """ Copy received bytes into the buffer. """
+        data = memoryview(data)
+        while len(data):
+            region = self.writable(len(data))
+            region[:] = data[:len(region)]
+            self.commit(len(region))
+            data = data[len(region):]
+
+    def __copy(self, start: int, size: int) -> bytes:
+        start &= self.__mask
+        if start + size <= len(self.__buffer):
+            return bytes(self.__view[start:start + size])
+        return bytes(self.__view[start:]) + bytes(self.__view[:start + size - len(self.__buffer)])
+
+    def next_frame(self, flush=False):
+        """ Pop the next complete frame which passes the CRC check.
+
+        Args:
+            flush (bool, optional): Give up on an incomplete frame at the head
+                and search for the next header. Defaults to False.
+
+        Returns:
+            bytes | None: The frame, None if no complete frame is buffered.
+        """
+        buffer, mask = self.__buffer, self.__mask
+        while self.__tail - self.__head >= self.__min_size:
+            head = self.__head
+            size = buffer[(head + 3) & mask]
+            if (buffer[head & mask] != self.__header) or (buffer[(head + 2) & mask] != self.__family) \
+                    or (size < self.__min_size):
+                self.__head += 1
+                self.discarded += 1
+                continue
+
+            if self.__tail - head < size:
+                if not flush:
+                    return None
+                self.__head += 1
+                self.discarded += 1
+                continue
+
+            frame = self.__copy(head, size)
+            if _crc32_mpeg2(memoryview(frame)[:-4]) != int.from_bytes(frame[-4:], 'little'):
+                self.__head += 1
+                self.discarded += 1
+                self.crc_errors += 1
+                continue
+
+            self.__head += size
+            return frame
+
+        if flush:
+            self.clear()
+        return None
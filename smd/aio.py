@@ -0,0 +1,341 @@
+from smd._internals import (Index, OperationMode,
+                            MotorConstants, _FrameReceiver)
+from smd.red import Red
+from smd.transport import Transport, SerialTransport
+import asyncio
+import time
+
+
+class AsyncMaster():
+    """ asyncio flavour of the Master class. Packages are built with the
+    same Red codec, replies are received by a reader registered on the
+    event loop for the serial port file descriptor, and transactions of
+    concurrent tasks are serialized on the bus. Requires an event loop
+    which supports add_reader (not the Windows proactor loop).
+    """
+    _BROADCAST_ID = 0xFF
+    _TURNAROUND_TIME = 0.001
+
+    def __init__(self, portname, baudrate=115200, reply_timeout=0.1) -> None:
+        """
+        Args:
+            portname (str | Transport): Serial port name, opened with a SerialTransport,
+                or an already opened transport which has a file descriptor.
+            baudrate (int, optional): Baudrate of the bus. Defaults to 115200.
+            reply_timeout (float, optional): Minimum time to wait for a reply in seconds,
+                see Master.set_reply_timeout. Defaults to 0.1.
+        """
+        if baudrate > 12500000 or baudrate < 3053:
+            raise ValueError('Baudrate must be between 3.053 KBits/s and 12.5 MBits/s.')
+        self.set_reply_timeout(reply_timeout)
+
+        self.__driver_list = [Red(255)] * 256
+        self.__baudrate = baudrate
+        self.__post_sleep = (10 / self.__baudrate) * 12
+        if isinstance(portname, Transport):
+            self.__ph = portname
+        else:
+            self.__ph = SerialTransport(portname, self.__baudrate)
+        self.__receiver = _FrameReceiver(Red._HEADER, Red._PRODUCT_TYPE, Red._PACKAGE_ESSENTIAL_SIZE + 4)
+        self.__loop = None
+        self.__lock = None
+        self.__pending = None
+        self.__next_write = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Remove the reader from the event loop and close the serial port. """
+        if self.__loop is not None:
+            self.__loop.remove_reader(self.__ph.fileno())
+            self.__loop = None
+        self.__ph.close()
+
+    def set_reply_timeout(self, timeout: float):
+        """ Set the minimum time to wait for a reply, see Master.set_reply_timeout.
+
+        Raises:
+            ValueError: Timeout is negative
+        """
+        if timeout < 0:
+            raise ValueError("Reply timeout must not be negative!")
+        self.__reply_timeout = timeout
+
+    def get_reply_timeout(self) -> float:
+        return self.__reply_timeout
+
+    def attach(self, driver: Red):
+        """ Attach a SMD driver to the master to define access to it.
+
+        Args:
+            driver (Red): Driver to be attached
+        """
+        self.__driver_list[driver.vars[Index.DeviceID].value()] = driver
+
+    def detach(self, id: int):
+        """ Detach the SMD driver with given ID from master driver list.
+
+        Args:
+            id (int): The device ID of the driver to be detached.
+
+        Raises:
+            ValueError: Device ID is not valid
+        """
+        if (id < 0) or (id > 255):
+            raise ValueError("{} is not a valid ID!".format(id))
+
+        self.__driver_list[id] = Red(255)
+
+    def __start(self):
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            if self.__loop is not None:
+                self.__loop.remove_reader(self.__ph.fileno())
+            self.__ph.reset_input_buffer()
+            loop.add_reader(self.__ph.fileno(), self.__on_readable)
+            self.__loop = loop
+            self.__lock = asyncio.Lock()
+
+    def __on_readable(self):
+        self.__receiver.commit(self.__ph.readinto(self.__receiver.writable(4096), 0))
+
+        frame = self.__receiver.next_frame()
+        while frame is not None:
+            id = frame[Index.DeviceID]
+            if (self.__pending is not None) and (id in self.__pending[0]) and (id not in self.__pending[1]):
+                self.__pending[1][id] = frame
+                if (len(self.__pending[1]) == len(self.__pending[0])) and not self.__pending[2].done():
+                    self.__pending[2].set_result(None)
+            else:
+                self.__receiver.stale += 1
+            frame = self.__receiver.next_frame()
+
+    async def __transaction(self, data: bytes, ids=(), size=0) -> dict:
+        """ Write a package and wait for the replies of the given IDs
+        without blocking the event loop.
+
+        Args:
+            data (bytes): Package to write
+            ids (tuple, optional): Device IDs expected to reply. Defaults to ().
+            size (int, optional): Total size of the expected replies in bytes. Defaults to 0.
+
+        Returns:
+            dict: {id: package} of the replies which passed the CRC check
+        """
+        self.__start()
+        async with self.__lock:
+            delay = self.__next_write - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            while self.__receiver.next_frame(flush=True) is not None:
+                self.__receiver.stale += 1
+
+            self.__ph.write(data)
+            self.__next_write = time.perf_counter() + len(data) * 10 / self.__baudrate + self.__post_sleep
+            if len(ids) == 0:
+                return dict()
+
+            self.__pending = (set(ids), dict(), self.__loop.create_future())
+            try:
+                timeout = max((len(data) + size) * 10 / self.__baudrate + self.__class__._TURNAROUND_TIME,
+                              self.__reply_timeout)
+                await asyncio.wait_for(self.__pending[2], timeout)
+                self.__next_write = time.perf_counter()
+            except asyncio.TimeoutError:
+                pass
+            replies = self.__pending[1]
+            self.__pending = None
+            return replies
+
+    def __check_id(self, id: int, read=False):
+        if (id < 0) or (id > (254 if read else 255)):
+            raise ValueError("{} is not a valid ID!".format(id))
+
+        if (id != self.__driver_list[id].vars[Index.DeviceID].value()):
+            raise ValueError("{} is not an attached ID!".format(id))
+
+    async def set_variables(self, id: int, idx_val_pairs=[], ack=False):
+        """ Set variables on the driver with given ID
+        with a list containing [Index, value] sublists.
+
+        Args:
+            id (int):  The device ID of the driver
+            idx_val_pairs (list, optional): List containing Index, value pairs. Defaults to [].
+            ack (bool, optional): Get acknowledge from the driver. Defaults to False.
+
+        Raises:
+            ValueError: Device ID is not valid
+            IndexError: The given list is empty
+
+        Returns:
+            list | None: Return the list of written values if ack is True, otherwise None.
+        """
+        self.__check_id(id)
+        if len(idx_val_pairs) == 0:
+            raise IndexError("Given id, value pair list is empty!")
+
+        driver = self.__driver_list[id]
+        index_list = [pair[0] for pair in idx_val_pairs]
+        data = driver.set_variables(index_list, [pair[1] for pair in idx_val_pairs], ack)
+        replies = await self.__transaction(data, (id,) if ack else (), driver.get_ack_size())
+        if id in replies:
+            driver.parse_reply(replies[id], index_list)
+            return [driver.vars[index].value() for index in index_list]
+        return None
+
+    async def get_variables(self, id: int, index_list: list):
+        """ Get variables from the driver with respect to given list
+
+        Args:
+            id (int): The device ID of the driver
+            index_list (list): A list containing the Indexes to read
+
+        Raises:
+            ValueError: Device ID is not valid
+            IndexError: The given list is empty
+
+        Returns:
+            list | None: Return the list of read values if any, otherwise None.
+        """
+        self.__check_id(id, read=True)
+        if len(index_list) == 0:
+            raise IndexError("Given index list is empty!")
+
+        driver = self.__driver_list[id]
+        data = driver.get_variables(index_list)
+        replies = await self.__transaction(data, (id,), driver.get_ack_size())
+        if id in replies:
+            driver.parse_reply(replies[id], index_list)
+            return [driver.vars[index].value() for index in index_list]
+        return None
+
+    async def ping(self, id: int) -> bool:
+        """ Ping the driver with given ID.
+
+        Args:
+            id (int): The device ID of the driver.
+
+        Returns:
+            bool: Return True if device replies otherwise False.
+        """
+        replies = await self.__transaction(Red._ping_frame(id), (id,), Red._PACKAGE_ESSENTIAL_SIZE + 4)
+        return id in replies
+
+    async def scan(self, ids=None) -> list:
+        """ Scan the serial port and attach the drivers which reply.
+
+        Args:
+            ids (iterable, optional): IDs to probe. Defaults to all IDs in range [0, 254].
+
+        Returns:
+            list: Connected drivers.
+        """
+        connected = []
+        for id in (range(255) if ids is None else ids):
+            if await self.ping(id):
+                connected.append(id)
+                if self.__driver_list[id].vars[Index.DeviceID].value() != id:
+                    self.attach(Red(id))
+        return connected
+
+    async def enable_torque(self, id: int, en: bool):
+        """ Enable power to the motor of the driver.
+
+        Args:
+            id (int): The device ID of the driver
+            en (bool): Enable. True enables the torque.
+        """
+        await self.set_variables(id, [[Index.TorqueEnable, en]])
+
+    async def set_operation_mode(self, id: int, mode: OperationMode):
+        """ Set the operation mode of the driver.
+
+        Args:
+            id (int): The device ID of the driver.
+            mode (OperationMode): One of the PWM, Position, Velocity, Torque modes.
+        """
+        await self.set_variables(id, [[Index.OperationMode, mode]])
+
+    async def set_position(self, id: int, sp: int):
+        """ Set the desired setpoint for the position control in terms of encoder ticks.
+
+        Args:
+            id (int): The device ID of the driver.
+            sp (int | float): Position control setpoint.
+        """
+        await self.set_variables(id, [[Index.PositionControlMode, 0], [Index.SetPosition, sp]])
+
+    async def get_position(self, id: int):
+        """ Get the current position of the motor from the driver in terms of encoder ticks.
+
+        Args:
+            id (int): The device ID of the driver.
+
+        Returns:
+            float | None: Returns the current position, otherwise None.
+        """
+        ret = await self.get_variables(id, [Index.PresentPosition])
+        return None if ret is None else ret[0]
+
+    async def set_velocity(self, id: int, sp: float, accel=0):
+        """ Set the desired setpoint for the velocity control in terms of RPM.
+
+        Args:
+            id (int): The device ID of the driver.
+            sp (int | float): Velocity control setpoint.
+            accel (float): Acceleration for the velocity control in terms of (RPM/seconds).
+            If accel is not given, the previously set acceleration is used.
+        """
+        if accel == MotorConstants.MAX_ACCEL:
+            await self.set_variables(id, [[Index.SetVelocityAcceleration, 0], [Index.SetVelocity, sp]])
+        elif accel == 0:
+            await self.set_variables(id, [[Index.SetVelocity, sp]])
+        else:
+            await self.set_variables(id, [[Index.SetVelocityAcceleration, accel], [Index.SetVelocity, sp]])
+
+    async def get_velocity(self, id: int):
+        """ Get the current velocity of the motor output shaft from the driver in terms of RPM.
+
+        Args:
+            id (int): The device ID of the driver.
+
+        Returns:
+            float | None: Returns the current velocity, otherwise None.
+        """
+        ret = await self.get_variables(id, [Index.PresentVelocity])
+        return None if ret is None else ret[0]
+
+    async def set_torque(self, id: int, sp: float):
+        """ Set the desired setpoint for the torque control in terms of milliamps (mA).
+
+        Args:
+            id (int): The device ID of the driver.
+            sp (int | float): Torque control setpoint.
+        """
+        await self.set_variables(id, [[Index.SetTorque, sp]])
+
+    async def get_torque(self, id: int):
+        """ Get the current drawn from the motor from the driver in terms of milliamps (mA).
+
+        Args:
+            id (int): The device ID of the driver.
+
+        Returns:
+            float | None: Returns the current, otherwise None.
+        """
+        ret = await self.get_variables(id, [Index.MotorCurrent])
+        return None if ret is None else ret[0]
+
+    async def set_duty_cycle(self, id: int, pct: float):
+        """ Set the duty cycle to the motor for PWM control mode in terms of percentage.
+
+        Args:
+            id (int): The device ID of the driver.
+            pct (int | float): Duty cycle percentage.
+        """
+        await self.set_variables(id, [[Index.SetDutyCycle, pct]])
@@ -0,0 +1,247 @@
+from smd.instrumentation import LatencyHistogram
+from concurrent.futures import Future
+import heapq
+import inspect
+import itertools
+import threading
+import time
+
+
+class Priority():
+    """ Priorities of bus transactions, lower values are served first. """
+    CONTROL = 0
+    TELEMETRY = 1
+    CONFIG = 2
+
+
+_PRIORITY_NAMES = {Priority.CONTROL: 'control', Priority.TELEMETRY: 'telemetry', Priority.CONFIG: 'config'}
+
+# Methods of the master which carry setpoints
+_CONTROL_METHODS = frozenset([
+    'set_variables', 'set_variables_sync', 'set_variables_sync_multi', 'set_variables_bulk',
+    'enable_torque', 'set_position', 'set_velocity', 'set_torque', 'set_duty_cycle', 'goTo',
+    'goTo_ConstantSpeed', 'set_buzzer', 'set_servo', 'set_rgb', 'set_user_indicator',
+])
+
+# Methods of the master which poll the position until the motor arrives when blocking
+_MOTION_METHODS = frozenset(['goTo', 'goTo_ConstantSpeed'])
+
+# Methods of the master which read measurements
+_TELEMETRY_METHODS = frozenset([
+    'get_variables', 'get_variables_bulk', 'get_variables_pipelined', 'get_position', 'get_velocity',
+    'get_torque', 'get_analog_port', 'get_button', 'get_light', 'get_joystick', 'get_distance',
+    'get_qtr', 'get_potentiometer', 'get_imu', 'ping',
+])
+
+
+def method_priority(name: str) -> int:
+    """ Default priority of a method of the master: setpoints are control
+    traffic, measurements are telemetry and everything else is config.
+    """
+    if name in _CONTROL_METHODS:
+        return Priority.CONTROL
+    if name in _TELEMETRY_METHODS:
+        return Priority.TELEMETRY
+    return Priority.CONFIG
+
+
+class BusArbiter():
+    """ Shares one master among many threads. A single I/O thread calls
+    the methods of the master, taking the queued calls in priority order
+    and in submission order within a priority. A transaction on the wire
+    is never interrupted, so a control setpoint waits for at most the
+    transaction in progress, then goes ahead of every queued telemetry
+    and config call.
+
+    Every call may have a deadline, by default the one of its priority.
+    A call which could not start before its deadline is not sent and its
+    future raises TimeoutError, so late setpoints and stale telemetry do
+    not hold the bus.
+
+    Any method of the master can be called on the arbiter, which blocks
+    until the I/O thread has run it. A blocking goTo called on the arbiter
+    starts the motion on the I/O thread and waits for the motor on the
+    calling thread, with telemetry priority reads of its position:
+
+        arbiter = BusArbiter(master)
+        arbiter.set_velocity(1, 100)
+        future = arbiter.submit('get_position', 1)
+    """
+
+    def __init__(self, master, deadlines=None) -> None:
+        """
+        Args:
+            master (Master): The master which owns the port
+            deadlines (dict, optional): {Priority: seconds} default deadline of each priority,
+                None for no deadline. Defaults to 20 ms for control and none for the others.
+        """
+        self.master = master
+        self.__deadlines = {Priority.CONTROL: 0.02, Priority.TELEMETRY: None, Priority.CONFIG: None}
+        if deadlines is not None:
+            self.__deadlines.update(deadlines)
+        self.__queue = []
+        self.__order = itertools.count()
+        self.__ready = threading.Condition()
+        self.__closed = False
+        self.reset_stats()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __getattr__(self, name):
+        method = getattr(self.master, name)
+        if not callable(method) or name.startswith('_'):
+            return method
+
+        if name in _MOTION_METHODS:
+            def call(*args, **kwargs):
+                return self.__move(name, args, kwargs)
+        else:
+            def call(*args, **kwargs):
+                return self.submit(name, *args, **kwargs).result()
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    def submit(self, method: str, *args, priority=None, deadline=None, **kwargs) -> Future:
+        """ Queue a call of a method of the master.
+
+        Args:
+            method (str): Name of the method of the master
+            *args, **kwargs: Arguments of the method
+            priority (int, optional): Priority of the call. Defaults to the priority of the method.
+            deadline (float, optional): Seconds from now the call must start within. Defaults to
+                the deadline of the priority.
+
+        Raises:
+            RuntimeError: The arbiter is closed
+            AttributeError: The master has no such method
+            ValueError: Priority is not valid, or a motion method is blocking
+
+        Returns:
+            Future: Resolves to the return value of the method, or raises its exception.
+                    Raises TimeoutError if the call could not start before its deadline.
+        """
+        function = getattr(self.master, method)
+        if (method in _MOTION_METHODS) and self.__bind(function, args, kwargs).arguments['blocking']:
+            raise ValueError("Blocking {} would hold the I/O thread until the motor arrives, "
+                             "call it on the arbiter instead!".format(method))
+        if priority is None:
+            priority = method_priority(method)
+        elif priority not in _PRIORITY_NAMES:
+            raise ValueError("{} is not a valid priority!".format(priority))
+        if deadline is None:
+            deadline = self.__deadlines.get(priority)
+        now = time.perf_counter()
+        future = Future()
+        with self.__ready:
+            if self.__closed:
+                raise RuntimeError("Bus arbiter is closed!")
+            heapq.heappush(self.__queue, (priority, next(self.__order), now,
+                                          None if deadline is None else now + deadline,
+                                          function, args, kwargs, future))
+            self.__stats[priority]['submitted'] += 1
+            self.__ready.notify()
+        return future
+
+    def call(self, method: str, *args, priority=None, deadline=None, **kwargs):
+        """ Call a method of the master through the queue and wait for its result.
+        Arguments are the ones of submit.
+        """
+        return self.submit(method, *args, priority=priority, deadline=deadline, **kwargs).result()
+
+    @staticmethod
+    def __bind(function, args, kwargs) -> inspect.BoundArguments:
+        arguments = inspect.signature(function).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        return arguments
+
+    def __move(self, method: str, args, kwargs):
+        """ Start a motion with a non-blocking call on the I/O thread, then
+        wait for the motor on the calling thread if the call is blocking.
+        """
+        arguments = self.__bind(getattr(self.master, method), args, kwargs)
+        blocking = arguments.arguments['blocking']
+        arguments.arguments['blocking'] = False
+        self.submit(method, *arguments.args, **arguments.kwargs).result()
+
+        id, target = arguments.arguments['id'], arguments.arguments['target_position']
+        while blocking:
+            if abs(target - self.call('get_position', id)) <= arguments.arguments['encoder_tick_close_counter']:
+                break
+
+    def pending(self) -> int:
+        """ Number of queued calls. """
+        with self.__ready:
+            return len(self.__queue)
+
+    def __run(self):
+        while True:
+            with self.__ready:
+                while not self.__queue and not self.__closed:
+                    self.__ready.wait()
+                if not self.__queue:
+                    return
+                priority, _, queued, deadline, function, args, kwargs, future = heapq.heappop(self.__queue)
+
+            stats = self.__stats[priority]
+            if not future.set_running_or_notify_cancel():
+                stats['cancelled'] += 1
+                continue
+            start = time.perf_counter()
+            stats['wait'].record(start - queued)
+            if (deadline is not None) and (start > deadline):
+                stats['expired'] += 1
+                future.set_exception(TimeoutError("Call missed its deadline by {:.6f} s!".format(start - deadline)))
+                continue
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                stats['failed'] += 1
+                future.set_exception(e)
+            else:
+                stats['completed'] += 1
+                future.set_result(result)
+
+    def close(self, wait=True):
+        """ Stop the I/O thread. Queued calls are still run unless wait is False,
+        in which case they are cancelled.
+
+        Args:
+            wait (bool, optional): Run the queued calls and wait for the thread. Defaults to True.
+        """
+        with self.__ready:
+            self.__closed = True
+            if not wait:
+                for item in self.__queue:
+                    item[-1].cancel()
+                    self.__stats[item[0]]['cancelled'] += 1
+                self.__queue.clear()
+            self.__ready.notify()
+        if wait:
+            self.__thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_stats(self) -> dict:
+        """ Get the counters and queue waiting times of each priority.
+
+        Returns:
+            dict: {priority name: {submitted, completed, failed, expired, cancelled,
+                   wait (histogram summary of the time spent queued, in microseconds)}}
+        """
+        result = dict()
+        for priority, stats in self.__stats.items():
+            result[_PRIORITY_NAMES.get(priority, priority)] = dict(
+                {key: value for key, value in stats.items() if key != 'wait'},
+                wait={key: value for key, value in stats['wait'].snapshot().items() if key != 'buckets'})
+        return result
+
+    def reset_stats(self):
+        """ Reset the counters and queue waiting times. """
+        self.__stats = {priority: dict(submitted=0, completed=0, failed=0, expired=0, cancelled=0,
+                                       wait=LatencyHistogram())
+                        for priority in _PRIORITY_NAMES}
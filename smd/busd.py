@@ -0,0 +1,450 @@
+""" Bus server which shares serial ports among processes.
+
+smd-busd owns one or more ports, each with its own Master, and serves
+clients over a local Unix domain socket. Reads and writes of all clients
+which arrive while the bus is busy are merged into BULK_READ and
+BULK_WRITE packages, so N clients cost about one transaction per cycle
+instead of N. Each port may also be polled at a fixed rate, and the
+polled values are published in a telemetry segment in shared memory
+(see smd.telemetry) which clients read without any system call.
+
+Every message is length prefixed:
+
+    request:  length (uint32), request ID (uint32), operation (uint8), payload
+    response: length (uint32), request ID (uint32), status (uint8), payload
+
+Values of registers are packed with the formats of the register table of
+the Red class. Operations other than reads and writes carry JSON.
+
+Usage:
+    smd-busd --port /dev/ttyUSB0 [--port /dev/ttyUSB1] [--socket /tmp/smd-busd.sock] [--mode 600] [--rate 100]
+"""
+from smd._internals import Index
+from smd.red import Red, Master
+from smd.telemetry import TelemetryReader, TelemetryWriter
+from concurrent.futures import Future
+import argparse
+import errno
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+
+DEFAULT_SOCKET = '/tmp/smd-busd.sock'
+DEFAULT_MODE = 0o600
+
+OP_PORTS = 0
+OP_READ = 1
+OP_WRITE = 2
+OP_CALL = 3
+
+STATUS_OK = 0
+STATUS_NO_REPLY = 1
+STATUS_ERROR = 2
+
+_LENGTH = struct.Struct('<I')
+_MESSAGE = struct.Struct('<IB')
+_TARGET = struct.Struct('<BBB')
+
+_TELEMETRY = (Index.PresentPosition, Index.PresentVelocity, Index.MotorCurrent)
+
+
+def _pack_values(index_list, values) -> bytes:
+    layout = Red._REGISTERS
+    data = bytearray()
+    for index, value in zip(index_list, values):
+        data += layout.structs[index].pack(*(value if isinstance(value, list) else [value]))
+    return bytes(data)
+
+
+def _unpack_values(index_list, data) -> list:
+    layout = Red._REGISTERS
+    values = []
+    offset = 0
+    for index in index_list:
+        value = layout.structs[index].unpack_from(data, offset)
+        values.append(value[0] if len(value) == 1 else list(value))
+        offset += layout.sizes[index]
+    return values
+
+
+def _pack_pairs(idx_val_pairs) -> bytes:
+    layout = Red._REGISTERS
+    data = bytearray()
+    for index, value in idx_val_pairs:
+        data.append(int(index))
+        data += layout.structs[index].pack(*(value if isinstance(value, list) else [value]))
+    return bytes(data)
+
+
+def _unpack_pairs(data, count: int) -> list:
+    layout = Red._REGISTERS
+    pairs = []
+    offset = 0
+    for _ in range(count):
+        index = data[offset]
+        value = layout.structs[index].unpack_from(data, offset + 1)
+        pairs.append([Index(index), value[0] if len(value) == 1 else list(value)])
+        offset += 1 + layout.sizes[index]
+    return pairs
+
+
+def _receive(sock, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed!")
+        data += chunk
+    return bytes(data)
+
+
+def _receive_message(sock) -> tuple:
+    """ Return (request ID, operation or status, payload). """
+    data = _receive(sock, _LENGTH.unpack(_receive(sock, _LENGTH.size))[0])
+    number, code = _MESSAGE.unpack_from(data)
+    return number, code, data[_MESSAGE.size:]
+
+
+def _send_message(sock, number: int, code: int, payload: bytes):
+    sock.sendall(_LENGTH.pack(_MESSAGE.size + len(payload)) + _MESSAGE.pack(number, code) + payload)
+
+
+class _Port():
+    """ Master of a port and the thread which serves its queued requests
+    in batches. Each cycle writes all queued writes with one BULK_WRITE,
+    then reads all queued reads, and the telemetry when it is due, with
+    one BULK_READ, then runs the other calls one by one.
+    """
+
+    def __init__(self, name: str, master: Master, ids: list, rate_hz=0.0, telemetry_name=None) -> None:
+        self.name = name
+        self.master = master
+        self.ids = list(ids)
+        self.period = (1 / rate_hz) if rate_hz > 0 else None
+        self.telemetry = TelemetryWriter(self.ids, telemetry_name) if (self.period and self.ids) else None
+        self.stats = dict(cycles=0, requests=0, reads=0, writes=0, calls=0, transactions=0)
+        self.__queue = queue.Queue()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def submit(self, operation: int, *args) -> Future:
+        future = Future()
+        self.__queue.put((operation, args, future))
+        return future
+
+    def __run(self):
+        next_poll = time.perf_counter()
+        while not self.__stop.is_set():
+            timeout = None if self.period is None else max(next_poll - time.perf_counter(), 0)
+            try:
+                batch = [self.__queue.get(timeout=timeout if timeout is not None else 0.1)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            poll = (self.telemetry is not None) and (time.perf_counter() >= next_poll)
+            if poll:
+                next_poll = max(next_poll + self.period, time.perf_counter())
+            if batch or poll:
+                self.__serve(batch, poll)
+
+    def __serve(self, batch: list, poll: bool):
+        self.stats['cycles'] += 1
+        self.stats['requests'] += len(batch)
+        writes = [request for request in batch if request[0] == OP_WRITE]
+        reads = [request for request in batch if request[0] == OP_READ]
+        calls = [request for request in batch if request[0] == OP_CALL]
+
+        if writes:
+            # The latest value of every register wins, in the order of the requests
+            blocks = dict()
+            for _, (id, pairs), _ in writes:
+                block = blocks.setdefault(id, dict())
+                for index, value in pairs:
+                    block[index] = value
+            self.__resolve(writes, lambda: self.master.set_variables_bulk(
+                {id: [[index, value] for index, value in block.items()] for id, block in blocks.items()}),
+                lambda request, result: None)
+            self.stats['writes'] += len(writes)
+            self.stats['transactions'] += 1
+
+        if reads or poll:
+            blocks = dict()
+            for _, (id, index_list), _ in reads:
+                block = blocks.setdefault(id, [])
+                block += [index for index in index_list if index not in block]
+            if poll:
+                for id in self.ids:
+                    block = blocks.setdefault(id, [])
+                    block += [index for index in _TELEMETRY if index not in block]
+
+            def publish():
+                values = self.master.get_variables_bulk(blocks)
+                if poll:
+                    now = time.time()
+                    for id in self.ids:
+                        if values.get(id) is not None:
+                            read = dict(zip(blocks[id], values[id]))
+                            self.telemetry.write(id, *[read[index] for index in _TELEMETRY], timestamp=now)
+                return values
+
+            def select(request, values):
+                id, index_list = request[1]
+                if values.get(id) is None:
+                    return None
+                read = dict(zip(blocks[id], values[id]))
+                return [read[index] for index in index_list]
+
+            self.__resolve(reads, publish, select)
+            self.stats['reads'] += len(reads)
+            self.stats['transactions'] += 1
+
+        for request in calls:
+            method, args = request[1]
+            self.__resolve([request], lambda: getattr(self.master, method)(*args), lambda request, result: result)
+            self.stats['calls'] += 1
+
+    @staticmethod
+    def __resolve(requests: list, transaction, result):
+        try:
+            value = transaction()
+        except Exception as e:
+            for request in requests:
+                request[2].set_exception(e)
+            return
+        for request in requests:
+            request[2].set_result(result(request, value))
+
+    def close(self):
+        self.__stop.set()
+        self.__thread.join()
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """ Serves the requests of one client, one at a time. """
+
+    def handle(self):
+        while True:
+            try:
+                number, operation, payload = _receive_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                status, response = self.server.dispatch(operation, payload)
+            except Exception as e:
+                status, response = STATUS_ERROR, "{}: {}".format(type(e).__name__, e).encode()
+            try:
+                _send_message(self.request, number, status, response)
+            except OSError:
+                return
+
+
+def _remove_stale_socket(path: str):
+    """ Remove the socket of a server which did not close it, refuse to
+    remove a socket which is still served or a file which is not a socket.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, "{} exists and is not a socket!".format(path))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise OSError(errno.EADDRINUSE, "{} is served by another bus server!".format(path))
+    finally:
+        probe.close()
+
+
+class BusServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Serve the masters of one or more ports over a Unix domain socket. """
+    daemon_threads = True
+
+    def __init__(self, ports: list, path=DEFAULT_SOCKET, rate_hz=0.0, mode=DEFAULT_MODE) -> None:
+        """
+        Args:
+            ports (list): (name, master, [id, ...]) of each served port, the drivers must be attached
+            path (str, optional): Path of the socket. Defaults to DEFAULT_SOCKET.
+            rate_hz (float, optional): Telemetry polling rate of every port, 0 for no polling. Defaults to 0.0.
+            mode (int, optional): Permissions of the socket, e.g. 0o660 to serve the group. Defaults to 0o600.
+
+        Raises:
+            OSError: Another server answers on the path, or the path is not a socket
+        """
+        _remove_stale_socket(path)
+        self.path = path
+        self.mode = mode
+        self.ports = []
+        super().__init__(path, _Handler)
+        self.ports = [_Port(name, master, ids, rate_hz) for name, master, ids in ports]
+
+    def server_bind(self):
+        super().server_bind()
+        # Clients may call any method of the masters, connecting is restricted before listening
+        os.chmod(self.path, self.mode)
+
+    def dispatch(self, operation: int, payload: bytes) -> tuple:
+        """ Serve a request, returns (status, response payload). """
+        if operation == OP_PORTS:
+            return STATUS_OK, json.dumps([{'name': port.name, 'ids': port.ids, 'stats': port.stats,
+                                           'telemetry': None if port.telemetry is None else port.telemetry.name}
+                                          for port in self.ports]).encode()
+
+        if operation == OP_CALL:
+            request = json.loads(payload[1:])
+            if request['method'].startswith('_'):
+                raise AttributeError("{} is not a method of the master!".format(request['method']))
+            result = self.ports[payload[0]].submit(OP_CALL, request['method'], request['args']).result()
+            return STATUS_OK, json.dumps(result).encode()
+
+        number, id, count = _TARGET.unpack_from(payload)
+        port = self.ports[number]
+        if id not in port.ids:
+            raise ValueError("{} is not an attached ID!".format(id))
+        if operation == OP_READ:
+            index_list = [Index(index) for index in payload[_TARGET.size:_TARGET.size + count]]
+            values = port.submit(OP_READ, id, index_list).result()
+            if values is None:
+                return STATUS_NO_REPLY, b''
+            return STATUS_OK, _pack_values(index_list, values)
+        if operation == OP_WRITE:
+            port.submit(OP_WRITE, id, _unpack_pairs(payload[_TARGET.size:], count)).result()
+            return STATUS_OK, b''
+        raise ValueError("{} is not a valid operation!".format(operation))
+
+    def server_close(self):
+        super().server_close()
+        for port in self.ports:
+            port.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class BusClient():
+    """ Client of smd-busd. Methods may be called from several threads,
+    their requests are sent one at a time.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET) -> None:
+        """
+        Args:
+            path (str, optional): Path of the socket of the server. Defaults to DEFAULT_SOCKET.
+        """
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.connect(path)
+        self.__lock = threading.Lock()
+        self.__number = 0
+        self.__telemetry = dict()
+
+    def __request(self, operation: int, payload: bytes) -> tuple:
+        with self.__lock:
+            self.__number = (self.__number + 1) & 0xFFFFFFFF
+            _send_message(self.__socket, self.__number, operation, payload)
+            number, status, response = _receive_message(self.__socket)
+        if status == STATUS_ERROR:
+            raise RuntimeError(response.decode())
+        return status, response
+
+    def ports(self) -> list:
+        """ Return the served ports as a list of {name, ids, stats, telemetry}. """
+        return json.loads(self.__request(OP_PORTS, b'')[1])
+
+    def get_variables(self, port: int, id: int, index_list: list):
+        """ Same as Master.get_variables on the given port.
+
+        Returns:
+            list | None: Read values, None if the driver did not reply
+        """
+        status, response = self.__request(OP_READ, _TARGET.pack(port, id, len(index_list))
+                                          + bytes([int(index) for index in index_list]))
+        if status == STATUS_NO_REPLY:
+            return None
+        return _unpack_values(index_list, response)
+
+    def set_variables(self, port: int, id: int, idx_val_pairs: list):
+        """ Same as Master.set_variables on the given port, without acknowledge. """
+        self.__request(OP_WRITE, _TARGET.pack(port, id, len(idx_val_pairs)) + _pack_pairs(idx_val_pairs))
+
+    def call(self, port: int, method: str, *args):
+        """ Call any other method of the master of the given port. Arguments
+        and the return value must be JSON serializable.
+        """
+        return json.loads(self.__request(OP_CALL, bytes([port]) + json.dumps({'method': method, 'args': args}).encode())[1])
+
+    def telemetry(self, port: int) -> TelemetryReader:
+        """ Return the reader of the telemetry segment of the given port.
+
+        Raises:
+            ValueError: The port is not polled
+        """
+        if port not in self.__telemetry:
+            name = self.ports()[port]['telemetry']
+            if name is None:
+                raise ValueError("Port {} is not polled!".format(port))
+            self.__telemetry[port] = TelemetryReader(name)
+        return self.__telemetry[port]
+
+    def close(self):
+        for reader in self.__telemetry.values():
+            reader.close()
+        self.__telemetry.clear()
+        self.__socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='smd-busd', description='Share SMD buses among processes.')
+    parser.add_argument('--port', action='append', required=True, help='serial port to serve, may be repeated')
+    parser.add_argument('--baudrate', type=int, default=115200, help='baudrate of the ports')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='path of the Unix domain socket')
+    parser.add_argument('--mode', type=lambda mode: int(mode, 8), default=DEFAULT_MODE,
+                        help='octal permissions of the socket, e.g. 660 to serve the group')
+    parser.add_argument('--rate', type=float, default=100.0, help='telemetry polling rate in Hz, 0 to disable')
+    parser.add_argument('--ids', type=int, nargs='*', help='device IDs to attach instead of scanning')
+    args = parser.parse_args(argv)
+
+    ports = []
+    for portname in args.port:
+        master = Master(portname, args.baudrate)
+        ids = args.ids if args.ids is not None else master.scan()
+        for id in ids:
+            master.attach(Red(id))
+        ports.append((portname, master, ids))
+
+    server = BusServer(ports, args.socket, args.rate, args.mode)
+    for port in server.ports:
+        print("{}: IDs {}, telemetry {}".format(port.name, port.ids, port.telemetry and port.telemetry.name))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,366 @@
+""" Capture of bus traffic into a compact binary log, and its analyzer.
+
+A capture file starts with a header holding the baudrate and the start
+time, followed by one record per written package or read chunk:
+
+    timestamp (uint64, ns of time.perf_counter_ns)
+    direction (uint8, 0 for TX, 1 for RX)
+    reserved  (uint8)
+    length    (uint16)
+    data      (length bytes)
+
+All integers are little endian. Records are only appended, so a capture
+can be read with mmap while it is being written, and a record cut short
+by a crash is ignored. Received bytes are stored as read from the port,
+corrupt packages included, and are split into packages by the reader.
+
+Usage:
+    smd-capture capture.bin [--decode] [--json] [--gap 0.005] [--burst 0.1]
+"""
+from smd._internals import Index, Commands, _FrameReceiver
+from smd.instrumentation import LatencyHistogram
+from smd.red import Red
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+TX = 0
+RX = 1
+
+_MAGIC = b'SMDCAP\r\n'
+_VERSION = 1
+_HEADER = struct.Struct('<8sHHIqq')
+_RECORD = struct.Struct('<QBBH')
+_CRC_STRUCT = struct.Struct('<I')
+
+
+class CaptureWriter():
+    """ Append records to a capture file. Records are packed into a
+    preallocated buffer, which is written to the file when it is full,
+    on flush and on close, so recording a package makes no system call
+    and allocates nothing.
+    """
+
+    def __init__(self, path: str, baudrate: int, buffer_size=1 << 20) -> None:
+        """
+        Args:
+            path (str): Capture file, created or truncated
+            baudrate (int): Baudrate of the bus
+            buffer_size (int, optional): Bytes buffered before writing to the file. Defaults to 1 MiB.
+        """
+        self.path = path
+        self.records = 0
+        self.__file = open(path, 'wb')
+        self.__buffer = bytearray(max(buffer_size, _RECORD.size + 0xFFFF))
+        self.__view = memoryview(self.__buffer)
+        self.__used = 0
+        self.__file.write(_HEADER.pack(_MAGIC, _VERSION, _HEADER.size, baudrate, time.time_ns(), time.perf_counter_ns()))
+
+    def record(self, direction: int, data, timestamp=None):
+        """ Append a record.
+
+        Args:
+            direction (int): TX or RX
+            data (bytes | memoryview): Written package or read bytes
+            timestamp (int, optional): time.perf_counter_ns() of the record. Defaults to now.
+        """
+        size = len(data)
+        if self.__used + _RECORD.size + size > len(self.__buffer):
+            self.flush()
+        _RECORD.pack_into(self.__buffer, self.__used, time.perf_counter_ns() if timestamp is None else timestamp,
+                          direction, 0, size)
+        start = self.__used + _RECORD.size
+        self.__buffer[start:start + size] = data
+        self.__used = start + size
+        self.records += 1
+
+    def flush(self):
+        """ Write the buffered records to the file. """
+        if self.__used:
+            self.__file.write(self.__view[:self.__used])
+            self.__used = 0
+        self.__file.flush()
+
+    def close(self):
+        """ Flush and close the capture file. """
+        if not self.__file.closed:
+            self.flush()
+            self.__file.close()
+
+
+class CaptureReader():
+    """ Read a capture file through mmap. """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Capture file
+
+        Raises:
+            ValueError: The file is not a capture file
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError("{} is not a capture file!".format(path))
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_size, self.baudrate, self.wall_start, self.start = _HEADER.unpack_from(self.__map)
+        if (magic != _MAGIC) or (version != _VERSION):
+            raise ValueError("{} is not a capture file!".format(path))
+        self.__offset = header_size
+
+    def close(self):
+        self.__map.close()
+
+    def records(self):
+        """ Iterate over the records as (timestamp, direction, data) with data a memoryview. """
+        view = memoryview(self.__map)
+        offset = self.__offset
+        try:
+            while offset + _RECORD.size <= len(view):
+                timestamp, direction, _, size = _RECORD.unpack_from(view, offset)
+                offset += _RECORD.size
+                if offset + size > len(view):
+                    break
+                yield timestamp, direction, view[offset:offset + size]
+                offset += size
+        finally:
+            view.release()
+
+    def frames(self):
+        """ Iterate over the packages as (timestamp, direction, package). Received
+        chunks are split into packages, and a received package gets the
+        timestamp of the chunk which completed it. Corrupt received packages
+        are reported as (timestamp, RX, None).
+        """
+        receiver = _FrameReceiver(Red._HEADER, Red._PRODUCT_TYPE, Red._PACKAGE_ESSENTIAL_SIZE + _CRC_STRUCT.size)
+        for timestamp, direction, data in self.records():
+            if direction == TX:
+                yield timestamp, TX, bytes(data)
+                continue
+            receiver.feed(data)
+            crc_errors = receiver.crc_errors
+            frame = receiver.next_frame()
+            while frame is not None:
+                yield timestamp, RX, bytes(frame)
+                frame = receiver.next_frame()
+            for _ in range(receiver.crc_errors - crc_errors):
+                yield timestamp, RX, None
+
+
+def decode(frame: bytes, reply=False) -> dict:
+    """ Decode a package with the register table of the Red class.
+
+    Args:
+        frame (bytes): Package which has passed the CRC check
+        reply (bool, optional): The package was received from a driver. Defaults to False.
+
+    Returns:
+        dict: id, command and either values {Index name: value}, indexes [Index name] or raw payload hex
+    """
+    layout = Red._REGISTERS
+    command = frame[Index.Command]
+    try:
+        name = Commands(command).name
+    except ValueError:
+        name = hex(command)
+    result = {'id': frame[Index.DeviceID], 'command': name}
+    payload = frame[Red._PACKAGE_ESSENTIAL_SIZE:-_CRC_STRUCT.size]
+    try:
+        if (command in (Commands.WRITE, Commands.WRITE_ACK)) or ((command == Commands.READ) and reply):
+            values = dict()
+            i = 0
+            while i < len(payload):
+                index = payload[i]
+                value = layout.structs[index].unpack_from(payload, i + 1)
+                values[Index(index).name] = value[0] if len(value) == 1 else list(value)
+                i += 1 + layout.sizes[index]
+            result['values'] = values
+        elif command == Commands.READ:
+            result['indexes'] = [Index(index).name for index in payload]
+        elif payload:
+            result['payload'] = bytes(payload).hex()
+    except (IndexError, ValueError, struct.error):
+        result['payload'] = bytes(payload).hex()
+    return result
+
+
+def _expected_ids(frame: bytes) -> list:
+    """ Device IDs which reply to a written package. """
+    command = frame[Index.Command]
+    if command == Commands.BULK_READ:
+        ids = []
+        payload = frame[Red._PACKAGE_ESSENTIAL_SIZE:-_CRC_STRUCT.size]
+        i = 0
+        while i + 1 < len(payload):
+            ids.append(payload[i])
+            i += 2 + payload[i + 1]
+        return ids
+    if (frame[Index.DeviceID] != 0xFF) and ((command in (Commands.PING, Commands.READ)) or (command & Commands.ACK)):
+        return [frame[Index.DeviceID]]
+    return []
+
+
+def _summary(values: list) -> dict:
+    if not values:
+        return None
+    values = sorted(values)
+    return {'count': len(values), 'min': values[0], 'p50': values[len(values) // 2],
+            'p99': values[min(int(len(values) * 0.99), len(values) - 1)], 'max': values[-1]}
+
+
+def analyze(path: str, gap=0.005, burst=0.1) -> dict:
+    """ Analyze a capture file.
+
+    Args:
+        path (str): Capture file
+        gap (float, optional): Idle time in seconds which is reported as a gap. Defaults to 0.005.
+        burst (float, optional): Errors closer than this many seconds form a burst. Defaults to 0.1.
+
+    Returns:
+        dict: duration, packages, bytes, utilization, idle (gap summary in us), gaps (longest gaps),
+              latency {id: histogram summary in us}, errors {kind: n} and bursts
+    """
+    reader = CaptureReader(path)
+    byte_time = 10 / reader.baudrate
+    start = end = None
+    packages = {'tx': 0, 'rx': 0}
+    nbytes = {'tx': 0, 'rx': 0}
+    busy = 0.0
+    idle = []
+    gaps = []
+    latency = dict()
+    errors = {'timeouts': 0, 'crc_errors': 0, 'stale': 0}
+    error_times = []
+    pending = dict()
+    bus_free = None
+
+    def expire(id):
+        # The request is stamped when it was sent, which is where a burst of timeouts starts
+        errors['timeouts'] += 1
+        error_times.append((pending.pop(id), 'timeout'))
+
+    for timestamp, direction, frame in reader.frames():
+        t = (timestamp - reader.start) / 1e9
+        start = t if start is None else start
+        end = t
+        if frame is None:
+            errors['crc_errors'] += 1
+            error_times.append((t, 'crc_error'))
+            continue
+
+        wire = len(frame) * byte_time
+        busy += wire
+        # A package is stamped when it is written or after it has been received
+        begin = t if direction == TX else t - wire
+        if bus_free is not None:
+            if begin - bus_free >= gap:
+                gaps.append((bus_free, begin - bus_free))
+            idle.append(max(begin - bus_free, 0) * 1e6)
+        bus_free = begin + wire if bus_free is None else max(begin + wire, bus_free)
+
+        if direction == TX:
+            packages['tx'] += 1
+            nbytes['tx'] += len(frame)
+            for id in _expected_ids(frame):
+                if id in pending:
+                    expire(id)
+                pending[id] = t
+        else:
+            packages['rx'] += 1
+            nbytes['rx'] += len(frame)
+            id = frame[Index.DeviceID]
+            if id in pending:
+                latency.setdefault(id, LatencyHistogram()).record(t - pending.pop(id))
+            else:
+                errors['stale'] += 1
+    for id in list(pending):
+        expire(id)
+    reader.close()
+
+    bursts = []
+    for t, kind in sorted(error_times):
+        if bursts and (t - bursts[-1]['end'] <= burst):
+            bursts[-1]['end'] = t
+            bursts[-1]['count'] += 1
+            bursts[-1]['kinds'][kind] = bursts[-1]['kinds'].get(kind, 0) + 1
+        else:
+            bursts.append({'start': t, 'end': t, 'count': 1, 'kinds': {kind: 1}})
+
+    duration = (end - start) if start is not None else 0.0
+    return {
+        'baudrate': reader.baudrate,
+        'duration': duration,
+        'packages': packages,
+        'bytes': nbytes,
+        'utilization': min(busy / duration, 1.0) if duration > 0 else None,
+        'idle': _summary(idle),
+        'gaps': [{'start': t, 'length': length} for t, length in sorted(gaps, key=lambda g: -g[1])[:10]],
+        'latency': {id: {key: value for key, value in histogram.snapshot().items() if key != 'buckets'}
+                    for id, histogram in sorted(latency.items())},
+        'errors': errors,
+        'bursts': [b for b in bursts if b['count'] > 1],
+    }
+
+
+def _print_report(report: dict):
+    print("baudrate     {}".format(report['baudrate']))
+    print("duration     {:.3f} s".format(report['duration']))
+    print("packages     {} TX, {} RX".format(report['packages']['tx'], report['packages']['rx']))
+    print("bytes        {} TX, {} RX".format(report['bytes']['tx'], report['bytes']['rx']))
+    if report['utilization'] is not None:
+        print("utilization  {:.1f}%".format(report['utilization'] * 100))
+    if report['idle'] is not None:
+        print("idle [us]    p50 {p50:.0f}, p99 {p99:.0f}, max {max:.0f}".format(**report['idle']))
+    print("errors       {timeouts} timeouts, {crc_errors} CRC errors, {stale} stale replies".format(**report['errors']))
+    print()
+    print("{:<6}{:>10}{:>10}{:>10}{:>10}{:>10}".format('id', 'replies', 'p50 [us]', 'p90 [us]', 'p99 [us]', 'max [us]'))
+    for id, stats in report['latency'].items():
+        print("{:<6}{:>10}{:>10}{:>10}{:>10}{:>10}".format(id, stats['count'], stats['p50'], stats['p90'],
+                                                          stats['p99'], stats['max']))
+    if report['gaps']:
+        print()
+        print("longest gaps")
+        for gap in report['gaps']:
+            print("  {:>12.6f} s  {:>10.3f} ms".format(gap['start'], gap['length'] * 1e3))
+    if report['bursts']:
+        print()
+        print("error bursts")
+        for burst in report['bursts']:
+            print("  {:>12.6f} s - {:.6f} s  {} errors {}".format(burst['start'], burst['end'], burst['count'],
+                                                                  burst['kinds']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='smd-capture', description='Analyze a bus capture of the SMD library.')
+    parser.add_argument('path', help='capture file written by Master.start_capture')
+    parser.add_argument('--decode', action='store_true', help='print every package decoded with the register table')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--gap', type=float, default=0.005, help='idle seconds reported as a gap')
+    parser.add_argument('--burst', type=float, default=0.1, help='seconds between errors of a burst')
+    args = parser.parse_args(argv)
+
+    if args.decode:
+        reader = CaptureReader(args.path)
+        for timestamp, direction, frame in reader.frames():
+            t = (timestamp - reader.start) / 1e9
+            text = 'CRC error' if frame is None else json.dumps(decode(frame, direction == RX))
+            print("{:>12.6f} {} {}".format(t, 'TX' if direction == TX else 'RX', text))
+        reader.close()
+        return 0
+
+    report = analyze(args.path, args.gap, args.burst)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,694 @@
+from smd._internals import Index, Commands, OperationMode, _FrameReceiver, _crc32_mpeg2
+from smd.red import Red
+from smd.transport import MemoryTransport
+import heapq
+import math
+import os
+import struct
+import threading
+import time
+
+try:
+    import tty
+except ImportError:
+    # Only the in-memory bus is available on Windows
+    tty = None
+
+_HEADER_STRUCT = struct.Struct('<BBBBBB')
+_CRC_STRUCT = struct.Struct('<I')
+_BROADCAST_ID = 0xFF
+
+# Address of the first module of each type in the connected module bitfield
+_MODULE_ADDRESSES = {'Button': 1, 'Light': 6, 'Buzzer': 11, 'Joystick': 16, 'Distance': 21,
+                     'QTR': 26, 'Servo': 31, 'Pot': 36, 'RGB': 41, 'IMU': 46}
+_MANUAL_MODULE_INDEXES = {'Button': Index.SetManualButton, 'Light': Index.SetManualLight, 'Buzzer': Index.SetManualBuzzer,
+                          'Joystick': Index.SetManualJoystick, 'Distance': Index.SetManualDistance, 'QTR': Index.SetManualQTR,
+                          'Servo': Index.SetManualServo, 'Pot': Index.SetManualPot, 'RGB': Index.SetManualRGB,
+                          'IMU': Index.SetManualIMU}
+
+
+def _version(version: tuple) -> int:
+    return (version[0] << 16) | (version[1] << 8) | version[2]
+
+
+class VirtualClock():
+    """ Clock of an emulated bus which only moves when advanced. Calling
+    it returns the current time in seconds. On a bus with a virtual clock
+    every package advances the clock by its time on the wire, so a master
+    polling a driver sees the motor move without waiting in real time.
+    """
+
+    def __init__(self, start=0.0) -> None:
+        self.__now = start
+
+    def __call__(self) -> float:
+        return self.__now
+
+    def advance(self, seconds: float):
+        """ Move the clock forward by the given seconds. """
+        self.__now += max(seconds, 0.0)
+
+    sleep = advance
+
+
+class MotorModel():
+    """ Brushed DC motor with an encoder on the output shaft. The speed
+    follows the duty cycle with a first order lag and reaches the rated
+    RPM of the driver at 100% duty. The current is proportional to the
+    duty cycle minus the back EMF, it is the stall current at 100% duty
+    and standstill.
+    """
+
+    def __init__(self, time_constant=0.05, stall_current=5000.0) -> None:
+        """
+        Args:
+            time_constant (float, optional): Mechanical time constant in seconds. Defaults to 0.05.
+            stall_current (float, optional): Current at 100% duty and standstill in mA. Defaults to 5000.0.
+        """
+        self.time_constant = time_constant
+        self.stall_current = stall_current
+        self.reset()
+
+    def reset(self):
+        """ Stop the motor and zero the encoder. """
+        self.position = 0.0
+        self.velocity = 0.0
+        self.current = 0.0
+
+
+class _PID():
+    """ PID loop of the emulated firmware. The output is clamped to the
+    output limit and the integral stops growing while it is clamped.
+    """
+    __slots__ = ['p', 'i', 'd', 'ff', 'deadband', 'limit', 'integral', 'error']
+
+    def __init__(self) -> None:
+        self.reset()
+        self.configure(0, 0, 0, 0, 0, 0)
+
+    def configure(self, p, i, d, ff, deadband, limit):
+        self.p, self.i, self.d, self.ff, self.deadband, self.limit = p, i, d, ff, deadband, limit
+
+    def reset(self):
+        self.integral = 0.0
+        self.error = 0.0
+
+    def __call__(self, error: float, setpoint: float, dt: float) -> float:
+        if -self.deadband < error < self.deadband:
+            error = 0.0
+        integral = self.integral + error * dt
+        out = self.p * error + self.i * integral + self.d * (error - self.error) / dt + self.ff * setpoint
+        self.error = error
+        if out > self.limit:
+            return self.limit
+        if out < -self.limit:
+            return -self.limit
+        self.integral = integral
+        return out
+
+
+class EmulatedRed():
+    """ Software model of a single SMD Red driver. Registers are kept in
+    the same register file as the Red class, so tests can read and set
+    them through vars. Packages are handled by handle, which returns the
+    reply packages of the driver.
+
+    The motor is simulated by advance, which runs the control loops of
+    the firmware every period seconds of the clock: the S-curve profile
+    and position loop, the velocity loop with its acceleration ramp, the
+    torque loop or the plain duty cycle, depending on the operation mode.
+    The position loop outputs a velocity setpoint in RPM, the velocity
+    and torque loops output the duty cycle in percent. The motor does not
+    spin before OutputShaftCPR and OutputShaftRPM are set.
+    """
+
+    def __init__(self, id: int, modules=[], hardware_version=(1, 0, 0), software_version=(1, 0, 0), baudrate=115200,
+                 motor=None, clock=time.perf_counter, period=0.001) -> None:
+        """
+        Args:
+            id (int): Device ID of the driver
+            modules (list, optional): Connected modules found by a module scan, e.g. ['Button_1', 'RGB_2']. Defaults to [].
+            hardware_version (tuple, optional): (major, minor, patch). Defaults to (1, 0, 0).
+            software_version (tuple, optional): (major, minor, patch). Defaults to (1, 0, 0).
+            baudrate (int, optional): Value of the Baudrate register. Defaults to 115200.
+            motor (MotorModel, optional): Simulated motor. Defaults to a new MotorModel().
+            clock (function, optional): Returns the time in seconds, e.g. a VirtualClock. Defaults to time.perf_counter.
+            period (float, optional): Period of the control loops in seconds. Defaults to 0.001.
+        """
+        self.dev = Red(id)
+        self.vars = self.dev.vars
+        self.modules = list(modules)
+        self.vars[Index.HardwareVersion].value(_version(hardware_version))
+        self.vars[Index.SoftwareVersion].value(_version(software_version))
+        self.vars[Index.Baudrate].value(baudrate)
+        self.vars[Index.TorqueLimit].value(0xFFFF)
+        self.vars[Index.VelocityLimit].value(0xFFFF)
+        self.__factory = bytes(self.vars.buffer())
+        self.__eeprom = self.__factory
+        self.booting_until = 0.0
+        self.commands = dict()
+
+        self.motor = MotorModel() if motor is None else motor
+        self.clock = clock
+        self.period = period
+        self.__time = clock()
+        self.__loops = (_PID(), _PID(), _PID())
+        self.__velocity_reference = 0.0
+        self.__profile = None
+
+    @property
+    def id(self) -> int:
+        return self.vars[Index.DeviceID].value()
+
+    def frame(self, command, index_list=()) -> bytes:
+        """ Build a package of the driver carrying the current values of the given indexes. """
+        layout = self.vars.layout()
+        values = self.vars.buffer()
+        payload = bytearray()
+        for index in index_list:
+            payload.append(index)
+            payload += values[layout.offsets[index]:layout.offsets[index] + layout.sizes[index]]
+
+        frame = bytearray(_HEADER_STRUCT.pack(Red._HEADER, self.id, Red._PRODUCT_TYPE,
+                                              Red._PACKAGE_ESSENTIAL_SIZE + len(payload) + _CRC_STRUCT.size,
+                                              command, self.vars[Index.Status].value()))
+        frame += payload
+        return bytes(frame + _CRC_STRUCT.pack(_crc32_mpeg2(frame)))
+
+    def load(self, data, fields):
+        """ Store packed values into the registers.
+
+        Args:
+            data (memoryview): Buffer holding the values
+            fields (iterable): (index, offset in data) of each value
+        """
+        layout = self.vars.layout()
+        fields = [(index, offset) for index, offset in fields if layout.rw[index]]
+        self.vars.load(data, [(offset, layout.offsets[index], layout.sizes[index]) for index, offset in fields])
+        if any(index == Index.SCurveSetpoint for index, _ in fields):
+            self.__plan()
+
+    def handle(self, frame: bytes) -> list:
+        """ Execute a package addressed to this driver or broadcast.
+
+        Args:
+            frame (bytes): Package which has passed the CRC check
+
+        Returns:
+            list: Reply packages
+        """
+        command = frame[Index.Command]
+        self.commands[command] = self.commands.get(command, 0) + 1
+        broadcast = frame[Index.DeviceID] == _BROADCAST_ID
+        view = memoryview(frame)[Red._PACKAGE_ESSENTIAL_SIZE:-_CRC_STRUCT.size]
+
+        if command == Commands.PING:
+            return [self.frame(Commands.PING)]
+        elif command in (Commands.WRITE, Commands.WRITE_ACK):
+            index_list = self.__write(view)
+            return [self.frame(command, index_list)] if command == Commands.WRITE_ACK else []
+        elif command == Commands.READ:
+            return [self.frame(Commands.READ, list(view))]
+        elif command == Commands.SYNC_WRITE:
+            self.__sync_write(view)
+        elif command == Commands.BULK_WRITE:
+            self.__bulk(view, write=True)
+        elif command == Commands.BULK_READ:
+            index_list = self.__bulk(view, write=False)
+            return [] if index_list is None else [self.frame(Commands.READ, index_list)]
+        elif (command & 0x7F) == Commands.EEPROM_WRITE:
+            self.__eeprom = bytes(self.vars.buffer())
+            return [self.frame(command)] if (command & Commands.ACK) and not broadcast else []
+        elif command == Commands.REBOOT:
+            self.reboot()
+        elif command == Commands.HARD_RESET:
+            id = self.id
+            self.__eeprom = self.__factory
+            self.reboot()
+            self.vars[Index.DeviceID].value(id)
+        elif command == Commands.RESET_ENC:
+            self.motor.position = 0.0
+            self.__profile = None
+            self.vars[Index.PresentPosition].value(0)
+        elif command == Commands.TUNE:
+            self.tune()
+        elif command == Commands.MODULE_SCAN:
+            self.scan_modules()
+        return []
+
+    def reboot(self, boot_time=0.0):
+        """ Restore the registers saved to the EEPROM and stop the motor. """
+        self.vars.load(self.__eeprom, [(0, 0, len(self.__eeprom))])
+        self.motor.reset()
+        self.__profile = None
+        self.__velocity_reference = 0.0
+        for loop in self.__loops:
+            loop.reset()
+        self.__publish()
+        self.booting_until = self.clock() + boot_time
+
+    def tune(self):
+        """ Set the gains of the control loops for the motor model, as the
+        autotune of the firmware does for a real motor. The velocity loop
+        cancels the lag of the motor, the position loop is about five
+        times slower than the velocity loop.
+        """
+        rpm = self.vars[Index.OutputShaftRPM].value()
+        cpr = self.vars[Index.OutputShaftCPR].value()
+        if (rpm <= 0) or (cpr <= 0):
+            return
+        tau = self.motor.time_constant
+        gains = [[Index.PositionPGain, 900 / cpr], [Index.PositionIGain, 0], [Index.PositionDGain, 0],
+                 [Index.PositionFF, 1], [Index.VelocityPGain, 400 / rpm], [Index.VelocityIGain, 400 / rpm / tau],
+                 [Index.VelocityDGain, 0], [Index.VelocityFF, 100 / rpm],
+                 [Index.TorquePGain, 50 / self.motor.stall_current],
+                 [Index.TorqueIGain, 20000 / self.motor.stall_current], [Index.TorqueDGain, 0]]
+        for index, value in gains:
+            self.vars[index].value(value)
+
+    def advance(self, now=None):
+        """ Run the control loops and the motor model until the given time.
+
+        Args:
+            now (float, optional): Time of the clock in seconds. Defaults to the current time.
+        """
+        now = self.clock() if now is None else now
+        steps = int((now - self.__time) / self.period)
+        if steps <= 0:
+            return
+
+        value = lambda index: self.vars[index].value()
+        motor = self.motor
+        rpm = value(Index.OutputShaftRPM)
+        cpr = value(Index.OutputShaftCPR)
+        if (rpm <= 0) or (cpr <= 0) or (not value(Index.TorqueEnable) and motor.velocity == 0):
+            self.__time += steps * self.period
+            motor.current = 0.0
+            self.__publish()
+            return
+
+        position, velocity, torque = self.__loops
+        position.configure(value(Index.PositionPGain), value(Index.PositionIGain), value(Index.PositionDGain),
+                           value(Index.PositionFF), value(Index.PositionDeadband),
+                           value(Index.PositionOutputLimit) or rpm)
+        velocity.configure(value(Index.VelocityPGain), value(Index.VelocityIGain), value(Index.VelocityDGain),
+                           value(Index.VelocityFF), value(Index.VelocityDeadband),
+                           value(Index.VelocityOutputLimit) or 100)
+        torque.configure(value(Index.TorquePGain), value(Index.TorqueIGain), value(Index.TorqueDGain),
+                         value(Index.TorqueFF), value(Index.TorqueDeadband), value(Index.TorqueOutputLimit) or 100)
+
+        enabled = value(Index.TorqueEnable)
+        mode = value(Index.OperationMode)
+        profile = self.__profile if value(Index.PositionControlMode) == 1 else None
+        setpoint = value(Index.SetPosition)
+        minimum, maximum = value(Index.MinimumPositionLimit), value(Index.MaximumPositionLimit)
+        if minimum < maximum:
+            setpoint = min(max(setpoint, minimum), maximum)
+        velocity_limit = value(Index.VelocityLimit)
+        velocity_setpoint = min(max(value(Index.SetVelocity), -velocity_limit), velocity_limit)
+        velocity_step = value(Index.SetVelocityAcceleration) * self.period
+        torque_setpoint = value(Index.SetTorque)
+        torque_limit = value(Index.TorqueLimit)
+        duty_cycle = value(Index.SetDutyCycle)
+
+        dt = self.period
+        alpha = 1 - math.exp(-dt / motor.time_constant)
+        ticks = cpr / 60 * dt
+        stall = motor.stall_current
+        reference = self.__velocity_reference
+        for step in range(1, steps + 1):
+            if not enabled:
+                duty = 0.0
+            elif mode == OperationMode.Position:
+                speed = 0.0
+                if profile is not None:
+                    setpoint, speed = self.__reference(profile, self.__time + step * dt, cpr)
+                target = position(setpoint - motor.position, speed, dt)
+                duty = velocity(target - motor.velocity, target, dt)
+            elif mode == OperationMode.Velocity:
+                if (velocity_step <= 0) or (abs(velocity_setpoint - reference) <= velocity_step):
+                    reference = velocity_setpoint
+                else:
+                    reference += math.copysign(velocity_step, velocity_setpoint - reference)
+                duty = velocity(reference - motor.velocity, reference, dt)
+            elif mode == OperationMode.Torque:
+                duty = torque(torque_setpoint - motor.current, torque_setpoint, dt)
+            else:
+                duty = duty_cycle
+            duty = min(max(duty, -100.0), 100.0)
+
+            current = stall * (duty / 100 - motor.velocity / rpm)
+            if abs(current) > torque_limit:
+                current = math.copysign(torque_limit, current)
+                duty = (current / stall + motor.velocity / rpm) * 100
+            motor.current = current
+            motor.velocity += (duty / 100 * rpm - motor.velocity) * alpha
+            motor.position += motor.velocity * ticks
+
+        self.__velocity_reference = reference
+        self.__time += steps * dt
+        self.__publish()
+
+    def __publish(self):
+        self.vars[Index.PresentPosition].value(self.motor.position)
+        self.vars[Index.PresentVelocity].value(self.motor.velocity)
+        self.vars[Index.MotorCurrent].value(self.motor.current)
+
+    def __plan(self):
+        """ Plan the S-curve profile from the present setpoint to the new
+        S-curve setpoint. The profile is approximated by constant
+        acceleration phases. If the given time can not be kept with the
+        given speed and acceleration, the time is ignored.
+        """
+        rpm = self.vars[Index.OutputShaftRPM].value()
+        cpr = self.vars[Index.OutputShaftCPR].value()
+        if (rpm <= 0) or (cpr <= 0):
+            return
+        if self.__profile is not None:
+            start = self.__reference(self.__profile, self.__time, cpr)[0]
+        else:
+            start = self.motor.position
+        target = self.vars[Index.SCurveSetpoint].value()
+        minimum, maximum = self.vars[Index.MinimumPositionLimit].value(), self.vars[Index.MaximumPositionLimit].value()
+        if minimum < maximum:
+            target = min(max(target, minimum), maximum)
+
+        distance = abs(target - start)
+        speed = (self.vars[Index.SCurveMaxVelocity].value() or rpm) * cpr / 60
+        accel = (self.vars[Index.ScurveAccel].value() or 2 * rpm) * cpr / 60
+        duration = self.vars[Index.SCurveTime].value()
+        if duration > 0:
+            discriminant = (accel * duration) ** 2 - 4 * accel * distance
+            if discriminant >= 0:
+                speed = min(speed, (accel * duration - math.sqrt(discriminant)) / 2)
+        ramp = speed / accel
+        if speed * ramp > distance:
+            ramp = math.sqrt(distance / accel)
+            speed = accel * ramp
+        cruise = (distance - speed * ramp) / speed if speed > 0 else 0.0
+        self.__profile = (self.__time, start, math.copysign(1, target - start), distance, speed, accel, ramp, cruise)
+
+    @staticmethod
+    def __reference(profile, now, cpr):
+        """ Return the position and the velocity in RPM of the profile at the given time. """
+        start_time, start, sign, distance, speed, accel, ramp, cruise = profile
+        elapsed = now - start_time
+        if elapsed <= 0:
+            return start, 0.0
+        if elapsed < ramp:
+            travel, velocity = accel * elapsed * elapsed / 2, accel * elapsed
+        elif elapsed < ramp + cruise:
+            travel, velocity = speed * ramp / 2 + speed * (elapsed - ramp), speed
+        elif elapsed < 2 * ramp + cruise:
+            remaining = 2 * ramp + cruise - elapsed
+            travel, velocity = distance - accel * remaining * remaining / 2, accel * remaining
+        else:
+            travel, velocity = distance, 0.0
+        return start + sign * travel, sign * velocity * 60 / cpr
+
+    def scan_modules(self):
+        """ Update the connected module bitfield from the modules of the
+        driver, or from the manual module registers in manual scan mode.
+        """
+        connected = 0
+        if self.vars[Index.SetScanModuleMode].value():
+            for name, index in _MANUAL_MODULE_INDEXES.items():
+                connected |= self.vars[index].value() << _MODULE_ADDRESSES[name]
+        else:
+            for module in self.modules:
+                name, number = module.rsplit('_', 1)
+                connected |= 1 << (_MODULE_ADDRESSES[name] + int(number) - 1)
+        self.vars[Index.connected_bitfield].value([connected & 0xFFFFFFFF, connected >> 32])
+
+    def __write(self, view) -> list:
+        layout = self.vars.layout()
+        fields = []
+        i = 0
+        while i < len(view):
+            fields.append((view[i], i + 1))
+            i += 1 + layout.sizes[view[i]]
+        self.load(view, fields)
+        return [index for index, _ in fields]
+
+    def __sync_write(self, view):
+        index = view[0]
+        record_size = 1 + self.vars.layout().sizes[index]
+        i = 1
+        while i < len(view):
+            if view[i] == self.id:
+                self.load(view, [(index, i + 1)])
+            i += record_size
+
+    def __bulk(self, view, write: bool):
+        """ Execute the block of this driver in a BULK_WRITE or BULK_READ
+        package. Returns the indexes of the block of this driver, if any.
+        """
+        layout = self.vars.layout()
+        i = 0
+        while i < len(view):
+            id, count = view[i], view[i + 1]
+            i += 2
+            fields = []
+            for _ in range(count):
+                fields.append((view[i], i + 1))
+                i += 1 + (layout.sizes[view[i]] if write else 0)
+            if id == self.id:
+                if write:
+                    self.load(view, fields)
+                return [index for index, _ in fields]
+        return None
+
+
+class Emulator():
+    """ Bus of emulated SMD Red drivers. Connect a master to it with
+    transport (in-memory) or pty (pseudo terminal).
+
+    With a baudrate, packages take 10 bits per byte on the wire. Replies
+    are delivered when their last byte would arrive, one after the other
+    as on a half-duplex bus. The response delay is added between the end
+    of a request and the start of its first reply. Without a baudrate and
+    delay, replies are delivered immediately.
+
+    With a VirtualClock, replies are always delivered immediately and
+    each package advances the clock instead: by its wire time at the
+    baudrate (115200 if not given) and the response delay.
+    """
+    _VIRTUAL_BAUDRATE = 115200
+
+    def __init__(self, ids=[], baudrate=None, response_delay=0.0, clock=None, **kwargs) -> None:
+        """
+        Args:
+            ids (iterable, optional): Device IDs of the emulated drivers. Defaults to [].
+            baudrate (int, optional): Baudrate of the byte timing, None disables it. Defaults to None.
+            response_delay (float, optional): Seconds between a request and its reply. Defaults to 0.0.
+            clock (VirtualClock, optional): Clock of the motor simulation. Defaults to the real time.
+            **kwargs: Arguments passed to every EmulatedRed
+        """
+        self.baudrate = baudrate
+        self.response_delay = response_delay
+        self.clock = time.perf_counter if clock is None else clock
+        self.drivers = dict()
+        for id in ids:
+            self.add(id, **kwargs)
+
+        self.packages = 0
+        self.crc_errors = 0
+        self.__lock = threading.RLock()
+        self.__bus_free = 0.0
+        self.__queue = []
+        self.__sequence = 0
+        self.__wakeup = threading.Condition(self.__lock)
+        self.__scheduler = None
+        self.__closed = False
+        self.__fds = []
+
+    def add(self, id: int, **kwargs) -> EmulatedRed:
+        """ Add an emulated driver to the bus.
+
+        Args:
+            id (int): Device ID of the driver
+            **kwargs: Arguments passed to EmulatedRed
+
+        Returns:
+            EmulatedRed: The new driver
+        """
+        if 'baudrate' not in kwargs and self.baudrate is not None:
+            kwargs['baudrate'] = self.baudrate
+        kwargs.setdefault('clock', self.clock)
+        self.drivers[id] = EmulatedRed(id, **kwargs)
+        return self.drivers[id]
+
+    def update(self):
+        """ Simulate the motors of all drivers until the present time of the clock. """
+        with self.__lock:
+            now = self.clock()
+            for driver in self.drivers.values():
+                driver.advance(now)
+
+    def remove(self, id: int):
+        """ Remove the emulated driver with the given device ID from the bus. """
+        del self.drivers[id]
+
+    def transport(self) -> MemoryTransport:
+        """ Return a new in-memory transport connected to the bus. """
+        transport = MemoryTransport()
+        transport.responder = self.__connect(transport.feed)
+        return transport
+
+    def pty(self) -> str:
+        """ Serve the bus on a new pseudo terminal.
+
+        Returns:
+            str: Path of the pseudo terminal to be opened by a master
+        """
+        controller, peer = os.openpty()
+        tty.setraw(peer)
+        self.__fds += [controller, peer]
+        self.serve(controller)
+        return os.ttyname(peer)
+
+    def serve(self, fd: int):
+        """ Serve the bus on a file descriptor in a background thread. A
+        tty is switched to raw mode first.
+        """
+        if os.isatty(fd):
+            tty.setraw(fd)
+
+        def write(data):
+            try:
+                os.write(fd, data)
+            except OSError:
+                pass
+
+        receive = self.__connect(write)
+
+        def reader():
+            while not self.__closed:
+                try:
+                    data = os.read(fd, 4096)
+                except OSError:
+                    return
+                if not data:
+                    return
+                reply = receive(data)
+                if reply:
+                    write(reply)
+
+        threading.Thread(target=reader, daemon=True).start()
+
+    def close(self):
+        """ Stop the scheduler and close the pseudo terminals of the bus. """
+        with self.__lock:
+            self.__closed = True
+            self.__wakeup.notify_all()
+        for fd in self.__fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.__fds = []
+
+    def __connect(self, sink):
+        """ Return a function which receives the bytes of a connection.
+        The function returns the replies to be delivered immediately, and
+        schedules the delivery to sink otherwise.
+        """
+        receiver = _FrameReceiver(Red._HEADER, Red._PRODUCT_TYPE, Red._PACKAGE_ESSENTIAL_SIZE + _CRC_STRUCT.size)
+
+        def receive(data) -> bytes:
+            now = time.perf_counter()
+            receiver.feed(data)
+            immediate = bytearray()
+            frame = receiver.next_frame()
+            while frame is not None:
+                if isinstance(self.clock, VirtualClock):
+                    baudrate = self.baudrate or self.__class__._VIRTUAL_BAUDRATE
+                    self.clock.advance(len(frame) * 10 / baudrate + self.response_delay)
+                    replies = self.__handle(frame)
+                    self.clock.advance(sum([len(reply) for reply in replies]) * 10 / baudrate)
+                    immediate += b''.join(replies)
+                    frame = receiver.next_frame()
+                    continue
+
+                replies = self.__handle(frame)
+                if replies:
+                    if (self.baudrate is None) and (self.response_delay == 0):
+                        immediate += b''.join(replies)
+                    else:
+                        self.__schedule(now, len(frame), replies, sink)
+                frame = receiver.next_frame()
+            self.crc_errors = receiver.crc_errors
+            return bytes(immediate)
+
+        return receive
+
+    def __handle(self, frame: bytes) -> list:
+        with self.__lock:
+            self.packages += 1
+            id = frame[Index.DeviceID]
+            if id == _BROADCAST_ID:
+                drivers = list(self.drivers.values())
+            elif id in self.drivers:
+                drivers = [self.drivers[id]]
+            else:
+                return []
+
+            replies = []
+            now = self.clock()
+            for driver in drivers:
+                driver.advance(now)
+                if driver.booting_until > now:
+                    continue
+                old_id = driver.id
+                replies += driver.handle(frame)
+                if driver.id != old_id:
+                    # A driver which got a new ID answers to it right away
+                    del self.drivers[old_id]
+                    self.drivers[driver.id] = driver
+
+            if frame[Index.Command] == Commands.BULK_READ:
+                # Drivers reply in the order of their blocks in the package
+                order = list(frame[Red._PACKAGE_ESSENTIAL_SIZE:-_CRC_STRUCT.size])
+                replies.sort(key=lambda reply: self.__block_position(order, reply[Index.DeviceID]))
+            return replies
+
+    @staticmethod
+    def __block_position(order: list, id: int) -> int:
+        i = 0
+        position = 0
+        while i < len(order):
+            if order[i] == id:
+                return position
+            i += 2 + order[i + 1]
+            position += 1
+        return position
+
+    def __wire_time(self, size: int) -> float:
+        return 0.0 if self.baudrate is None else size * 10 / self.baudrate
+
+    def __schedule(self, now: float, request_size: int, replies: list, sink):
+        with self.__lock:
+            start = max(now + self.__wire_time(request_size) + self.response_delay, self.__bus_free)
+            for reply in replies:
+                start += self.__wire_time(len(reply))
+                heapq.heappush(self.__queue, (start, self.__sequence, reply, sink))
+                self.__sequence += 1
+            self.__bus_free = start
+
+            if self.__scheduler is None:
+                self.__scheduler = threading.Thread(target=self.__deliver, daemon=True)
+                self.__scheduler.start()
+            self.__wakeup.notify_all()
+
+    def __deliver(self):
+        with self.__lock:
+            while not self.__closed:
+                if not self.__queue:
+                    self.__wakeup.wait()
+                    continue
+                delay = self.__queue[0][0] - time.perf_counter()
+                if delay > 0:
+                    self.__wakeup.wait(delay)
+                    continue
+                _, _, reply, sink = heapq.heappop(self.__queue)
+                sink(reply)
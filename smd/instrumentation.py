@@ -0,0 +1,210 @@
+from smd._internals import Commands
+import time
+
+
+class LatencyHistogram():
+    """ Latency histogram with log-linear buckets in the style of
+    HdrHistogram. Values are recorded in microseconds. Values below
+    2 ** sub_bits microseconds are exact, larger ones fall in buckets
+    which are at most 2 ** (1 - sub_bits) of their value wide, so the
+    relative error of a percentile stays bounded whatever the range.
+    """
+
+    def __init__(self, sub_bits=7) -> None:
+        """
+        Args:
+            sub_bits (int, optional): Bits of precision of a bucket. Defaults to 7 (0.8% error).
+        """
+        self.__bits = sub_bits
+        self.__exact = 1 << sub_bits
+        self.__half = 1 << (sub_bits - 1)
+        self.reset()
+
+    def reset(self):
+        """ Remove every recorded value. """
+        self.__counts = dict()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __index(self, value: int) -> int:
+        if value < self.__exact:
+            return value
+        shift = value.bit_length() - self.__bits
+        return self.__exact + (shift - 1) * self.__half + (value >> shift) - self.__half
+
+    def __upper(self, index: int) -> int:
+        """ Highest value which falls in the bucket of the given index. """
+        if index < self.__exact:
+            return index
+        shift, sub = divmod(index - self.__exact, self.__half)
+        return ((sub + self.__half + 1) << (shift + 1)) - 1
+
+    def record(self, seconds: float):
+        """ Record a latency given in seconds. """
+        value = int(seconds * 1e6)
+        if value < 0:
+            value = 0
+        index = self.__index(value)
+        self.__counts[index] = self.__counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if (self.min is None) or (value < self.min):
+            self.min = value
+        if (self.max is None) or (value > self.max):
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        """ Return the value in microseconds which the given percent of the recorded values do not exceed. """
+        if self.count == 0:
+            return None
+        rank = max(int(self.count * percent / 100 + 0.5), 1)
+        seen = 0
+        for index in sorted(self.__counts):
+            seen += self.__counts[index]
+            if seen >= rank:
+                return min(self.__upper(index), self.max)
+        return self.max
+
+    def buckets(self) -> list:
+        """ Return [upper value in microseconds, count] of every non empty bucket. """
+        return [[self.__upper(index), self.__counts[index]] for index in sorted(self.__counts)]
+
+    def snapshot(self) -> dict:
+        """ Return the summary of the histogram, all values are in microseconds. """
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': (self.total / self.count) if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'buckets': self.buckets(),
+        }
+
+
+_COUNTERS = ('sent', 'acked', 'crc_errors', 'short_reads', 'timeouts', 'retries')
+
+
+def _command_name(command: int) -> str:
+    try:
+        return Commands(command).name
+    except ValueError:
+        return hex(command)
+
+
+class Instruments():
+    """ Transaction counters and latency histograms of a Master.
+
+    Requests are counted under the device ID and the command of the
+    package, so broadcast packages are counted under ID 255. Replies are
+    counted under the device ID of the replying driver and the command of
+    the request. A request which gets no reply is counted as a CRC error
+    if a corrupt package arrived meanwhile, as a short read if some other
+    bytes arrived, and as a timeout otherwise. A request sent again to a
+    driver after it failed with the same command is also a retry.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        """ Clear the counters and the histograms. """
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.__counters = dict()
+        self.__latency = LatencyHistogram()
+        self.__id_latency = dict()
+        self.__command_latency = dict()
+        self.__failed = set()
+        self.__sent = dict()
+        self.__last = (0, 0.0)
+
+    def __counter(self, id: int, command: int) -> dict:
+        try:
+            return self.__counters[id][command]
+        except KeyError:
+            return self.__counters.setdefault(id, dict()).setdefault(command, dict.fromkeys(_COUNTERS, 0))
+
+    def sent(self, data):
+        """ Count a package written to the bus. """
+        id, command = data[1], data[4]
+        counter = self.__counter(id, command)
+        counter['sent'] += 1
+        if (id, command) in self.__failed:
+            self.__failed.discard((id, command))
+            counter['retries'] += 1
+        self.bytes_out += len(data)
+        self.__last = (command, time.perf_counter())
+        if id == 0xFF:
+            # Replies to a broadcast package belong to it, not to earlier unanswered packages
+            self.__sent.clear()
+        else:
+            self.__sent[id] = self.__last
+
+    def received(self, size: int):
+        """ Count bytes read from the bus. """
+        self.bytes_in += size
+
+    def acked(self, id: int):
+        """ Count the reply of the driver with the given ID and record its latency. """
+        command, start = self.__sent.pop(id, self.__last)
+        self.__counter(id, command)['acked'] += 1
+        latency = time.perf_counter() - start
+        self.__latency.record(latency)
+        if id not in self.__id_latency:
+            self.__id_latency[id] = LatencyHistogram()
+        self.__id_latency[id].record(latency)
+        if command not in self.__command_latency:
+            self.__command_latency[command] = LatencyHistogram()
+        self.__command_latency[command].record(latency)
+
+    def failed(self, id: int, reason: str):
+        """ Count a missing reply of the driver with the given ID.
+
+        Args:
+            id (int): The device ID of the driver
+            reason (str): One of 'crc_errors', 'short_reads' or 'timeouts'
+        """
+        command, _ = self.__sent.pop(id, self.__last)
+        self.__counter(id, command)[reason] += 1
+        self.__failed.add((id, command))
+
+    def snapshot(self) -> dict:
+        """ Return the counters and histograms as a dictionary.
+
+        Returns:
+            dict: bytes_in, bytes_out, totals {counter: n}, latency (histogram summary),
+                  ids {id: {'commands': {command: {counter: n}}, 'latency': summary}},
+                  commands {command: {counter: n, 'latency': summary}}
+        """
+        totals = dict.fromkeys(_COUNTERS, 0)
+        ids = dict()
+        commands = dict()
+        for id, counters in self.__counters.items():
+            ids[id] = {'commands': dict(), 'latency': None}
+            for command, counter in counters.items():
+                name = _command_name(command)
+                ids[id]['commands'][name] = dict(counter)
+                per_command = commands.setdefault(name, dict.fromkeys(_COUNTERS, 0))
+                for key, value in counter.items():
+                    totals[key] += value
+                    per_command[key] += value
+        for id, histogram in self.__id_latency.items():
+            ids[id]['latency'] = histogram.snapshot()
+        for name in commands:
+            commands[name]['latency'] = None
+        for command, histogram in self.__command_latency.items():
+            commands[_command_name(command)]['latency'] = histogram.snapshot()
+
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'totals': totals,
+            'latency': self.__latency.snapshot(),
+            'ids': ids,
+            'commands': commands,
+        }
@@ -1,9 +1,14 @@
-from smd._internals import (_Data, Index, Commands,
-                            OperationMode, MotorConstants)
+from smd._internals import (_RegisterLayout, _RegisterFile, Index, Commands,
+                            OperationMode, MotorConstants, CachePolicy, _crc32_mpeg2,
+                            _FrameReceiver)
+from smd.transport import Transport, SerialTransport
+from smd.instrumentation import Instruments
 import struct
-from crccheck.crc import Crc32Mpeg2 as CRC32
-import serial
+import operator
 import time
+import json
+import threading
+from concurrent.futures import Future
 from packaging.version import parse as parse_version
 import requests
 import hashlib
@@ -11,6 +16,9 @@ import tempfile
 from stm32loader.main import main as stm32loader_main
 
 
+_CRC_STRUCT = struct.Struct('<I')
+
+
 class InvalidIndexError(BaseException):
     pass
 
@@ -27,265 +35,433 @@ class Red():
     _HEADER = 0x55
     _PRODUCT_TYPE = 0xBA
     _PACKAGE_ESSENTIAL_SIZE = 6
+    _MAX_PACKAGE_SIZE = 255
+    _LAYOUTS = dict()
+    _PING_FRAMES = dict()
+    _REPLIES = dict()
     _STATUS_KEY_LIST = ['EEPROM', 'Software Version', 'Hardware Version']
+    # Register types are fixed by the firmware, so a single layout is shared by every device
+    _REGISTERS = _RegisterLayout([
+        (Index.Header, 'B', False, 0x55),
+        (Index.DeviceID, 'B', True, 0),
+        (Index.DeviceFamily, 'B', False, _PRODUCT_TYPE),
+        (Index.PackageSize, 'B', True, 0),
+        (Index.Command, 'B', True, 0),
+        (Index.Status, 'B', True, 0),
+        (Index.HardwareVersion, 'I', True, 0),
+        (Index.SoftwareVersion, 'I', True, 0),
+        (Index.Baudrate, 'I', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.OperationMode, 'B', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueEnable, 'B', True, 0),
+        (Index.OutputShaftCPR, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.OutputShaftRPM, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.UserIndicator, 'B', True, 0),
+        (Index.MinimumPositionLimit, 'i', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.MaximumPositionLimit, 'i', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueLimit, 'H', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityLimit, 'H', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.PositionFF, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityFF, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueFF, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.PositionDeadband, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityDeadband, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueDeadband, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.PositionOutputLimit, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityOutputLimit, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueOutputLimit, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.PositionScalerGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.PositionPGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.PositionIGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.PositionDGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityScalerGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityPGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityIGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.VelocityDGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueScalerGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorquePGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueIGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.TorqueDGain, 'f', True, 0, CachePolicy.UNTIL_WRITE),
+        (Index.SetPosition, 'f', True, 0),
+        (Index.PositionControlMode, 'B', True, 0),      # S Curve Position Control / 1 is SCurve(goTo function) 0 is direct control.
+        (Index.SCurveSetpoint, 'f', True, 0),
+        (Index.ScurveAccel, 'f', True, 0),
+        (Index.SCurveMaxVelocity, 'f', True, 0),
+        (Index.SCurveTime, 'f', True, 0),
+        (Index.SetVelocity, 'f', True, 0),
+        (Index.SetVelocityAcceleration, 'f', True, 0),
+        (Index.SetTorque, 'f', True, 0),
+        (Index.SetDutyCycle, 'f', True, 0),
+        (Index.SetScanModuleMode, 'B', True, 0),        # Modules
+        (Index.SetManualBuzzer, 'B', True, 0),
+        (Index.SetManualServo, 'B', True, 0),
+        (Index.SetManualRGB, 'B', True, 0),
+        (Index.SetManualButton, 'B', True, 0),
+        (Index.SetManualLight, 'B', True, 0),
+        (Index.SetManualJoystick, 'B', True, 0),
+        (Index.SetManualDistance, 'B', True, 0),
+        (Index.SetManualQTR, 'B', True, 0),
+        (Index.SetManualPot, 'B', True, 0),
+        (Index.SetManualIMU, 'B', True, 0),
+        (Index.Buzzer_1, 'i', True, 0),
+        (Index.Buzzer_2, 'i', True, 0),
+        (Index.Buzzer_3, 'i', True, 0),
+        (Index.Buzzer_4, 'i', True, 0),
+        (Index.Buzzer_5, 'i', True, 0),
+        (Index.Servo_1, 'B', True, 0),
+        (Index.Servo_2, 'B', True, 0),
+        (Index.Servo_3, 'B', True, 0),
+        (Index.Servo_4, 'B', True, 0),
+        (Index.Servo_5, 'B', True, 0),
+        (Index.RGB_1, 'i', True, 0),
+        (Index.RGB_2, 'i', True, 0),
+        (Index.RGB_3, 'i', True, 0),
+        (Index.RGB_4, 'i', True, 0),
+        (Index.RGB_5, 'i', True, 0),
+        (Index.PresentPosition, 'f', True, 0),
+        (Index.PresentVelocity, 'f', True, 0),
+        (Index.MotorCurrent, 'f', True, 0),
+        (Index.AnalogPort, 'H', True, 0),
+        (Index.Button_1, 'B', True, 0),
+        (Index.Button_2, 'B', True, 0),
+        (Index.Button_3, 'B', True, 0),
+        (Index.Button_4, 'B', True, 0),
+        (Index.Button_5, 'B', True, 0),
+        (Index.Light_1, 'H', True, 0),
+        (Index.Light_2, 'H', True, 0),
+        (Index.Light_3, 'H', True, 0),
+        (Index.Light_4, 'H', True, 0),
+        (Index.Light_5, 'H', True, 0),
+        (Index.Joystick_1, 'iiB', True, 0),
+        (Index.Joystick_2, 'iiB', True, 0),
+        (Index.Joystick_3, 'iiB', True, 0),
+        (Index.Joystick_4, 'iiB', True, 0),
+        (Index.Joystick_5, 'iiB', True, 0),
+        (Index.Distance_1, 'H', True, 0),
+        (Index.Distance_2, 'H', True, 0),
+        (Index.Distance_3, 'H', True, 0),
+        (Index.Distance_4, 'H', True, 0),
+        (Index.Distance_5, 'H', True, 0),
+        (Index.QTR_1, 'BBB', True, 0),
+        (Index.QTR_2, 'BBB', True, 0),
+        (Index.QTR_3, 'BBB', True, 0),
+        (Index.QTR_4, 'BBB', True, 0),
+        (Index.QTR_5, 'BBB', True, 0),
+        (Index.Pot_1, 'B', True, 0),
+        (Index.Pot_2, 'B', True, 0),
+        (Index.Pot_3, 'B', True, 0),
+        (Index.Pot_4, 'B', True, 0),
+        (Index.Pot_5, 'B', True, 0),
+        (Index.IMU_1, 'ff', True, 0),
+        (Index.IMU_2, 'ff', True, 0),
+        (Index.IMU_3, 'ff', True, 0),
+        (Index.IMU_4, 'ff', True, 0),
+        (Index.IMU_5, 'ff', True, 0),
+        (Index.connected_bitfield, 'II', True, 0),
+        (Index.CRCValue, 'I', True, 0)
+    ])
 
     def __init__(self, ID: int) -> bool:
 
         self.__ack_size = 0
+        self.__reply = None
         self._config = None
         self._fw_file = None
-        self.vars = [
-            _Data(Index.Header, 'B', False, 0x55),
-            _Data(Index.DeviceID, 'B'),
-            _Data(Index.DeviceFamily, 'B', False, self.__class__._PRODUCT_TYPE),
-            _Data(Index.PackageSize, 'B'),
-            _Data(Index.Command, 'B'),
-            _Data(Index.Status, 'B'),
-            _Data(Index.HardwareVersion, 'I'),
-            _Data(Index.SoftwareVersion, 'I'),
-            _Data(Index.Baudrate, 'I'),
-            _Data(Index.OperationMode, 'B'),
-            _Data(Index.TorqueEnable, 'B'),
-            _Data(Index.OutputShaftCPR, 'f'),
-            _Data(Index.OutputShaftRPM, 'f'),
-            _Data(Index.UserIndicator, 'B'),
-            _Data(Index.MinimumPositionLimit, 'i'),
-            _Data(Index.MaximumPositionLimit, 'i'),
-            _Data(Index.TorqueLimit, 'H'),
-            _Data(Index.VelocityLimit, 'H'),
-            _Data(Index.PositionFF, 'f'),
-            _Data(Index.VelocityFF, 'f'),
-            _Data(Index.TorqueFF, 'f'),
-            _Data(Index.PositionDeadband, 'f'),
-            _Data(Index.VelocityDeadband, 'f'),
-            _Data(Index.TorqueDeadband, 'f'),
-            _Data(Index.PositionOutputLimit, 'f'),
-            _Data(Index.VelocityOutputLimit, 'f'),
-            _Data(Index.TorqueOutputLimit, 'f'),
-            _Data(Index.PositionScalerGain, 'f'),
-            _Data(Index.PositionPGain, 'f'),
-            _Data(Index.PositionIGain, 'f'),
-            _Data(Index.PositionDGain, 'f'),
-            _Data(Index.VelocityScalerGain, 'f'),
-            _Data(Index.VelocityPGain, 'f'),
-            _Data(Index.VelocityIGain, 'f'),
-            _Data(Index.VelocityDGain, 'f'),
-            _Data(Index.TorqueScalerGain, 'f'),
-            _Data(Index.TorquePGain, 'f'),
-            _Data(Index.TorqueIGain, 'f'),
-            _Data(Index.TorqueDGain, 'f'),
-            _Data(Index.SetPosition, 'f'),
-            _Data(Index.PositionControlMode, 'B'),      # S Curve Position Control / 1 is SCurve(goTo function) 0 is direct control.
-            _Data(Index.SCurveSetpoint, 'f'),
-            _Data(Index.ScurveAccel, 'f'),
-            _Data(Index.SCurveMaxVelocity, 'f'),
-            _Data(Index.SCurveTime, 'f'),
-            _Data(Index.SetVelocity, 'f'),
-            _Data(Index.SetVelocityAcceleration, 'f'),
-            _Data(Index.SetTorque, 'f'),
-            _Data(Index.SetDutyCycle, 'f'),
-            _Data(Index.SetScanModuleMode, 'B'),        # Modules
-            _Data(Index.SetManualBuzzer, 'B'),
-            _Data(Index.SetManualServo, 'B'),
-            _Data(Index.SetManualRGB, 'B'),
-            _Data(Index.SetManualButton, 'B'),
-            _Data(Index.SetManualLight, 'B'),
-            _Data(Index.SetManualJoystick, 'B'),
-            _Data(Index.SetManualDistance, 'B'),
-            _Data(Index.SetManualQTR, 'B'),
-            _Data(Index.SetManualPot, 'B'),
-            _Data(Index.SetManualIMU, 'B'),
-            _Data(Index.Buzzer_1, 'i'),
-            _Data(Index.Buzzer_2, 'i'),
-            _Data(Index.Buzzer_3, 'i'),
-            _Data(Index.Buzzer_4, 'i'),
-            _Data(Index.Buzzer_5, 'i'),
-            _Data(Index.Servo_1, 'B'),
-            _Data(Index.Servo_2, 'B'),
-            _Data(Index.Servo_3, 'B'),
-            _Data(Index.Servo_4, 'B'),
-            _Data(Index.Servo_5, 'B'),
-            _Data(Index.RGB_1, 'i'),
-            _Data(Index.RGB_2, 'i'),
-            _Data(Index.RGB_3, 'i'),
-            _Data(Index.RGB_4, 'i'),
-            _Data(Index.RGB_5, 'i'),
-            _Data(Index.PresentPosition, 'f'),
-            _Data(Index.PresentVelocity, 'f'),
-            _Data(Index.MotorCurrent, 'f'),
-            _Data(Index.AnalogPort, 'H'),
-            _Data(Index.Button_1, 'B'),
-            _Data(Index.Button_2, 'B'),
-            _Data(Index.Button_3, 'B'),
-            _Data(Index.Button_4, 'B'),
-            _Data(Index.Button_5, 'B'),
-            _Data(Index.Light_1, 'H'),
-            _Data(Index.Light_2, 'H'),
-            _Data(Index.Light_3, 'H'),
-            _Data(Index.Light_4, 'H'),
-            _Data(Index.Light_5, 'H'),
-            _Data(Index.Joystick_1, 'iiB'),
-            _Data(Index.Joystick_2, 'iiB'), 
-            _Data(Index.Joystick_3, 'iiB'),
-            _Data(Index.Joystick_4, 'iiB'),
-            _Data(Index.Joystick_5, 'iiB'),
-            _Data(Index.Distance_1, 'H'),
-            _Data(Index.Distance_2, 'H'),
-            _Data(Index.Distance_3, 'H'),
-            _Data(Index.Distance_4, 'H'),
-            _Data(Index.Distance_5, 'H'),
-            _Data(Index.QTR_1, 'BBB'),
-            _Data(Index.QTR_2, 'BBB'),
-            _Data(Index.QTR_3, 'BBB'),
-            _Data(Index.QTR_4, 'BBB'),
-            _Data(Index.QTR_5, 'BBB'),
-            _Data(Index.Pot_1, 'B'),
-            _Data(Index.Pot_2, 'B'),
-            _Data(Index.Pot_3, 'B'),
-            _Data(Index.Pot_4, 'B'),
-            _Data(Index.Pot_5, 'B'),
-            _Data(Index.IMU_1, 'ff'),
-            _Data(Index.IMU_2, 'ff'),
-            _Data(Index.IMU_3, 'ff'),
-            _Data(Index.IMU_4, 'ff'),
-            _Data(Index.IMU_5, 'ff'),
-            _Data(Index.connected_bitfield, 'II'),
-            _Data(Index.CRCValue, 'I')
-        ]
+        self.vars = _RegisterFile(self.__class__._REGISTERS)
+        self.__values = self.vars.buffer()
 
         if ID > 255 or ID < 0:
             raise ValueError("Device ID can not be higher than 254 or lower than 0!")
         else:
             self.vars[Index.DeviceID].value(ID)
 
+        # Reusable frame buffer with the header prebuilt for this device ID
+        self.__frame = bytearray(self.__class__._MAX_PACKAGE_SIZE)
+        self.__frame[:3] = bytes([self.__class__._HEADER, ID, self.__class__._PRODUCT_TYPE])
+        self.__view = memoryview(self.__frame)
+        self.__header_crc = _crc32_mpeg2(self.__view[:3])
+
     def get_ack_size(self):
         return self.__ack_size
 
+    def __layout(self, command, index_list=()):
+        """ Return the precompiled frame layout for a command and index list.
+        Layouts are shared by every Red instance since register types are fixed.
+
+        Args:
+            command (Commands): Command of the frame
+            index_list (tuple, optional): Indexes carried by the frame, a tuple of
+                index tuples for bulk commands and (index, device count) for
+                sync write. Defaults to ().
+
+        Returns:
+            tuple: (struct.Struct of the frame body, acknowledge size)
+        """
+        key = (command, index_list)
+        try:
+            return Red._LAYOUTS[key]
+        except KeyError:
+            pass
+
+        # The body starts at PackageSize, the first three header bytes are prebuilt per device.
+        fmt_str = '<' + ''.join([var.type() for var in self.vars[Index.PackageSize:Index.Status + 1]])
+        if command in (Commands.WRITE, Commands.WRITE_ACK):
+            fmt_str += ''.join(['B' + self.vars[int(index)].type() for index in index_list])
+            ack_size = self.__class__._PACKAGE_ESSENTIAL_SIZE + struct.calcsize(fmt_str) - 3
+        elif command == Commands.READ:
+            fmt_str += 'B' * len(index_list)
+            ack_size = self.__class__._PACKAGE_ESSENTIAL_SIZE + self.vars[Index.CRCValue].size() \
+                + struct.calcsize('<' + ''.join(['B' + self.vars[int(index)].type() for index in index_list]))
+        elif command == Commands.SYNC_WRITE:
+            index, count = index_list
+            fmt_str += 'B' + ('B' + self.vars[index].type()) * count
+            ack_size = 0
+        elif command == Commands.BULK_WRITE:
+            fmt_str += ''.join(['BB' + ''.join(['B' + self.vars[int(index)].type() for index in block]) for block in index_list])
+            ack_size = 0
+        elif command == Commands.BULK_READ:
+            fmt_str += ''.join(['BB' + 'B' * len(block) for block in index_list])
+            ack_size = sum([self.__layout(Commands.READ, block)[1] for block in index_list])
+        else:
+            ack_size = self.__class__._PACKAGE_ESSENTIAL_SIZE + self.vars[Index.CRCValue].size()
+
+        Red._LAYOUTS[key] = (struct.Struct(fmt_str), ack_size)
+        return Red._LAYOUTS[key]
+
+    def __encode(self, body: struct.Struct, command, *args) -> bytes:
+        """ Pack a frame into the reusable buffer and append its CRC.
+
+        Args:
+            body (struct.Struct): Precompiled layout of the frame body
+            command (Commands): Command of the frame
+
+        Returns:
+            bytes: Frame ready to be written to the bus
+        """
+        self.vars.set(Index.Command, command)
+        size = 3 + body.size + _CRC_STRUCT.size
+        body.pack_into(self.__frame, 3, size, command, self.vars.get(Index.Status), *args)
+        crc = _crc32_mpeg2(self.__view[3:size - _CRC_STRUCT.size], self.__header_crc)
+        _CRC_STRUCT.pack_into(self.__frame, size - _CRC_STRUCT.size, crc)
+        self.vars.set(Index.CRCValue, crc)
+        return bytes(self.__view[:size])
+
+    def __encode_command(self, command, ack: bool) -> bytes:
+        body, ack_size = self.__layout(command)
+        self.__ack_size = ack_size if ack else 0
+        return self.__encode(body, command)
+
+    def __reply_layout(self, index_list: tuple):
+        """ Return the precompiled layout of a reply carrying the given indexes.
+        Layouts are shared by every Red instance since register types are fixed.
+
+        Args:
+            index_list (tuple): Indexes of the reply in order
+
+        Returns:
+            tuple: (function picking the index bytes of a reply, expected index bytes,
+                    reply size, struct.Struct of the values, (struct.Struct, offset in
+                    the register store, first value, end value) of each register)
+        """
+        try:
+            return Red._REPLIES[index_list]
+        except KeyError:
+            pass
+
+        layout = self.vars.layout()
+        positions = []
+        values_fmt = '<{}x'.format(self.__class__._PACKAGE_ESSENTIAL_SIZE)
+        fields = []
+        count = 0
+        offset = self.__class__._PACKAGE_ESSENTIAL_SIZE
+        for index in index_list:
+            positions.append(offset)
+            values_fmt += 'x' + layout.types[index]
+            if layout.rw[index]:
+                fields.append((layout.structs[index], layout.offsets[index], count, count + len(layout.types[index])))
+            count += len(layout.types[index])
+            offset += 1 + layout.sizes[index]
+
+        # itemgetter returns a single item instead of a tuple for a single position
+        expected = tuple([int(index) for index in index_list])
+        Red._REPLIES[index_list] = (operator.itemgetter(*positions), expected if len(expected) > 1 else expected[0],
+                                    offset + _CRC_STRUCT.size,
+                                    struct.Struct(values_fmt), tuple(fields))
+        return Red._REPLIES[index_list]
+
+    def parse_reply(self, data: bytes, index_list=None):
+        """ Store the index/value pairs of a reply which has passed the CRC check.
+        If the reply has the layout of the given indexes, all values are
+        decoded with one precompiled unpack_from and packed into the register
+        store as they are. Otherwise the reply is walked field by field.
+
+        Args:
+            data (bytes): Reply package in bytes
+            index_list (list, optional): Indexes expected in the reply. Defaults to
+                the indexes of the last get_variables or set_variables call.
+        """
+        reply = self.__reply if index_list is None else self.__reply_layout(tuple(index_list))
+        if (reply is not None) and (len(data) == reply[2]) and (reply[0](data) == reply[1]):
+            values = reply[3].unpack_from(data)
+            for packer, offset, start, end in reply[4]:
+                # Unpacking arguments is slow, most registers hold a single value
+                if end - start == 1:
+                    packer.pack_into(self.__values, offset, values[start])
+                else:
+                    packer.pack_into(self.__values, offset, *values[start:end])
+            return
+
+        view = memoryview(data)
+        layout = self.vars.layout()
+        fields = []
+        i = self.__class__._PACKAGE_ESSENTIAL_SIZE
+        end = len(view) - _CRC_STRUCT.size
+        while i < end:
+            size = layout.sizes[view[i]]
+            if i + 1 + size > end:
+                raise ValueError("Reply is shorter than its variables!")
+            if layout.rw[view[i]]:
+                fields.append((i + 1, layout.offsets[view[i]], size))
+            i += 1 + size
+        self.vars.load(view, fields)
+
     def set_variables(self, index_list=[], value_list=[], ack=False):
-        self.vars[Index.Command].value(Commands.WRITE_ACK if ack else Commands.WRITE)
+        command = Commands.WRITE_ACK if ack else Commands.WRITE
+        body, self.__ack_size = self.__layout(command, tuple(index_list))
+        self.__reply = self.__reply_layout(tuple(index_list)) if ack else None
 
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
+        args = []
         for index, value in zip(index_list, value_list):
-            self.vars[int(index)].value(value)
-            fmt_str += 'B' + self.vars[int(index)].type()
+            self.vars.set(index, value)
+            args.append(int(index))
+            value = self.vars.get(index)
+            if isinstance(value, list):
+                args.extend(value)
+            else:
+                args.append(value)
 
-        self.__ack_size = struct.calcsize(fmt_str)
+        return self.__encode(body, command, *args)
 
-        struct_out = list(struct.pack(fmt_str, *[*[var.value() for var in self.vars[:6]], *[val for pair in zip(index_list, [self.vars[int(index)].value() for index in index_list]) for val in pair]]))
+    def get_variables(self, index_list=[]):
+        body, self.__ack_size = self.__layout(Commands.READ, tuple(index_list))
+        self.__reply = self.__reply_layout(tuple(index_list))
+        return self.__encode(body, Commands.READ, *[int(idx) for idx in index_list])
 
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[int(Index.CRCValue)].size()
+    def bulk_write(self, id_idx_val_pairs: dict):
+        """ Build a BULK_WRITE frame. Values are packed as given, so they
+        should already be coerced by the Red instances of the target devices.
 
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+        Args:
+            id_idx_val_pairs (dict): {id: [[Index, value], ...]} for each device
+        """
+        blocks = tuple([tuple([pair[0] for pair in pairs]) for pairs in id_idx_val_pairs.values()])
+        body, self.__ack_size = self.__layout(Commands.BULK_WRITE, blocks)
+
+        args = []
+        for id, pairs in id_idx_val_pairs.items():
+            args += [id, len(pairs)]
+            for index, value in pairs:
+                args.append(int(index))
+                if isinstance(value, list):
+                    args.extend(value)
+                else:
+                    args.append(value)
 
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
-    
+        return self.__encode(body, Commands.BULK_WRITE, *args)
 
-    def get_variables(self, index_list=[]):
-        self.vars[Index.Command].value(Commands.READ)
+    def bulk_read(self, id_index_lists: dict):
+        """ Build a BULK_READ frame. Each device replies with its own frame
+        in the given order, the acknowledge size is the sum of the replies.
 
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        fmt_str += 'B' * len(index_list)
+        Args:
+            id_index_lists (dict): {id: [Index, ...]} for each device
+        """
+        blocks = tuple([tuple(index_list) for index_list in id_index_lists.values()])
+        body, self.__ack_size = self.__layout(Commands.BULK_READ, blocks)
 
-        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type()) \
-            + struct.calcsize('<' + ''.join(self.vars[idx].type() for idx in index_list))
+        args = []
+        for id, index_list in id_index_lists.items():
+            args += [id, len(index_list), *[int(index) for index in index_list]]
 
-        struct_out = list(struct.pack(fmt_str, *[*[var.value() for var in self.vars[:6]], *[int(idx) for idx in index_list]]))
+        return self.__encode(body, Commands.BULK_READ, *args)
 
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
+    def sync_write(self, index: Index, id_values: dict):
+        """ Build a SYNC_WRITE frame [Index, (ID, value)...], which writes
+        the same register of every given device.
 
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+        Args:
+            index (Index): Index written to every device
+            id_values (dict): {id: value} for each device
+        """
+        body, self.__ack_size = self.__layout(Commands.SYNC_WRITE, (int(index), len(id_values)))
 
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        args = [int(index)]
+        for id, value in id_values.items():
+            args.append(id)
+            if isinstance(value, list):
+                args.extend(value)
+            else:
+                args.append(value)
 
-    def reboot(self):
-        self.vars[Index.Command].value(Commands.REBOOT)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = 0
+        return self.__encode(body, Commands.SYNC_WRITE, *args)
 
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+    @classmethod
+    def _ping_frame(cls, ID: int) -> bytes:
+        """ Return the ping frame of any device ID without creating a Red instance. """
+        try:
+            return cls._PING_FRAMES[ID]
+        except KeyError:
+            pass
+        frame = struct.pack('<BBBBBB', cls._HEADER, ID, cls._PRODUCT_TYPE,
+                            cls._PACKAGE_ESSENTIAL_SIZE + _CRC_STRUCT.size, Commands.PING, 0)
+        cls._PING_FRAMES[ID] = frame + _CRC_STRUCT.pack(_crc32_mpeg2(frame))
+        return cls._PING_FRAMES[ID]
 
-    def factory_reset(self):
-        self.vars[Index.Command].value(Commands.HARD_RESET)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = 0
+    def reboot(self):
+        return self.__encode_command(Commands.REBOOT, ack=False)
 
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+    def factory_reset(self):
+        return self.__encode_command(Commands.HARD_RESET, ack=False)
 
     def EEPROM_write(self, ack=False):
-        self.vars[Index.Command].value(Commands.__EEPROM_WRITE_ACK if ack else Commands.EEPROM_WRITE)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type())
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        return self.__encode_command(Commands.__EEPROM_WRITE_ACK if ack else Commands.EEPROM_WRITE, ack=True)
 
     def ping(self):
-        self.vars[Index.Command].value(Commands.PING)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type())
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        return self.__encode_command(Commands.PING, ack=True)
 
     def reset_encoder(self):
-        self.vars[Index.Command].value(Commands.RESET_ENC)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type())
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        return self.__encode_command(Commands.RESET_ENC, ack=True)
 
     def tune(self):
-        self.vars[Index.Command].value(Commands.TUNE)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = 0
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        return self.__encode_command(Commands.TUNE, ack=False)
 
     def scan_modules(self):
-        self.vars[Index.Command].value(Commands.MODULE_SCAN)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = struct.calcsize(fmt_str + self.vars[Index.CRCValue].type())
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        return self.__encode_command(Commands.MODULE_SCAN, ack=True)
 
     def enter_bootloader(self):
-        self.vars[Index.Command].value(Commands.BL_JUMP)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in self.vars[:6]]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[Index.CRCValue].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        self.__ack_size = 0
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        return self.__encode_command(Commands.BL_JUMP, ack=False)
 
     def update_driver_id(self, id):
-        self.vars[Index.Command].value(Commands.WRITE)
-        fmt_str = '<' + ''.join([var.type() for var in self.vars[:6]])
-        fmt_str += 'B' + self.vars[int(Index.DeviceID)].type()
-        struct_out = list(struct.pack(fmt_str, *[*[var.value() for var in self.vars[:6]], int(Index.DeviceID), id]))
-        struct_out[int(Index.PackageSize)] = len(struct_out) + self.vars[int(Index.CRCValue)].size()
-        self.vars[Index.CRCValue].value(CRC32.calc(struct_out))
-        return bytes(struct_out) + struct.pack('<' + self.vars[Index.CRCValue].type(), self.vars[Index.CRCValue].value())
+        body, _ = self.__layout(Commands.WRITE, (Index.DeviceID,))
+        return self.__encode(body, Commands.WRITE, int(Index.DeviceID), id)
 
 
 class Master():
     _BROADCAST_ID = 0xFF
+    _TURNAROUND_TIME = 0.001
+    _SCAN_TIMEOUT = 0.025
+    _HOOK_EVENTS = ('pre_write', 'post_write', 'reply', 'error')
     __RELEASE_URL = "https://api.github.com/repos/Acrome-Smart-Motion-Devices/SMD-Red-Firmware/releases/{version}"
 
-    def __init__(self, portname, baudrate=115200) -> None:
+    def __init__(self, portname, baudrate=115200, reply_timeout=0.1) -> None:
+        """
+        Args:
+            portname (str | Transport): Serial port name, opened with a SerialTransport,
+                or an already opened transport.
+            baudrate (int, optional): Baudrate of the bus. Defaults to 115200.
+            reply_timeout (float, optional): Minimum time to wait for a reply in seconds,
+                see set_reply_timeout. Defaults to 0.1.
+        """
+        self.set_reply_timeout(reply_timeout)
         self.__attached_drivers = []
         self.__driver_list = [Red(255)] * 256
         if baudrate > 12500000 or baudrate < 3053:
@@ -294,7 +470,34 @@ class Master():
             self.__baudrate = baudrate
             self.__post_sleep = (10 / self.__baudrate) * 12
             self.__device_init_sleep = 6 #seconds
-            self.__ph = serial.Serial(port=portname, baudrate=self.__baudrate, timeout=0.1)
+            if isinstance(portname, Transport):
+                self.__ph = portname
+            else:
+                self.__ph = SerialTransport(portname, self.__baudrate)
+        self.__portname = self.__ph.name
+        self.__broadcast = Red(self.__class__._BROADCAST_ID)
+        self.__next_write = 0.0
+        self.__tx_size = 0
+        self.__in_flight = dict()
+        self.__window = 1
+        self.__rx_end = 0.0
+        self.__receiver = _FrameReceiver(Red._HEADER, Red._PRODUCT_TYPE, Red._PACKAGE_ESSENTIAL_SIZE + _CRC_STRUCT.size)
+        self.__bus_lock = threading.RLock()
+        self.__poller = None
+        self.__poll_stop = threading.Event()
+        self.__snapshot = dict()
+        self.__polling = dict()
+        self.__instruments = None
+        self.__instrumentation = None
+        self.__hooks = None
+        self.__hooked_requests = dict()
+        self.__hooked_last = (0, 0, b'')
+        self.__capture = None
+        self.__cache_policy = list(Red._REGISTERS.cache)
+        self.__cache = dict()
+        self.__cache_lock = threading.Lock()
+        self.reset_cache_stats()
+        self.reset_pacing_stats()
 
     def __del__(self):
         try:
@@ -304,12 +507,555 @@ class Master():
         except Exception as e:
             raise e
 
+    def __pace(self):
+        """ Wait until the previous package has left the UART and the
+        minimum inter-package gap has passed. Nothing is waited if the
+        caller already spent that time elsewhere.
+        """
+        delay = self.__next_write - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+            self.__pacing['paced'] += 1
+            self.__pacing['wait_time'] += delay
+
     def __write_bus(self, data):
+        with self.__bus_lock:
+            if self.__in_flight:
+                self.flush_pipeline()
+            self.__drain()
+            self.__send(data)
+
+    def __send(self, data):
+        self.__pace()
+        if self.__hooks is None:
+            self.__ph.write(data)
+        else:
+            self.__write_hooked(data)
+        if self.__capture is not None:
+            self.__capture.record(0, data)
+        if self.__instruments is not None:
+            self.__instruments.sent(data)
+        self.__tx_size = len(data)
+        # The package is on the wire for 10 bits per byte, the gap starts afterwards
+        self.__next_write = time.perf_counter() + len(data) * 10 / self.__baudrate + self.__post_sleep
+        self.__pacing['packages'] += 1
+
+    def __write_hooked(self, data):
+        """ Write a package and call the pre-write and post-write hooks around it. """
+        frame = memoryview(data)
+        id, command = data[Index.DeviceID], data[Index.Command]
+        start = time.perf_counter_ns()
+        for hook in self.__hooks['pre_write']:
+            hook(frame, id, command, start, start)
         self.__ph.write(data)
+        end = time.perf_counter_ns()
+        for hook in self.__hooks['post_write']:
+            hook(frame, id, command, start, end)
+
+        self.__hooked_last = (command, start, frame)
+        if id == self.__class__._BROADCAST_ID:
+            self.__hooked_requests.clear()
+        else:
+            self.__hooked_requests[id] = self.__hooked_last
+
+    def __drain(self):
+        """ Move the bytes waiting on the port to the receiver and drop
+        them, since nothing is expected before the next package is sent.
+        """
+        waiting = self.__ph.in_waiting
+        if waiting:
+            self.__fill(waiting, 0)
+        while self.__receiver.next_frame(flush=True) is not None:
+            self.__receiver.stale += 1
+
+    def __fill(self, size: int, timeout: float) -> int:
+        """ Read at most size bytes into the receiver, waiting at most timeout seconds. """
+        region = self.__receiver.writable(size)
+        n = self.__ph.readinto(region, timeout)
+        self.__receiver.commit(n)
+        if self.__instruments is not None:
+            self.__instruments.received(n)
+        if (self.__capture is not None) and n:
+            self.__capture.record(1, region[:n])
+        return n
+
+    def __receive(self, ids, size: int, timeout=None) -> dict:
+        """ Receive the reply packages of the given device IDs. Waits at
+        most the time needed to transmit the last package and the replies,
+        or the minimum reply timeout if it is longer. Replies which are
+        complete are returned as soon as they arrive.
+
+        Args:
+            ids (iterable): Device IDs expected to reply
+            size (int): Total size of the expected replies in bytes
+            timeout (float, optional): Time to wait instead of the transaction timeout. Defaults to None.
+
+        Returns:
+            dict: {id: package} of the replies which passed the CRC check
+        """
+        replies = dict()
+        received = 0
+        filled = 0
+        observed = (self.__instruments is not None) or (self.__hooks is not None)
+        crc_errors = self.__receiver.crc_errors
+        if timeout is None:
+            timeout = self.__transaction_timeout(self.__tx_size, size)
+        deadline = time.perf_counter() + timeout
+        while len(replies) < len(ids):
+            frame = self.__receiver.next_frame()
+            if frame is None:
+                if timeout > 0:
+                    filled += self.__fill(max(size - received - self.__receiver.available(), 1), timeout)
+                    timeout = deadline - time.perf_counter()
+                    continue
+                frame = self.__receiver.next_frame(flush=True)
+                if frame is None:
+                    break
+
+            id = frame[Index.DeviceID]
+            if (id in ids) and (id not in replies):
+                replies[id] = frame
+                received += len(frame)
+                if observed:
+                    self.__replied(id, frame)
+            else:
+                self.__receiver.stale += 1
+
+        if observed and (len(replies) < len(ids)):
+            self.__failed(ids, replies, self.__receiver.crc_errors - crc_errors, filled - received)
+
+        if len(replies) == len(ids):
+            # A complete reply means the bus is idle and the driver is ready
+            self.__next_write = time.perf_counter()
+        return replies
+
+    def set_pipeline_window(self, window: int):
+        """ Set the maximum number of pipelined requests in flight.
+        Requests in flight go to different drivers, and the next request
+        is written before the replies of the previous ones arrive. The
+        default window of 1 suits a half-duplex RS-485 bus, where a request
+        written while replies are coming in collides with them. Larger
+        windows need a bus which carries requests and replies separately.
+
+        Args:
+            window (int): Maximum number of requests in flight
+
+        Raises:
+            ValueError: Window is smaller than 1
+        """
+        if window < 1:
+            raise ValueError("Pipeline window must be at least 1!")
+        self.__window = window
+
+    def get_variables_future(self, id: int, index_list: list) -> Future:
+        """ Send a read request without waiting for the reply. Replies are
+        matched to requests by device ID and command, and the returned
+        future is resolved when its reply is received or times out. If the
+        window is full or a request to the same driver is in flight, this
+        method first receives replies until a slot is free.
+
+        Args:
+            id (int): The device ID of the driver
+            index_list (list): A list containing the Indexes to read
+
+        Raises:
+            ValueError: Device ID is not valid
+            IndexError: The given list is empty
+
+        Returns:
+            Future: Resolves to the list of read values, or None if the driver did not reply.
+        """
+        self.__check_attached((id,))
+        if len(index_list) == 0:
+            raise IndexError("Given index list is empty!")
+
+        with self.__bus_lock:
+            while (len(self.__in_flight) >= self.__window) or (id in self.__in_flight):
+                self.__pump()
+
+            driver = self.__driver_list[id]
+            self.__send(driver.get_variables(index_list))
+
+            # Replies leave the drivers one after the other once the request is on the wire
+            tx_end = self.__next_write - self.__post_sleep
+            self.__rx_end = max(tx_end, self.__rx_end) + driver.get_ack_size() * 10 / self.__baudrate
+            future = Future()
+            self.__in_flight[id] = (Commands.READ, future, index_list, driver.get_ack_size(),
+                                    max(self.__rx_end + self.__class__._TURNAROUND_TIME,
+                                        time.perf_counter() + self.__reply_timeout))
+            return future
+
+    def flush_pipeline(self):
+        """ Receive the replies of every pipelined request in flight. """
+        with self.__bus_lock:
+            while self.__in_flight:
+                self.__pump()
+
+    def get_variables_pipelined(self, id_index_lists: dict) -> dict:
+        """ Get variables from many drivers, keeping up to the pipeline
+        window of requests in flight instead of waiting for each reply
+        before sending the next request.
+
+        Args:
+            id_index_lists (dict): {id: [Index, ...]} for each driver
+
+        Returns:
+            dict: {id: list | None} Read values of each driver, None if the driver did not reply.
+        """
+        with self.__bus_lock:
+            futures = {id: self.get_variables_future(id, index_list) for id, index_list in id_index_lists.items()}
+            self.flush_pipeline()
+        return {id: future.result() for id, future in futures.items()}
+
+    def __dispatch(self, frame: bytes) -> bool:
+        """ Resolve the pipelined request which the frame replies to.
+
+        Returns:
+            bool: True if the frame matched a request in flight
+        """
+        id = frame[Index.DeviceID]
+        request = self.__in_flight.get(id)
+        if (request is None) or ((frame[Index.Command] & 0x7F) != (request[0] & 0x7F)):
+            return False
+
+        del self.__in_flight[id]
+        if (self.__instruments is not None) or (self.__hooks is not None):
+            self.__replied(id, frame)
+        self.__parse(frame, request[2])
+        request[1].set_result([self.__driver_list[id].vars[index].value() for index in request[2]])
+        return True
+
+    def __dispatch_all(self):
+        frame = self.__receiver.next_frame()
+        while frame is not None:
+            if not self.__dispatch(frame):
+                self.__receiver.stale += 1
+            frame = self.__receiver.next_frame()
+
+    def __pump(self):
+        """ Receive replies until the oldest request in flight is resolved or expires. """
+        id, oldest = next(iter(self.__in_flight.items()))
+        timeout = max(oldest[4] - time.perf_counter(), 0)
+        self.__fill(max(oldest[3] - self.__receiver.available(), 1), timeout)
+        self.__dispatch_all()
+
+        if (id in self.__in_flight) and (time.perf_counter() >= oldest[4]):
+            # Take whatever else has arrived before giving up, later requests keep their own deadlines
+            self.__fill(sum([request[3] for request in self.__in_flight.values()]), 0)
+            self.__dispatch_all()
+            if id in self.__in_flight:
+                del self.__in_flight[id]
+                if (self.__instruments is not None) or (self.__hooks is not None):
+                    self.__failed((id,), dict(), 0, self.__receiver.available())
+                oldest[1].set_result(None)
+
+        if not self.__in_flight:
+            self.__next_write = time.perf_counter()
+
+    def __replied(self, id: int, frame):
+        """ Pass the reply of the driver with the given ID to the instruments and the reply hooks. """
+        if self.__instruments is not None:
+            self.__instruments.acked(id)
+        if self.__hooks is not None:
+            now = time.perf_counter_ns()
+            start = self.__hooked_requests.pop(id, self.__hooked_last)[1]
+            view = memoryview(frame)
+            for hook in self.__hooks['reply']:
+                hook(view, id, frame[Index.Command], start, now)
+
+    def __failed(self, ids, replies: dict, crc_errors: int, unmatched: int):
+        """ Pass the missing replies of a transaction to the instruments and
+        the error hooks, with their most likely reason.
+        """
+        for id in ids:
+            if id in replies:
+                continue
+            if crc_errors > 0:
+                crc_errors -= 1
+                reason = 'crc_errors'
+            elif unmatched > 0:
+                reason = 'short_reads'
+            else:
+                reason = 'timeouts'
+
+            if self.__instruments is not None:
+                self.__instruments.failed(id, reason)
+            if self.__hooks is not None:
+                now = time.perf_counter_ns()
+                command, start, frame = self.__hooked_requests.pop(id, self.__hooked_last)
+                for hook in self.__hooks['error']:
+                    hook(frame, id, command, start, now, reason)
+
+    def add_hook(self, event: str, hook):
+        """ Register a function which is called on every bus transaction
+        event. Hooks are called in the thread of the transaction with the
+        bus locked, so they should return quickly. Exceptions raised by a
+        hook propagate to the caller of the master method.
+
+        Every hook is called as hook(frame, id, command, start, now) where
+        frame is a memoryview of the package, id and command are taken from
+        it, start is the time the request started to be written and now is
+        the time of the event, both from time.perf_counter_ns().
+
+        - pre_write: just before a package is written
+        - post_write: just after a package is written
+        - reply: a reply passed the CRC check, frame is the reply
+        - error: a reply did not arrive, frame is the request and id is the
+          missing driver. It also gets reason, one of 'crc_errors',
+          'short_reads' or 'timeouts'.
+
+        Args:
+            event (str): One of 'pre_write', 'post_write', 'reply' or 'error'
+            hook (function): Function to call
+
+        Raises:
+            ValueError: Event is not valid
+        """
+        if event not in self.__class__._HOOK_EVENTS:
+            raise ValueError("{} is not a valid hook event!".format(event))
+
+        with self.__bus_lock:
+            hooks = {name: list(self.__hooks[name]) if self.__hooks else [] for name in self.__class__._HOOK_EVENTS}
+            hooks[event].append(hook)
+            self.__hooks = hooks
+
+    def remove_hook(self, event: str, hook):
+        """ Unregister a hook added with add_hook. Nothing happens if the hook is not registered.
+
+        Args:
+            event (str): One of 'pre_write', 'post_write', 'reply' or 'error'
+            hook (function): Function to remove
+        """
+        with self.__bus_lock:
+            if (self.__hooks is None) or (hook not in self.__hooks.get(event, [])):
+                return
+            hooks = {name: list(callbacks) for name, callbacks in self.__hooks.items()}
+            hooks[event].remove(hook)
+            # Without any hook the transactions skip the hook calls entirely
+            self.__hooks = hooks if any(hooks.values()) else None
+            if self.__hooks is None:
+                self.__hooked_requests.clear()
+
+    def enable_instrumentation(self, enable=True):
+        """ Start or stop counting the transactions of the master. While
+        enabled, packages, replies, failures and bytes are counted per
+        device ID and command, and reply latencies are recorded into
+        histograms. Disabled instrumentation costs a single check per
+        package. Enabling again keeps the previous counts.
+
+        Args:
+            enable (bool, optional): Enable. Defaults to True.
+        """
+        with self.__bus_lock:
+            if enable and (self.__instrumentation is None):
+                self.__instrumentation = Instruments()
+            self.__instruments = self.__instrumentation if enable else None
+
+    def get_instrumentation(self) -> dict:
+        """ Get a snapshot of the transaction counters and latency histograms.
+
+        Returns:
+            dict | None: enabled, bytes_in, bytes_out, totals, latency, ids and commands
+                         (see smd.instrumentation.Instruments.snapshot), None if never enabled.
+        """
+        with self.__bus_lock:
+            if self.__instrumentation is None:
+                return None
+            snapshot = self.__instrumentation.snapshot()
+            snapshot['enabled'] = self.__instruments is not None
+        return snapshot
+
+    def reset_instrumentation(self):
+        """ Clear the transaction counters and latency histograms. """
+        with self.__bus_lock:
+            if self.__instrumentation is not None:
+                self.__instrumentation.reset()
+
+    def start_capture(self, path: str, buffer_size=1 << 20):
+        """ Start recording every written package and every read chunk
+        of bytes with a nanosecond timestamp into a capture file. Records
+        are packed into a preallocated buffer which is written to the file
+        only when it is full, so capturing does not slow the transactions
+        down. A running capture is stopped first. The capture can be
+        analyzed with the smd-capture command (see smd.capture).
+
+        Args:
+            path (str): Capture file, created or truncated
+            buffer_size (int, optional): Bytes buffered before writing to the file. Defaults to 1 MiB.
+        """
+        from smd.capture import CaptureWriter
+        with self.__bus_lock:
+            self.stop_capture()
+            self.__capture = CaptureWriter(path, self.__baudrate, buffer_size)
+
+    def stop_capture(self):
+        """ Stop recording and close the capture file. """
+        with self.__bus_lock:
+            if self.__capture is not None:
+                self.__capture.close()
+                self.__capture = None
+
+    def get_pacing_stats(self) -> dict:
+        """ Get the counters of the package pacing. Packages are only
+        delayed when they would start before the previous package has
+        been transmitted and the inter-package gap has passed, instead
+        of sleeping a fixed time after every call.
+
+        Returns:
+            dict: packages (written packages), paced (packages that had to wait),
+                  wait_time (total seconds waited), saved_time (seconds saved against
+                  a fixed sleep after every package)
+        """
+        stats = dict(self.__pacing)
+        stats['saved_time'] = stats['packages'] * self.__post_sleep - stats['wait_time']
+        return stats
+
+    def reset_pacing_stats(self):
+        """ Reset the package pacing counters. """
+        self.__pacing = dict(packages=0, paced=0, wait_time=0.0)
+
+    def start_polling(self, id_index_lists: dict, rate_hz: float, telemetry=None):
+        """ Start a background thread which reads the given variables
+        with BULK_READ packages at the given rate. Every cycle publishes
+        a new snapshot of the latest values, so other threads can read
+        them with get_snapshot without touching the bus. Other methods
+        of the master may be called while polling, their transactions
+        are serialized with the ones of the poller.
 
-    def __read_bus(self, size) -> bytes:
-        self.__ph.reset_input_buffer()
-        return self.__ph.read(size=size)
+        If a cycle takes longer than a period, the next cycle starts late.
+        Once a cycle is late by a whole period, the missed cycles are
+        dropped instead of being run back to back.
+
+        If a telemetry writer is given, every cycle also writes the values
+        into its shared memory segment, for readers in other processes.
+
+        Args:
+            id_index_lists (dict): {id: [Index, ...]} for each driver
+            rate_hz (float): Polling rate in cycles per second
+            telemetry (TelemetryWriter, optional): Segment to publish the values in. Defaults to None.
+
+        Raises:
+            ValueError: Device ID or rate is not valid, or a driver has no record in the segment
+            IndexError: A given list is empty
+        """
+        self.__check_attached(id_index_lists.keys())
+        for id, index_list in id_index_lists.items():
+            if len(index_list) == 0:
+                raise IndexError("Given index list of ID {} is empty!".format(id))
+            if (telemetry is not None) and (id not in telemetry.ids):
+                raise ValueError("ID {} has no record in the telemetry segment!".format(id))
+
+        if rate_hz <= 0:
+            raise ValueError("Polling rate must be positive!")
+
+        self.stop_polling()
+        self.__snapshot = dict()
+        self.__polling = dict(rate_hz=rate_hz, cycles=0, dropped=0, no_reply=0, errors=0,
+                              start=time.perf_counter(), intervals=0, interval_sum=0.0,
+                              interval_sqsum=0.0, max_lateness=0.0)
+        self.__poll_stop.clear()
+        self.__poller = threading.Thread(target=self.__poll,
+                                         args=({id: list(index_list) for id, index_list in id_index_lists.items()}, 1 / rate_hz,
+                                               telemetry),
+                                         daemon=True)
+        self.__poller.start()
+
+    def stop_polling(self):
+        """ Stop the polling thread and wait for its current cycle to finish.
+        The last snapshot stays available.
+        """
+        if self.__poller is not None:
+            self.__poll_stop.set()
+            self.__poller.join()
+            self.__poller = None
+            self.__polling['end'] = time.perf_counter()
+
+    def __poll(self, id_index_lists: dict, period: float, telemetry):
+        stats = self.__polling
+        next_cycle = time.perf_counter()
+        last_start = None
+        while not self.__poll_stop.is_set():
+            start = time.perf_counter()
+            stats['max_lateness'] = max(stats['max_lateness'], start - next_cycle)
+            if last_start is not None:
+                interval = start - last_start
+                stats['intervals'] += 1
+                stats['interval_sum'] += interval
+                stats['interval_sqsum'] += interval * interval
+            last_start = start
+
+            try:
+                values = self.get_variables_bulk(id_index_lists)
+            except Exception:
+                stats['errors'] += 1
+                values = dict()
+
+            # Readers hold a reference to the previous snapshot, so a new one is published instead of updating it
+            timestamp = time.perf_counter()
+            wall_time = time.time()
+            snapshot = dict(self.__snapshot)
+            for id, value_list in values.items():
+                if value_list is None:
+                    stats['no_reply'] += 1
+                else:
+                    snapshot[id] = (timestamp, dict(zip(id_index_lists[id], value_list)))
+                    if telemetry is not None:
+                        telemetry.update(id, snapshot[id][1], wall_time)
+            self.__snapshot = snapshot
+            stats['cycles'] += 1
+
+            next_cycle += period
+            now = time.perf_counter()
+            if now - next_cycle >= period:
+                missed = int((now - next_cycle) / period)
+                stats['dropped'] += missed
+                next_cycle += missed * period
+            self.__poll_stop.wait(max(next_cycle - now, 0))
+
+    def get_snapshot(self, id=None):
+        """ Get the latest values published by the polling thread. This
+        method never waits for the bus.
+
+        Args:
+            id (int, optional): The device ID of the driver. Defaults to None.
+
+        Returns:
+            tuple | dict | None: (timestamp, {Index: value}) of the driver, None if it has not
+                                 replied yet. If id is not given, a dictionary of these tuples
+                                 for every driver. Timestamps are time.perf_counter() values.
+        """
+        snapshot = self.__snapshot
+        if id is None:
+            return dict(snapshot)
+        return snapshot.get(id)
+
+    def get_polling_stats(self) -> dict:
+        """ Get the statistics of the polling thread.
+
+        Returns:
+            dict: rate_hz (requested rate), achieved_hz (cycles per second since start),
+                  jitter (standard deviation of the time between cycle starts in seconds),
+                  max_lateness (largest delay of a cycle start from its schedule in seconds),
+                  cycles, dropped (cycles skipped because of overruns),
+                  no_reply (missing replies), errors (cycles which raised an exception)
+        """
+        stats = self.__polling
+        if not stats:
+            return dict()
+
+        n = stats['intervals']
+        jitter = 0.0
+        if n > 1:
+            mean = stats['interval_sum'] / n
+            jitter = max(stats['interval_sqsum'] / n - mean * mean, 0) ** 0.5
+        return dict(rate_hz=stats['rate_hz'],
+                    achieved_hz=stats['cycles'] / max(stats.get('end', time.perf_counter()) - stats['start'], 1e-9),
+                    jitter=jitter,
+                    max_lateness=stats['max_lateness'],
+                    cycles=stats['cycles'],
+                    dropped=stats['dropped'],
+                    no_reply=stats['no_reply'],
+                    errors=stats['errors'])
 
     def attached(self):
         """ Return the scanned drivers
@@ -381,11 +1127,10 @@ class Master():
                     time.sleep(0.1)
 
                     # Close serial port
-                    serial_settings = self.__ph.get_settings()
                     self.__ph.close()
 
                     # Upload binary
-                    args = ['-p', self.__ph.portstr, '-b', str(115200), '-e', '-w', '-v', fw_file.name]
+                    args = ['-p', self.__ph.name, '-b', str(115200), '-e', '-w', '-v', fw_file.name]
                     stm32loader_main(*args)
 
                     # Delete uploaded binary
@@ -393,8 +1138,9 @@ class Master():
                         fw_file.close()
 
                     # Re open port to the user with saved settings
-                    self.__ph.apply_settings(serial_settings)
                     self.__ph.open()
+                    # The new firmware may start with other register values
+                    self.__invalidate(id)
                     return True
 
                 else:
@@ -422,9 +1168,7 @@ class Master():
             raise ValueError("{br} is not in acceptable range!")
 
         self.set_variables(id, [[Index.Baudrate, br]])
-        time.sleep(self.__post_sleep)
         self.eeprom_write(id)
-        time.sleep(self.__post_sleep)
         self.reboot(id)
         time.sleep(self.__device_init_sleep)
 
@@ -454,15 +1198,15 @@ class Master():
             raise ValueError("{br} is not in acceptable range!")
 
         try:
-            self.__ph.reset_input_buffer()
-            self.__ph.reset_output_buffer()
-            settings = self.__ph.get_settings()
-            self.__ph.close()
-            settings['baudrate'] = br
-            self.__ph.apply_settings(settings)
-            self.__ph.open()
-
-            self.__post_sleep = (10 / br) * 12
+            with self.__bus_lock:
+                self.__pace()
+                self.__ph.reset_input_buffer()
+                self.__ph.reset_output_buffer()
+                self.__ph.set_baud(br)
+                self.__receiver.clear()
+
+                self.__baudrate = br
+                self.__post_sleep = (10 / br) * 12
             
 
         except Exception as e:
@@ -475,6 +1219,7 @@ class Master():
             driver (Red): Driver to be attached
         """
         self.__driver_list[driver.vars[Index.DeviceID].value()] = driver
+        self.__invalidate(driver.vars[Index.DeviceID].value())
 
     def detach(self, id: int):
         """ Detach the SMD driver with given ID from master driver list.
@@ -489,6 +1234,7 @@ class Master():
             raise ValueError("{} is not a valid ID!".format(id))
 
         self.__driver_list[id] = Red(255)
+        self.__invalidate(id)
 
     def set_variables(self, id: int, idx_val_pairs=[], ack=False):
         """ Set variables on the driver with given ID
@@ -524,11 +1270,14 @@ class Master():
         except Exception as e:
             raise Exception(" Raised {} with args {}".format(e, e.args))
 
-        self.__write_bus(self.__driver_list[id].set_variables(index_list, value_list, ack))
-        if ack:
-            if self.__read_ack(id):
-                return [self.__driver_list[id].vars[index].value() for index in index_list]
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__invalidate(id, index_list)
+            self.__write_bus(self.__driver_list[id].set_variables(index_list, value_list, ack))
+            if ack:
+                if self.__read_ack(id):
+                    # The driver has acknowledged the values, so they are cached as written
+                    self.__cache_values(id, index_list)
+                    return [self.__driver_list[id].vars[index].value() for index in index_list]
         return None
 
     def get_variables(self, id: int, index_list: list):
@@ -558,32 +1307,118 @@ class Master():
         if len(index_list) == 0:
             raise IndexError("Given index list is empty!")
 
-        self.__write_bus(self.__driver_list[id].get_variables(index_list))
-
-        if self.__read_ack(id):
+        if self.__cached(id, index_list):
             return [self.__driver_list[id].vars[index].value() for index in index_list]
-        else:
-            return None
 
-    def __parse(self, data: bytes):
-        """ Parse the data which has passed the CRC check
+        with self.__bus_lock:
+            self.__write_bus(self.__driver_list[id].get_variables(index_list))
+
+            if self.__read_ack(id):
+                self.__cache_values(id, index_list)
+                return [self.__driver_list[id].vars[index].value() for index in index_list]
+            else:
+                return None
+
+    def __cached(self, id: int, index_list: list) -> bool:
+        """ Return True if every given register of the driver may be read
+        from its cached value. Reads of registers which are never cached
+        are not counted in the cache statistics.
+        """
+        policy = self.__cache_policy
+        for index in index_list:
+            if policy[int(index)] == CachePolicy.NEVER:
+                return False
+        now = time.perf_counter()
+        with self.__cache_lock:
+            for index in index_list:
+                if self.__cache.get((id, int(index)), 0.0) <= now:
+                    self.__cache_stats['misses'] += 1
+                    return False
+            self.__cache_stats['hits'] += 1
+        return True
+
+    def __cache_values(self, id: int, index_list: list):
+        """ Mark the values of the driver as valid until their policy expires. """
+        now = time.perf_counter()
+        with self.__cache_lock:
+            for index in index_list:
+                ttl = self.__cache_policy[int(index)]
+                if ttl != CachePolicy.NEVER:
+                    self.__cache[(id, int(index))] = now + ttl
+
+    def __invalidate(self, id: int, index_list=None):
+        """ Drop the cached values of the given registers of a driver, or all of its registers.
+        Packages to the broadcast ID reach every driver, so they drop the values of every driver.
+        """
+        with self.__cache_lock:
+            if not self.__cache:
+                return
+            broadcast = (id == self.__class__._BROADCAST_ID)
+            if index_list is None:
+                keys = [key for key in self.__cache if broadcast or (key[0] == id)]
+            else:
+                indexes = set([int(index) for index in index_list])
+                keys = [key for key in self.__cache if (broadcast or (key[0] == id)) and (key[1] in indexes)]
+            for key in keys:
+                del self.__cache[key]
+            self.__cache_stats['invalidations'] += len(keys)
+
+    def set_cache_policy(self, index: Index, policy: float):
+        """ Change the cache policy of a register for this master. Cached
+        values of the register are dropped.
 
         Args:
-            data (bytes): Input data package in bytes
+            index (Index): Register index
+            policy (float): CachePolicy.NEVER, CachePolicy.UNTIL_WRITE or a TTL in seconds
+
+        Raises:
+            ValueError: Policy is negative
+        """
+        if policy < 0:
+            raise ValueError("Cache policy must be a TTL in seconds!")
+        with self.__cache_lock:
+            self.__cache_policy[int(index)] = policy
+            for key in [key for key in self.__cache if key[1] == int(index)]:
+                del self.__cache[key]
+
+    def get_cache_policy(self, index: Index) -> float:
+        """ Return the cache policy of a register, see set_cache_policy. """
+        return self.__cache_policy[int(index)]
+
+    def clear_cache(self, id=None):
+        """ Drop the cached values of a driver, or of every driver if no ID is given. """
+        if id is None:
+            with self.__cache_lock:
+                self.__cache.clear()
+        else:
+            self.__invalidate(id)
+
+    def get_cache_stats(self) -> dict:
+        """ Get the counters of the register cache.
+
+        Returns:
+            dict: hits (reads served from the cache), misses (reads of cacheable registers
+                  which went to the bus), invalidations (cached values dropped by writes,
+                  reboots and resets) and entries (currently cached values)
         """
+        with self.__cache_lock:
+            stats = dict(self.__cache_stats)
+            stats['entries'] = len(self.__cache)
+        return stats
 
-        id = data[Index.DeviceID]
-        data = data[6:-4]
+    def reset_cache_stats(self):
+        """ Reset the register cache counters. """
+        self.__cache_stats = dict(hits=0, misses=0, invalidations=0)
 
-        i = 0
-        while i < len(data):
-            fmt_str = '<B' + self.__driver_list[id].vars[data[i]].type()
+    def __parse(self, data: bytes, index_list=None):
+        """ Parse the data which has passed the CRC check
 
-            sdata = data[i: i + self.__driver_list[id].vars[data[i]].size() + 1]
-            unpacked = list(struct.unpack(fmt_str, sdata))
+        Args:
+            data (bytes): Input data package in bytes
+            index_list (list, optional): Indexes requested from the driver. Defaults to None.
+        """
 
-            self.__driver_list[id].vars[unpacked[0]].value(unpacked[1] if len(unpacked) <= 2 else unpacked[1::])
-            i += self.__driver_list[id].vars[data[i]].size() + 1
+        self.__driver_list[data[Index.DeviceID]].parse_reply(data, index_list)
 
     def __read_ack(self, id: int) -> bool:
         """ Read acknowledge data from the driver with given ID.
@@ -595,74 +1430,337 @@ class Master():
             bool: Return True if acknowledge is read and correct.
         """
 
-        ret = self.__read_bus(self.__driver_list[id].get_ack_size())
-        if len(ret) == self.__driver_list[id].get_ack_size():
-            if CRC32.calc(ret[:-4]) == struct.unpack('<I', ret[-4:])[0]:
-                if ret[int(Index.PackageSize)] > 10:
-                    self.__parse(ret)
-                    return True
-                else:
-                    return True  # Ping package
-            else:
-                return False
-        else:
+        ret = self.__receive((id,), self.__driver_list[id].get_ack_size()).get(id)
+        if ret is None:
             return False
 
+        if ret[int(Index.PackageSize)] > 10:
+            self.__parse(ret)
+        return True
+
     def set_variables_sync(self, index: Index, id_val_pairs=[]):
-        dev = Red(self.__class__._BROADCAST_ID)
-        dev.vars[Index.Command].value(Commands.SYNC_WRITE)
+        self.__sync_write(index, {pair[0]: pair[1] for pair in id_val_pairs})
 
-        fmt_str = '<' + ''.join([var.type() for var in dev.vars[:6]])
-        struct_out = list(struct.pack(fmt_str, *[var.value() for var in dev.vars[:6]]))
+    def set_variables_sync_multi(self, id_idx_val_pairs: dict):
+        """ Set several variables on many drivers with one SYNC_WRITE
+        package per index. Every driver which writes an index shares its
+        package, so a coordinated move of N axes costs one package per
+        register instead of one per register and driver. Each driver
+        receives its registers in the given order. Packages are split
+        when they do not fit in the maximum package size.
 
-        fmt_str += 'B'
-        struct_out += list(struct.pack('<B', int(index)))
+        Args:
+            id_idx_val_pairs (dict): {id: [[Index, value], ...]} for each driver
 
-        for pair in id_val_pairs:
-            fmt_str += 'B'
-            struct_out += list(struct.pack('<B', pair[0]))
-            struct_out += list(struct.pack('<' + dev.vars[index].type(), pair[1]))
+        Raises:
+            ValueError: Device ID is not valid or data does not fit in a package
+            IndexError: A given list is empty
+        """
+        self.__check_attached(id_idx_val_pairs.keys())
+        for id, pairs in id_idx_val_pairs.items():
+            if len(pairs) == 0:
+                raise IndexError("Given index, value pair list of ID {} is empty!".format(id))
+
+        # The values are stored in the drivers shared with other threads, e.g. the poller
+        with self.__bus_lock:
+            for id, pairs in id_idx_val_pairs.items():
+                driver = self.__driver_list[id]
+                for index, value in pairs:
+                    driver.vars[int(index)].value(value)
+
+            id_index_lists = {id: [int(pair[0]) for pair in pairs] for id, pairs in id_idx_val_pairs.items()}
+            for index, ids in self.__sync_order(id_index_lists):
+                self.__sync_write(Index(index), {id: self.__driver_list[id].vars[index].value() for id in ids})
+
+    @staticmethod
+    def __sync_order(id_index_lists: dict) -> list:
+        """ Order the indexes of several drivers into SYNC_WRITE packages
+        which keep the order of every driver. Each package writes an index
+        which is next for its drivers and which no driver writes later,
+        unless the orders of the drivers conflict.
 
-        struct_out[int(Index.PackageSize)] = len(struct_out) + dev.vars[Index.CRCValue].size()
-        dev.vars[Index.CRCValue].value(CRC32.calc(struct_out))
+        Args:
+            id_index_lists (dict): {id: [index, ...]} in the order of each driver
 
-        self.__write_bus(bytes(struct_out) + struct.pack('<' + dev.vars[Index.CRCValue].type(), dev.vars[Index.CRCValue].value()))
-        time.sleep(self.__post_sleep)
+        Returns:
+            list: [(index, [id, ...]), ...] in the order to be sent
+        """
+        remaining = {id: list(index_list) for id, index_list in id_index_lists.items() if index_list}
+        packages = []
+        while remaining:
+            heads = list(dict.fromkeys([index_list[0] for index_list in remaining.values()]))
+            later = set()
+            for index_list in remaining.values():
+                later.update(index_list[1:])
+            index = next((head for head in heads if head not in later), heads[0])
+            ids = [id for id, index_list in remaining.items() if index_list[0] == index]
+            packages.append((index, ids))
+            for id in ids:
+                remaining[id].pop(0)
+                if not remaining[id]:
+                    del remaining[id]
+        return packages
+
+    def __sync_write(self, index: Index, id_values: dict):
+        record_size = 1 + self.__broadcast.vars[int(index)].size()
+        chunks = self.__split_blocks(id_values, lambda value: record_size, 1)
+        # Frames are built in the broadcast driver, which bulk reads of other threads share
+        with self.__bus_lock:
+            for id in id_values:
+                self.__invalidate(id, [index])
+            for chunk in chunks:
+                self.__write_bus(self.__broadcast.sync_write(index, chunk))
+
+    def __split_blocks(self, blocks: dict, block_size, overhead=0) -> list:
+        """ Split per-device blocks into chunks which fit in one package.
 
-    def __set_variables_bulk(self, id: int):
-        raise NotImplementedError()
+        Args:
+            blocks (dict): {id: block} pairs in bus order
+            block_size (function): Returns the size of a block in bytes
+            overhead (int, optional): Bytes in the package other than the header, CRC and blocks. Defaults to 0.
 
-    def __get_variables_bulk(self, id: int):
-        raise NotImplementedError()
+        Raises:
+            ValueError: A single block does not fit in a package
 
-    def scan(self) -> list:
-        """ Scan the serial port and find drivers.
+        Returns:
+            list: List of {id: block} dictionaries
+        """
+        empty_size = Red._PACKAGE_ESSENTIAL_SIZE + self.__broadcast.vars[Index.CRCValue].size() + overhead
+        chunks = [dict()]
+        size = empty_size
+        for id, block in blocks.items():
+            bsize = block_size(block)
+            if empty_size + bsize > Red._MAX_PACKAGE_SIZE:
+                raise ValueError("Data of ID {} does not fit in a single package!".format(id))
+            if size + bsize > Red._MAX_PACKAGE_SIZE:
+                chunks.append(dict())
+                size = empty_size
+            chunks[-1][id] = block
+            size += bsize
+        return chunks
+
+    def __check_attached(self, ids):
+        for id in ids:
+            if (id < 0) or (id > 254):
+                raise ValueError("{} is not a valid ID!".format(id))
+
+            if (id != self.__driver_list[id].vars[Index.DeviceID].value()):
+                raise ValueError("{} is not an attached ID!".format(id))
+
+    def set_variables_bulk(self, id_idx_val_pairs: dict):
+        """ Set variables on many drivers with BULK_WRITE packages.
+        Each driver gets its own list of [Index, value] pairs. The
+        pairs are split into as few packages as possible.
+
+        Args:
+            id_idx_val_pairs (dict): {id: [[Index, value], ...]} for each driver
+
+        Raises:
+            ValueError: Device ID is not valid or data does not fit in a package
+            IndexError: A given list is empty
+        """
+        self.__check_attached(id_idx_val_pairs.keys())
+        for id, pairs in id_idx_val_pairs.items():
+            if len(pairs) == 0:
+                raise IndexError("Given index, value pair list of ID {} is empty!".format(id))
+
+        with self.__bus_lock:
+            blocks = dict()
+            for id, pairs in id_idx_val_pairs.items():
+                driver = self.__driver_list[id]
+                for index, value in pairs:
+                    driver.vars[int(index)].value(value)
+                blocks[id] = [[index, driver.vars[int(index)].value()] for index, _ in pairs]
+                self.__invalidate(id, [pair[0] for pair in pairs])
+
+            chunks = self.__split_blocks(blocks, lambda pairs: 2 + sum([1 + self.__broadcast.vars[int(pair[0])].size() for pair in pairs]))
+            for chunk in chunks:
+                self.__write_bus(self.__broadcast.bulk_write(chunk))
+
+    def get_variables_bulk(self, id_index_lists: dict) -> dict:
+        """ Get variables from many drivers with BULK_READ packages.
+        All drivers in a package reply one after the other, so a single
+        round trip serves every driver in it.
+
+        Args:
+            id_index_lists (dict): {id: [Index, ...]} for each driver
+
+        Raises:
+            ValueError: Device ID is not valid or data does not fit in a package
+            IndexError: A given list is empty
+
+        Returns:
+            dict: {id: list | None} Read values of each driver, None if the driver did not reply.
+        """
+        self.__check_attached(id_index_lists.keys())
+
+        for id, index_list in id_index_lists.items():
+            if len(index_list) == 0:
+                raise IndexError("Given index list of ID {} is empty!".format(id))
+
+        result = dict()
+        for chunk in self.__split_blocks(id_index_lists, lambda index_list: 2 + len(index_list)):
+            with self.__bus_lock:
+                self.__write_bus(self.__broadcast.bulk_read(chunk))
+                replies = self.__receive(chunk.keys(), self.__broadcast.get_ack_size())
+                for id, index_list in chunk.items():
+                    if id in replies:
+                        self.__parse(replies[id], index_list)
+                        result[id] = [self.__driver_list[id].vars[index].value() for index in index_list]
+                    else:
+                        result[id] = None
+        return result
+
+    def __wire_timeout(self, tx_size: int, rx_size: int) -> float:
+        """ Time to transmit a package, receive its reply and let the
+        driver turn around, at the current baudrate.
+
+        Args:
+            tx_size (int): Size of the sent package in bytes
+            rx_size (int): Size of the expected reply in bytes
+
+        Returns:
+            float: Timeout in seconds
+        """
+        return (tx_size + rx_size) * 10 / self.__baudrate + self.__class__._TURNAROUND_TIME
+
+    def __transaction_timeout(self, tx_size: int, rx_size: int) -> float:
+        """ Time to wait for the reply of a package: the time on the wire,
+        but at least the minimum reply timeout.
+
+        Args:
+            tx_size (int): Size of the sent package in bytes
+            rx_size (int): Size of the expected reply in bytes
+
+        Returns:
+            float: Timeout in seconds
+        """
+        return max(self.__wire_timeout(tx_size, rx_size), self.__reply_timeout)
+
+    def set_reply_timeout(self, timeout: float):
+        """ Set the minimum time to wait for a reply. Replies are returned
+        as soon as they are complete, so this only delays the detection of
+        missing or corrupt replies. USB serial adapters may hold received
+        bytes for several milliseconds before passing them on, so lower
+        values than the latency of the adapter report replies as timeouts.
+
+        Args:
+            timeout (float): Minimum reply timeout in seconds, 0 to wait only for the time on the wire
+
+        Raises:
+            ValueError: Timeout is negative
+        """
+        if timeout < 0:
+            raise ValueError("Reply timeout must not be negative!")
+        self.__reply_timeout = timeout
+
+    def get_reply_timeout(self) -> float:
+        """ Return the minimum reply timeout in seconds, see set_reply_timeout. """
+        return self.__reply_timeout
+
+    def scan(self, ids=None, hints=[], cache_file=None, timeout=None) -> list:
+        """ Scan the serial port and find drivers. Each probe waits for the
+        reply timeout of the master, at most 25 ms, since a USB serial
+        adapter may hold received bytes for a few milliseconds. Hinted IDs
+        and the IDs found by the last scan of this port (if a cache file
+        is given) are probed first with a timeout derived from the
+        baudrate, and probed again with the full timeout if they do not
+        reply.
+
+        Args:
+            ids (iterable, optional): IDs to probe. Defaults to all IDs in range [0, 254].
+            hints (list, optional): IDs which are probed first. Defaults to [].
+            cache_file (str, optional): JSON file to load and save the last seen IDs per port. Defaults to None.
+            timeout (float, optional): Reply timeout of a probe in seconds, 0 waits only for the time on the wire.
+                Defaults to the reply timeout of the master, at most 25 ms.
 
         Returns:
             list: Connected drivers.
         """
-        self.__ph.reset_input_buffer()
-        self.__ph.reset_output_buffer()
-        self.__ph.timeout = 0.025
+        ids = range(255) if ids is None else ids
+
+        cache = dict()
+        if cache_file is not None:
+            try:
+                with open(cache_file, 'r') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = dict()
+
+        known = [id for id in dict.fromkeys([*hints, *cache.get(self.__portname, [])]) if 0 <= id <= 254]
+        probes = [id for id in dict.fromkeys([*known, *ids]) if 0 <= id <= 254]
+        probe_size = Red._PACKAGE_ESSENTIAL_SIZE + _CRC_STRUCT.size
+        wire_timeout = self.__wire_timeout(probe_size, probe_size)
+        if timeout is None:
+            timeout = min(self.__reply_timeout, self.__class__._SCAN_TIMEOUT)
+        probe_timeout = max(wire_timeout, timeout)
+
         connected = []
-        for id in range(255):
-            self.attach(Red(id))
-            if self.ping(id):
-                connected.append(id)
-            else:
-                self.detach(id)
-        self.__ph.timeout = 0.1
+        with self.__bus_lock:
+            self.__ph.reset_input_buffer()
+            self.__ph.reset_output_buffer()
+            replied = set()
+            # Drivers seen before are expected to reply, they are confirmed without the full wait
+            for id in known:
+                self.__write_bus(Red._ping_frame(id))
+                if id in self.__receive((id,), probe_size, wire_timeout):
+                    replied.add(id)
+            for id in probes:
+                if id not in replied:
+                    self.__write_bus(Red._ping_frame(id))
+                    if id in self.__receive((id,), probe_size, probe_timeout):
+                        replied.add(id)
+
+            for id in probes:
+                if id in replied:
+                    connected.append(id)
+                    if self.__driver_list[id].vars[Index.DeviceID].value() != id:
+                        self.attach(Red(id))
+                elif self.__driver_list[id].vars[Index.DeviceID].value() == id:
+                    self.detach(id)
+
+        connected.sort()
         self.__attached_drivers = connected
+
+        if cache_file is not None:
+            cache[self.__portname] = connected
+            with open(cache_file, 'w') as f:
+                json.dump(cache, f)
+
         return connected
 
+    @staticmethod
+    def scan_ports(masters: list, **kwargs) -> list:
+        """ Scan the serial ports of several masters concurrently, one thread per port.
+
+        Args:
+            masters (list): Master instances to scan
+            **kwargs: Arguments passed to scan of every master
+
+        Returns:
+            list: Connected drivers of each master, in the order of masters.
+        """
+        results = [None] * len(masters)
+
+        def worker(i):
+            results[i] = masters[i].scan(**kwargs)
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(len(masters))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
     def reboot(self, id: int):
         """ Reboot the driver.
 
         Args:
             id (int): The device ID of the driver.
         """
-        self.__write_bus(self.__driver_list[id].reboot())
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__invalidate(id)
+            self.__write_bus(self.__driver_list[id].reboot())
 
     def factory_reset(self, id: int):
         """ Clear the EEPROM config of the driver.
@@ -670,8 +1768,9 @@ class Master():
         Args:
             id (int): The device ID of the driver.
         """
-        self.__write_bus(self.__driver_list[id].factory_reset())
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__invalidate(id)
+            self.__write_bus(self.__driver_list[id].factory_reset())
 
     def eeprom_write(self, id: int, ack=False):
         """ Save the config to the EEPROM.
@@ -685,14 +1784,14 @@ class Master():
                          Return False if ack does not return or incorrect
                          Return None if ack is not requested.
         """
-        self.__write_bus(self.__driver_list[id].EEPROM_write(ack=ack))
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__write_bus(self.__driver_list[id].EEPROM_write(ack=ack))
 
-        if ack:
-            if self.__read_ack(id):
-                return True
-            else:
-                return False
+            if ack:
+                if self.__read_ack(id):
+                    return True
+                else:
+                    return False
         return None
 
     def ping(self, id: int) -> bool:
@@ -704,13 +1803,13 @@ class Master():
         Returns:
             bool: Return True if device replies otherwise False.
         """
-        self.__write_bus(self.__driver_list[id].ping())
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__write_bus(self.__driver_list[id].ping())
 
-        if self.__read_ack(id):
-            return True
-        else:
-            return False
+            if self.__read_ack(id):
+                return True
+            else:
+                return False
 
     def reset_encoder(self, id: int):
         """ Reset the encoder.
@@ -718,8 +1817,8 @@ class Master():
         Args:
             id (int): The device ID of the driver.
         """
-        self.__write_bus(self.__driver_list[id].reset_encoder())
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__write_bus(self.__driver_list[id].reset_encoder())
 
     def scan_modules(self, id: int) -> list:
         """ Get the list of sensor IDs which are connected to the driver.
@@ -732,7 +1831,8 @@ class Master():
         """
 
         _ID_OFFSETS = [[1, Index.Button_1], [6, Index.Light_1], [11, Index.Buzzer_1], [16, Index.Joystick_1], [21, Index.Distance_1], [26, Index.QTR_1], [31, Index.Servo_1], [36, Index.Pot_1], [41, Index.RGB_1], [46, Index.IMU_1]]
-        self.__write_bus(self.__driver_list[id].scan_modules())
+        with self.__bus_lock:
+            self.__write_bus(self.__driver_list[id].scan_modules())
         time.sleep(5.5)
         connected = None
         for i in range(0,10):
@@ -851,8 +1951,8 @@ class Master():
         self.set_variables(id, [[Index.SetManualPot, ManualPot_Byte]])
         self.set_variables(id, [[Index.SetManualIMU, ManualIMU_Byte]])
     
-        self.__write_bus(self.__driver_list[id].scan_modules())
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__write_bus(self.__driver_list[id].scan_modules())
 
 
 
@@ -864,8 +1964,9 @@ class Master():
             id (int): The device ID of the driver.
         """
 
-        self.__write_bus(self.__driver_list[id].enter_bootloader())
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__invalidate(id)
+            self.__write_bus(self.__driver_list[id].enter_bootloader())
 
     def get_driver_info(self, id: int):
         """ Get hardware and software versions from the driver
@@ -905,10 +2006,9 @@ class Master():
         if (id_new < 0) or (id_new > 254):
             raise ValueError("{} is not a valid ID argument!".format(id_new))
 
-        self.__write_bus(self.__driver_list[id].update_driver_id(id_new))
-        time.sleep(self.__post_sleep)
+        with self.__bus_lock:
+            self.__write_bus(self.__driver_list[id].update_driver_id(id_new))
         self.eeprom_write(id_new)
-        time.sleep(self.__post_sleep)
         self.reboot(id)
 
     def enable_torque(self, id: int, en: bool):
@@ -920,7 +2020,6 @@ class Master():
         """
 
         self.set_variables(id, [[Index.TorqueEnable, en]])
-        time.sleep(self.__post_sleep)
 
     def pid_tuner(self, id: int):
         """ Start PID auto-tuning routine. This routine will estimate
@@ -929,8 +2028,10 @@ class Master():
         Args:
             id (int): The device ID of the driver.
         """
-        self.__write_bus(self.__driver_list[id].tune())
-        time.sleep(self.__post_sleep)
+        # The routine rewrites the control parameters
+        with self.__bus_lock:
+            self.__invalidate(id)
+            self.__write_bus(self.__driver_list[id].tune())
 
     def set_operation_mode(self, id: int, mode: OperationMode):
         """ Set the operation mode of the driver.
@@ -941,7 +2042,6 @@ class Master():
         """
 
         self.set_variables(id, [[Index.OperationMode, mode]])
-        time.sleep(self.__post_sleep)
 
     def get_operation_mode(self, id: int):
         """ Get the current operation mode from the driver.
@@ -962,7 +2062,6 @@ class Master():
             cpr (float): The CPR value of the output shaft/
         """
         self.set_variables(id, [[Index.OutputShaftCPR, cpr]])
-        time.sleep(self.__post_sleep)
 
     def get_shaft_cpr(self, id: int):
         """ Get the count per revolution (CPR) of the motor output shaft.
@@ -983,7 +2082,6 @@ class Master():
             rpm (float): The RPM value of the output shaft at 12V
         """
         self.set_variables(id, [[Index.OutputShaftRPM, rpm]])
-        time.sleep(self.__post_sleep)
 
     def get_shaft_rpm(self, id: int):
         """ Get the revolution per minute (RPM) value of the output shaft at 12V rating.
@@ -1003,7 +2101,6 @@ class Master():
             id (int): The device ID of the driver.
         """
         self.set_variables(id, [[Index.UserIndicator, 1]])
-        time.sleep(self.__post_sleep)
 
     def set_position_limits(self, id: int, plmin: int, plmax: int):
         """ Set the position limits of the motor in terms of encoder ticks.
@@ -1017,7 +2114,6 @@ class Master():
             plmax (int): The maximum position limit.
         """
         self.set_variables(id, [[Index.MinimumPositionLimit, plmin], [Index.MaximumPositionLimit, plmax]])
-        time.sleep(self.__post_sleep)
 
     def get_position_limits(self, id: int):
         """ Get the position limits of the motor in terms of encoder ticks.
@@ -1040,7 +2136,6 @@ class Master():
             tl (int): New torque limit (mA)
         """
         self.set_variables(id, [[Index.TorqueLimit, tl]])
-        time.sleep(self.__post_sleep)
 
     def get_torque_limit(self, id: int):
         """ Get the torque limit from the driver in terms of milliamps (mA).
@@ -1062,7 +2157,6 @@ class Master():
             vl (int): New velocity limit (RPM)
         """
         self.set_variables(id, [[Index.VelocityLimit, vl]])
-        time.sleep(self.__post_sleep)
 
     def get_velocity_limit(self, id: int):
         """ Get the velocity limit from the driver in terms of RPM.
@@ -1083,7 +2177,6 @@ class Master():
             sp (int | float): Position control setpoint.
         """
         self.set_variables(id, [[Index.PositionControlMode, 0],[Index.SetPosition, sp]])
-        time.sleep(self.__post_sleep)
 
     def get_position(self, id: int):
         """ Get the current position of the motor from the driver in terms of encoder ticks.
@@ -1133,8 +2226,6 @@ class Master():
         self.set_variables(id, [[Index.SCurveTime, time_],[Index.SCurveMaxVelocity, maxSpeed],[Index.ScurveAccel, accel]])
         self.set_variables(id, [[Index.SCurveSetpoint, target_position]])
 
-        time.sleep(self.__post_sleep)
-
         while(blocking):
             if (abs(target_position - self.get_position(id)) <= encoder_tick_close_counter):
                 break
@@ -1161,8 +2252,6 @@ class Master():
         self.set_variables(id, [[Index.SCurveMaxVelocity, speed],[Index.ScurveAccel, MotorConstants.MAX_ACCEL]])
         self.set_variables(id, [[Index.SCurveSetpoint, target_position]])
 
-        time.sleep(self.__post_sleep)
-
         while(blocking):
             if (abs(target_position - self.get_position(id)) <= encoder_tick_close_counter):
                 break
@@ -1191,7 +2280,6 @@ class Master():
             self.set_variables(id, [[Index.SetVelocityAcceleration, accel]])
             self.set_variables(id, [[Index.SetVelocity, sp]])
         
-        time.sleep(self.__post_sleep)
 
     def get_velocity(self, id: int):
         """ Get the current velocity of the motor output shaft from the driver in terms of RPM.
@@ -1212,7 +2300,6 @@ class Master():
             sp (int | float): Torque control setpoint.
         """
         self.set_variables(id, [[Index.SetTorque, sp]])
-        time.sleep(self.__post_sleep)
 
     def get_torque(self, id: int):
         """ Get the current drawn from the motor from the driver in terms of milliamps (mA).
@@ -1234,7 +2321,6 @@ class Master():
             pct (int | float): Duty cycle percentage.
         """
         self.set_variables(id, [[Index.SetDutyCycle, pct]])
-        time.sleep(self.__post_sleep)
 
     def get_analog_port(self, id: int):
         """ Get the ADC values from the analog port of the device with
@@ -1266,7 +2352,6 @@ class Master():
         val_list = [p, i, d, db, ff, ol]
 
         self.set_variables(id, [list(pair) for pair in zip(index_list, val_list) if pair[1] is not None])
-        time.sleep(self.__post_sleep)
 
     def get_control_parameters_position(self, id: int):
         """ Get the position control block parameters.
@@ -1298,7 +2383,6 @@ class Master():
         val_list = [p, i, d, db, ff, ol]
 
         self.set_variables(id, [list(pair) for pair in zip(index_list, val_list) if pair[1] is not None])
-        time.sleep(self.__post_sleep)
 
     def get_control_parameters_velocity(self, id: int):
         """ Get the velocity control block parameters.
@@ -1329,7 +2413,6 @@ class Master():
         val_list = [p, i, d, db, ff, ol]
 
         self.set_variables(id, [list(pair) for pair in zip(index_list, val_list) if pair[1] is not None])
-        time.sleep(self.__post_sleep)
 
     def get_control_parameters_torque(self, id: int):
         """ Get the torque control block parameters.
@@ -1405,7 +2488,6 @@ class Master():
         if (index < Index.Buzzer_1) or (index > Index.Buzzer_5):
             raise InvalidIndexError()
         self.set_variables(id, [[index, note_frequency]])
-        time.sleep(self.__post_sleep)
 
     def get_joystick(self, id: int, module_id: int):
         """ Get the joystick module data with given module ID.
@@ -1493,7 +2575,6 @@ class Master():
         if (index < Index.Servo_1) or (index > Index.Servo_5):
             raise InvalidIndexError()
         self.set_variables(id, [[index, val]])
-        time.sleep(self.__post_sleep)
 
     def get_potentiometer(self, id: int, module_id: int):
         """ Get the potentiometer module data with given module ID.
@@ -1545,7 +2626,6 @@ class Master():
         if (index < Index.RGB_1) or (index > Index.RGB_5):
             raise InvalidIndexError()
         self.set_variables(id, [[index, color_RGB]])
-        time.sleep(self.__post_sleep)
 
     def get_imu(self, id: int, module_id: int):
         """ Get IMU module data (roll, pitch)
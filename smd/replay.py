@@ -0,0 +1,385 @@
+""" Replay of a bus capture, written by Master.start_capture.
+
+The capture is split into exchanges, each a package written by the host
+and the replies it got. The exchanges can be replayed in two ways:
+
+    emulator: the recorded packages are written to an Emulator and its
+              replies are compared to the recorded replies. This reruns a
+              session against the emulated drivers.
+    master:   every recorded package is issued again through the API of
+              a Master, whose transport answers with the recorded replies.
+              This checks that a new build of Master writes the same
+              packages and reads the same values, and measures its
+              overhead per transaction.
+
+Exchanges are started at their recorded time divided by the speed, so a
+speed of 1 keeps the original timing, 10 runs ten times faster and 0 runs
+them back to back. Each run reports its throughput and latencies next to
+the ones of the recording, and can be compared with an earlier run.
+
+Usage:
+    smd-replay capture.bin [--mode emulator|master] [--speed 1] [--output run.json] [--compare earlier.json]
+"""
+from smd._internals import Index, Commands, _FrameReceiver
+from smd.capture import CaptureReader, TX, decode, _expected_ids, _CRC_STRUCT
+from smd.emulator import Emulator
+from smd.instrumentation import LatencyHistogram
+from smd.red import Red, Master
+from smd.transport import MemoryTransport
+import argparse
+import json
+import struct
+import sys
+import time
+
+
+class Exchange():
+    """ A package written by the host and the replies it got. """
+    __slots__ = ('time', 'request', 'replies')
+
+    def __init__(self, time: float, request: bytes) -> None:
+        self.time = time
+        self.request = request
+        # {id: (latency in seconds, package)} in the order of arrival
+        self.replies = dict()
+
+
+def load(path: str):
+    """ Split a capture into exchanges. A reply belongs to the latest
+    request which expects a reply from its device ID.
+
+    Args:
+        path (str): Capture file
+
+    Returns:
+        tuple: (baudrate, [Exchange]) with times in seconds from the first package
+    """
+    reader = CaptureReader(path)
+    exchanges = []
+    pending = dict()
+    start = None
+    for timestamp, direction, frame in reader.frames():
+        t = timestamp / 1e9
+        if direction == TX:
+            start = t if start is None else start
+            exchange = Exchange(t - start, frame)
+            exchanges.append(exchange)
+            for id in _expected_ids(frame):
+                pending[id] = exchange
+        elif (frame is not None) and (frame[Index.DeviceID] in pending):
+            exchange = pending.pop(frame[Index.DeviceID])
+            exchange.replies[frame[Index.DeviceID]] = (t - start - exchange.time, frame)
+    baudrate = reader.baudrate
+    reader.close()
+    return baudrate, exchanges
+
+
+def _summary(histogram: LatencyHistogram) -> dict:
+    return {key: value for key, value in histogram.snapshot().items() if key != 'buckets'}
+
+
+class _Run():
+    """ Counters and latency histograms of a run. """
+
+    def __init__(self) -> None:
+        self.counters = dict(exchanges=0, replies=0, missing=0, extra=0, different=0, skipped=0)
+        self.latency = LatencyHistogram()
+        self.ids = dict()
+        self.duration = 0.0
+
+    def reply(self, id: int, latency: float):
+        self.counters['replies'] += 1
+        self.latency.record(latency)
+        self.ids.setdefault(id, LatencyHistogram()).record(latency)
+
+    def report(self) -> dict:
+        report = dict(self.counters)
+        report['duration'] = self.duration
+        report['throughput'] = (self.counters['exchanges'] / self.duration) if self.duration > 0 else None
+        report['latency'] = _summary(self.latency)
+        report['ids'] = {id: _summary(histogram) for id, histogram in sorted(self.ids.items())}
+        return report
+
+
+def recorded(exchanges: list) -> dict:
+    """ Report of the recorded session, in the format of a replay run. """
+    run = _Run()
+    for exchange in exchanges:
+        run.counters['exchanges'] += 1
+        for id, (latency, _) in exchange.replies.items():
+            run.reply(id, latency)
+    if exchanges:
+        last = exchanges[-1]
+        run.duration = last.time + max([latency for latency, _ in last.replies.values()], default=0.0)
+    return run.report()
+
+
+def _wait(start: float, at: float, speed: float):
+    if speed > 0:
+        delay = start + at / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def replay_emulator(exchanges: list, emulator: Emulator, speed=1.0, timeout=0.1) -> dict:
+    """ Write the recorded packages to an emulator and compare its replies to the recorded ones.
+
+    Args:
+        exchanges (list): Exchanges returned by load
+        emulator (Emulator): Emulated bus with the drivers of the capture
+        speed (float, optional): Speed up of the recorded timing, 0 for back to back. Defaults to 1.0.
+        timeout (float, optional): Seconds to wait for the replies of a package. Defaults to 0.1.
+
+    Returns:
+        dict: exchanges, replies, missing, extra, different, skipped, duration, throughput, latency and ids
+    """
+    run = _Run()
+    transport = emulator.transport()
+    receiver = _FrameReceiver(Red._HEADER, Red._PRODUCT_TYPE, Red._PACKAGE_ESSENTIAL_SIZE + _CRC_STRUCT.size)
+    start = time.perf_counter()
+    for exchange in exchanges:
+        _wait(start, exchange.time, speed)
+        # Drivers which did not reply in the recording are not waited for
+        expected = set(exchange.replies)
+        written = time.perf_counter()
+        transport.write(exchange.request)
+        run.counters['exchanges'] += 1
+
+        replies = dict()
+        deadline = written + timeout
+        while expected - replies.keys():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            # Wait for the first byte, then take whatever has arrived
+            waiting = transport.in_waiting
+            receiver.commit(transport.readinto(receiver.writable(max(waiting, 1)), 0 if waiting else remaining))
+            frame = receiver.next_frame()
+            while frame is not None:
+                replies[frame[Index.DeviceID]] = (time.perf_counter() - written, bytes(frame))
+                frame = receiver.next_frame()
+
+        for id, (latency, frame) in replies.items():
+            if id not in exchange.replies:
+                run.counters['extra'] += 1
+                continue
+            run.reply(id, latency)
+            if frame != exchange.replies[id][1]:
+                run.counters['different'] += 1
+        run.counters['missing'] += len(exchange.replies.keys() - replies.keys())
+    run.duration = time.perf_counter() - start
+    transport.close()
+    return run.report()
+
+
+def _payload_values(payload, index_count=None) -> tuple:
+    """ Split [index, value] pairs of a payload, at most index_count of them.
+
+    Returns:
+        tuple: ([[Index, value], ...], size of the pairs in bytes)
+    """
+    layout = Red._REGISTERS
+    pairs = []
+    i = 0
+    while (i < len(payload)) and ((index_count is None) or (len(pairs) < index_count)):
+        index = payload[i]
+        value = layout.structs[index].unpack_from(payload, i + 1)
+        pairs.append([Index(index), value[0] if len(value) == 1 else list(value)])
+        i += 1 + layout.sizes[index]
+    return pairs, i
+
+
+def _method(request: bytes) -> tuple:
+    """ Master method which writes the given package.
+
+    Returns:
+        tuple: (method name, args, device IDs), None if no method writes the package
+    """
+    id, command = request[Index.DeviceID], request[Index.Command]
+    payload = request[Red._PACKAGE_ESSENTIAL_SIZE:-_CRC_STRUCT.size]
+    if command == Commands.PING:
+        return 'ping', (id,), [id]
+    if command == Commands.READ:
+        return 'get_variables', (id, [Index(index) for index in payload]), [id]
+    if command in (Commands.WRITE, Commands.WRITE_ACK):
+        return 'set_variables', (id, _payload_values(payload)[0], command == Commands.WRITE_ACK), [id]
+
+    blocks = dict()
+    if command == Commands.BULK_READ:
+        i = 0
+        while i + 1 < len(payload):
+            blocks[payload[i]] = [Index(index) for index in payload[i + 2:i + 2 + payload[i + 1]]]
+            i += 2 + payload[i + 1]
+        return 'get_variables_bulk', (blocks,), list(blocks)
+    if command == Commands.BULK_WRITE:
+        i = 0
+        while i + 1 < len(payload):
+            blocks[payload[i]], size = _payload_values(payload[i + 2:], payload[i + 1])
+            i += 2 + size
+        return 'set_variables_bulk', (blocks,), list(blocks)
+    if command == Commands.SYNC_WRITE:
+        index = Index(payload[0])
+        packer, size = Red._REGISTERS.structs[index], Red._REGISTERS.sizes[index]
+        for i in range(1, len(payload) - size, 1 + size):
+            value = packer.unpack_from(payload, i + 1)
+            blocks[payload[i]] = [[index, value[0] if len(value) == 1 else list(value)]]
+        return 'set_variables_sync_multi', (blocks,), list(blocks)
+    return None
+
+
+def replay_master(exchanges: list, baudrate=115200, speed=0.0, master_class=Master) -> dict:
+    """ Issue the recorded packages through a master which receives the recorded replies.
+
+    Args:
+        exchanges (list): Exchanges returned by load
+        baudrate (int, optional): Baudrate of the master. Defaults to 115200.
+        speed (float, optional): Speed up of the recorded timing, 0 for back to back. Defaults to 0.0.
+        master_class (type, optional): Master class under test. Defaults to Master.
+
+    Returns:
+        dict: exchanges, replies, missing, extra, different (written packages or read values which
+              differ from the recording, or recorded packages the master did not write), skipped (packages no method of the master writes), duration,
+              throughput, latency (duration of the master calls) and ids
+    """
+    run = _Run()
+    current = [None]
+
+    def respond(data):
+        exchange = current[0]
+        current[0] = None
+        if (exchange is None) or (data != exchange.request):
+            run.counters['different'] += 1
+        if exchange is None:
+            return None
+        return b''.join([frame for _, frame in exchange.replies.values()])
+
+    calls = []
+    ids = set()
+    for exchange in exchanges:
+        try:
+            method = _method(exchange.request)
+        except (IndexError, ValueError, struct.error):
+            method = None
+        calls.append(method)
+        if method is not None:
+            ids.update(method[2])
+
+    master = master_class(MemoryTransport(respond), baudrate)
+    for id in ids:
+        master.attach(Red(id))
+
+    start = time.perf_counter()
+    for exchange, method in zip(exchanges, calls):
+        if method is None:
+            run.counters['skipped'] += 1
+            continue
+        _wait(start, exchange.time, speed)
+        name, args, _ = method
+        current[0] = exchange
+        called = time.perf_counter()
+        values = getattr(master, name)(*args)
+        latency = time.perf_counter() - called
+        run.counters['exchanges'] += 1
+        if current[0] is not None:
+            # The master answered without writing the recorded package, e.g. from its cache
+            current[0] = None
+            run.counters['different'] += 1
+            run.counters['missing'] += len(exchange.replies)
+            continue
+
+        if name == 'get_variables':
+            values = {args[0]: values}
+        elif name != 'get_variables_bulk':
+            values = dict()
+        for id, (_, frame) in exchange.replies.items():
+            run.reply(id, latency)
+            if values.get(id) is not None:
+                if values[id] != list(decode(frame, reply=True).get('values', dict()).values()):
+                    run.counters['different'] += 1
+        run.counters['missing'] += len([id for id, read in values.items() if (read is None) and (id in exchange.replies)])
+    run.duration = time.perf_counter() - start
+    return run.report()
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """ Relative differences of a run against a baseline run or the recording.
+
+    Returns:
+        dict: throughput, p50, p90 and p99 changes, positive when the report is higher
+    """
+    def change(new, old):
+        if (new is None) or (old is None) or (old == 0):
+            return None
+        return (new - old) / old
+
+    result = {'throughput': change(report['throughput'], baseline['throughput'])}
+    for key in ['p50', 'p90', 'p99']:
+        result[key] = change(report['latency'][key], baseline['latency'][key])
+    return result
+
+
+def _print_run(name: str, report: dict):
+    latency = report['latency']
+    print("{:<10}{:>10}{:>10}{:>14}{:>10}{:>10}{:>10}".format(
+        name, report['exchanges'], report['replies'],
+        '-' if report['throughput'] is None else '{:.1f}'.format(report['throughput']),
+        '-' if latency['p50'] is None else latency['p50'],
+        '-' if latency['p90'] is None else latency['p90'],
+        '-' if latency['p99'] is None else latency['p99']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='smd-replay', description='Replay a bus capture of the SMD library.')
+    parser.add_argument('path', help='capture file written by Master.start_capture')
+    parser.add_argument('--mode', choices=['emulator', 'master'], default='emulator',
+                        help='write the packages to an emulator, or issue them through a master')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed up of the recorded timing, 0 for back to back')
+    parser.add_argument('--timeout', type=float, default=0.1, help='seconds to wait for the replies in emulator mode')
+    parser.add_argument('--output', help='write the JSON report of the run to this file')
+    parser.add_argument('--compare', metavar='EARLIER', help='compare to the JSON report of an earlier run')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    baudrate, exchanges = load(args.path)
+    if args.mode == 'emulator':
+        ids = set()
+        for exchange in exchanges:
+            ids.update(exchange.replies)
+        emulator = Emulator(ids=sorted(ids), baudrate=baudrate)
+        run = replay_emulator(exchanges, emulator, args.speed, args.timeout)
+        emulator.close()
+    else:
+        run = replay_master(exchanges, baudrate, args.speed)
+
+    report = {'mode': args.mode, 'speed': args.speed, 'recorded': recorded(exchanges), 'run': run}
+    report['changes'] = compare(run, report['recorded'])
+    if args.compare is not None:
+        with open(args.compare, 'r') as file:
+            report['changes_to_earlier'] = compare(run, json.load(file)['run'])
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print("{:<10}{:>10}{:>10}{:>14}{:>10}{:>10}{:>10}".format('', 'packages', 'replies', 'packages/s',
+                                                              'p50 [us]', 'p90 [us]', 'p99 [us]'))
+    _print_run('recorded', report['recorded'])
+    if 'changes_to_earlier' in report:
+        with open(args.compare, 'r') as file:
+            _print_run('earlier', json.load(file)['run'])
+    _print_run(args.mode, run)
+    print()
+    print("{missing} missing, {extra} extra and {different} different replies, {skipped} skipped packages".format(**run))
+    for name, changes in [('recording', report['changes']), ('earlier run', report.get('changes_to_earlier'))]:
+        if changes is not None:
+            print("against the {}: ".format(name) + ', '.join(
+                ["{} {}".format(key, '-' if value is None else '{:+.1f}%'.format(value * 100))
+                 for key, value in changes.items()]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+from smd._internals import Index, MotorConstants
+import threading
+import time
+
+
+class SetpointQueue():
+    """ Write-behind queue of setpoints. Setting a value never waits for
+    the bus: it is stored in a dirty map keyed by (ID, Index), replacing
+    any value of the same register which was not sent yet. A flush sends
+    the dirty map with as few packages as possible, a WRITE package if a
+    single driver has values and SYNC_WRITE packages otherwise, so the
+    drivers always follow the latest command instead of a backlog of
+    stale ones. Registers of a driver are sent in the order they were
+    last set, e.g. the control mode before the setpoint of set_position.
+
+    The queue is flushed at a fixed rate by a background thread, or by
+    calling flush, e.g. once per control cycle:
+
+        queue = SetpointQueue(master, rate_hz=100)
+        queue.set_velocity(1, 100.0)     # returns at once
+        ...
+        queue.close()                    # sends the last values
+
+    The master may be a Master or any object with the same set_variables
+    and set_variables_sync_multi methods, e.g. a BusArbiter.
+    """
+
+    def __init__(self, master, rate_hz=0.0) -> None:
+        """
+        Args:
+            master (Master): Master of the drivers
+            rate_hz (float, optional): Flush rate of the background thread, 0 for no thread. Defaults to 0.0.
+
+        Raises:
+            ValueError: Rate is negative
+        """
+        if rate_hz < 0:
+            raise ValueError("Flush rate must not be negative!")
+        self.__master = master
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__dirty = dict()
+        self.__stats = dict(submitted=0, coalesced=0, flushes=0, sent=0, packages=0, errors=0)
+        self.last_error = None
+        self.__stop = threading.Event()
+        self.__thread = None
+        if rate_hz > 0:
+            self.__thread = threading.Thread(target=self.__run, args=(1 / rate_hz,), daemon=True)
+            self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def set(self, id: int, index: Index, value):
+        """ Queue a value of a register, replacing the queued value of the same register. """
+        self.set_variables(id, [[index, value]])
+
+    def set_variables(self, id: int, idx_val_pairs: list):
+        """ Queue values of a driver with a list of [Index, value] pairs. """
+        with self.__lock:
+            for index, value in idx_val_pairs:
+                key = (id, int(index))
+                if key in self.__dirty:
+                    # Moved to the end, so the newest value is sent after the older registers
+                    del self.__dirty[key]
+                    self.__stats['coalesced'] += 1
+                self.__dirty[key] = value
+            self.__stats['submitted'] += len(idx_val_pairs)
+
+    def set_position(self, id: int, sp: float):
+        """ Queue a position control setpoint in encoder ticks. """
+        self.set_variables(id, [[Index.PositionControlMode, 0], [Index.SetPosition, sp]])
+
+    def set_velocity(self, id: int, sp: float, accel=0):
+        """ Queue a velocity control setpoint in RPM, with the acceleration
+        semantics of Master.set_velocity: accel in RPM/seconds is queued
+        before the setpoint, 0 keeps the previous acceleration and
+        MotorConstants.MAX_ACCEL reaches the setpoint immediately.
+        """
+        if accel == MotorConstants.MAX_ACCEL:
+            self.set_variables(id, [[Index.SetVelocityAcceleration, 0], [Index.SetVelocity, sp]])
+        elif accel == 0:
+            self.set(id, Index.SetVelocity, sp)
+        else:
+            self.set_variables(id, [[Index.SetVelocityAcceleration, accel], [Index.SetVelocity, sp]])
+
+    def set_torque(self, id: int, sp: float):
+        """ Queue a torque control setpoint in milliamps. """
+        self.set(id, Index.SetTorque, sp)
+
+    def set_duty_cycle(self, id: int, pct: float):
+        """ Queue a duty cycle in percent. """
+        self.set(id, Index.SetDutyCycle, pct)
+
+    def pending(self) -> int:
+        """ Return the number of registers waiting to be sent. """
+        with self.__lock:
+            return len(self.__dirty)
+
+    def flush(self) -> int:
+        """ Send the queued values and empty the queue. Values of a flush
+        which raised an exception are queued again, unless newer values
+        were queued meanwhile, and the exception is stored in last_error.
+
+        Returns:
+            int: Number of values sent
+        """
+        with self.__flush_lock:
+            with self.__lock:
+                dirty = self.__dirty
+                self.__dirty = dict()
+            if not dirty:
+                return 0
+
+            id_idx_val_pairs = dict()
+            for (id, index), value in dirty.items():
+                id_idx_val_pairs.setdefault(id, []).append([Index(index), value])
+            try:
+                if len(id_idx_val_pairs) == 1:
+                    id, pairs = next(iter(id_idx_val_pairs.items()))
+                    self.__master.set_variables(id, pairs)
+                    packages = 1
+                else:
+                    self.__master.set_variables_sync_multi(id_idx_val_pairs)
+                    # Drivers which write the same index share its package
+                    packages = len(set([pair[0] for pairs in id_idx_val_pairs.values() for pair in pairs]))
+            except Exception as e:
+                with self.__lock:
+                    # Values queued meanwhile are newer, they stay after the failed ones
+                    for key, value in self.__dirty.items():
+                        dirty.pop(key, None)
+                        dirty[key] = value
+                    self.__dirty = dirty
+                    self.__stats['errors'] += 1
+                self.last_error = e
+                return 0
+
+            with self.__lock:
+                self.__stats['flushes'] += 1
+                self.__stats['sent'] += len(dirty)
+                self.__stats['packages'] += packages
+            return len(dirty)
+
+    def __run(self, period: float):
+        next_cycle = time.perf_counter()
+        while not self.__stop.is_set():
+            self.flush()
+            next_cycle = max(next_cycle + period, time.perf_counter())
+            self.__stop.wait(next_cycle - time.perf_counter())
+
+    def get_stats(self) -> dict:
+        """ Return the counters of the queue: submitted values, coalesced
+        values which were replaced before being sent, flushes which sent
+        values, sent values, packages (at least one per index of a flush,
+        more if split) and failed flushes.
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def reset_stats(self):
+        with self.__lock:
+            for key in self.__stats:
+                self.__stats[key] = 0
+
+    def close(self, flush=True):
+        """ Stop the background thread and send the queued values.
+
+        Args:
+            flush (bool, optional): Send the queued values, drop them if False. Defaults to True.
+        """
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+        if flush:
+            self.flush()
+        else:
+            with self.__lock:
+                self.__dirty.clear()
@@ -0,0 +1,294 @@
+""" Telemetry of drivers in a shared memory segment.
+
+The segment starts with a header, followed by one fixed size record per
+driver. Records are written with seqlock semantics: the writer makes the
+sequence counter odd before changing a record and even again after it,
+so a reader which sees the same even counter before and after copying a
+record has a consistent copy, and retries otherwise. A counter of 0
+marks a record never written, the writer skips it when the counter wraps. Readers never take
+a lock or make a system call, and any number of processes can read.
+
+    header: magic (4s), version (uint16), record count (uint16), record size (uint32)
+    record: sequence (uint32), device ID (uint32), timestamp (double, time.time()),
+            registers PresentPosition to IMU_5 packed as in the register table
+            (PresentVelocity, MotorCurrent, AnalogPort and the module readings)
+
+Readers may also map the records without copying them, as a memoryview
+or a NumPy structured array, and check the sequence counter themselves
+with begin and retry.
+"""
+from smd._internals import Index
+from smd.red import Red
+import struct
+import time
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Added in Python 3.8
+    shared_memory = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_MAGIC = b'SMDT'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHHI')
+_SEQUENCE = struct.Struct('<I')
+_PREFIX = struct.Struct('<IId')
+_TIMESTAMP = struct.Struct('<d')
+
+# Registers of a record, a contiguous range of the register table
+INDEXES = tuple(Index(index) for index in range(Index.PresentPosition, Index.IMU_5 + 1))
+_FIELDS = {index: (_PREFIX.size + Red._REGISTERS.offsets[index] - Red._REGISTERS.offsets[Index.PresentPosition],
+                   Red._REGISTERS.structs[index]) for index in INDEXES}
+_RECORD_SIZE = (_PREFIX.size + sum([Red._REGISTERS.sizes[index] for index in INDEXES]) + 7) & ~7
+_TELEMETRY = (Index.PresentPosition, Index.PresentVelocity, Index.MotorCurrent)
+_NUMPY_TYPES = {'B': 'u1', 'H': '<u2', 'i': '<i4', 'I': '<u4', 'f': '<f4', 'd': '<f8'}
+
+
+def dtype():
+    """ Return the NumPy structured type of a record. Registers with more
+    than one value, e.g. Joystick_1, are nested types with fields f0, f1...
+
+    Raises:
+        ImportError: NumPy is not installed
+    """
+    if numpy is None:
+        raise ImportError("NumPy is required for structured array access!")
+    names = ['sequence', 'id', 'timestamp']
+    formats = ['<u4', '<u4', '<f8']
+    offsets = [0, 4, 8]
+    for index in INDEXES:
+        offset, packer = _FIELDS[index]
+        types = Red._REGISTERS.types[index]
+        names.append(index.name)
+        if len(types) == 1:
+            formats.append(_NUMPY_TYPES[types])
+        else:
+            formats.append(numpy.dtype([('f{}'.format(i), _NUMPY_TYPES[type]) for i, type in enumerate(types)]))
+        offsets.append(offset)
+    return numpy.dtype(dict(names=names, formats=formats, offsets=offsets, itemsize=_RECORD_SIZE))
+
+
+def _check_shared_memory():
+    if shared_memory is None:
+        raise ImportError("Python 3.8 or newer is required for telemetry segments!")
+
+
+class TelemetryWriter():
+    """ Create a telemetry segment and write the records of its drivers. """
+
+    def __init__(self, ids: list, name=None) -> None:
+        """
+        Args:
+            ids (list): Device IDs of the drivers, one record each
+            name (str, optional): Name of the shared memory segment. Defaults to a random name.
+
+        Raises:
+            ImportError: Shared memory is not available before Python 3.8
+        """
+        _check_shared_memory()
+        self.ids = list(ids)
+        self.__slots = {id: i for i, id in enumerate(self.ids)}
+        self.__memory = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=_HEADER.size + len(self.ids) * _RECORD_SIZE)
+        self.name = self.__memory.name
+        self.__buffer = self.__memory.buf
+        for id, slot in self.__slots.items():
+            _PREFIX.pack_into(self.__buffer, self.__offset(slot), 0, id, 0.0)
+        _HEADER.pack_into(self.__buffer, 0, _MAGIC, _VERSION, len(self.ids), _RECORD_SIZE)
+
+    @staticmethod
+    def __offset(slot: int) -> int:
+        return _HEADER.size + slot * _RECORD_SIZE
+
+    def write(self, id: int, position: float, velocity: float, current: float, timestamp=None):
+        """ Update the position, velocity and current of a driver.
+
+        Raises:
+            KeyError: The driver has no record in the segment
+        """
+        self.update(id, dict(zip(_TELEMETRY, [position, velocity, current])), timestamp)
+
+    def update(self, id: int, values: dict, timestamp=None):
+        """ Update the given registers of a driver in a single write. Other
+        registers of the record keep their values.
+
+        Args:
+            id (int): The device ID of the driver
+            values (dict): {Index: value}, registers which are not in INDEXES are ignored
+            timestamp (float, optional): time.time() of the values. Defaults to now.
+
+        Raises:
+            KeyError: The driver has no record in the segment
+        """
+        buffer = self.__buffer
+        offset = self.__offset(self.__slots[id])
+        sequence = _SEQUENCE.unpack_from(buffer, offset)[0]
+        _SEQUENCE.pack_into(buffer, offset, (sequence + 1) & 0xFFFFFFFF)
+        _TIMESTAMP.pack_into(buffer, offset + 8, time.time() if timestamp is None else timestamp)
+        for index, value in values.items():
+            field = _FIELDS.get(index)
+            if field is not None:
+                if isinstance(value, (list, tuple)):
+                    field[1].pack_into(buffer, offset + field[0], *value)
+                else:
+                    field[1].pack_into(buffer, offset + field[0], value)
+        # A wrapped counter skips 0, which marks a record never written
+        _SEQUENCE.pack_into(buffer, offset, ((sequence + 2) & 0xFFFFFFFF) or 2)
+
+    def close(self):
+        """ Close and remove the segment. Readers keep their mapping until they close. """
+        if self.__buffer is not None:
+            self.__buffer = None
+            self.__memory.close()
+            self.__memory.unlink()
+
+
+class TelemetryReader():
+    """ Read the records of a telemetry segment created by another process. """
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name (str): Name of the shared memory segment
+
+        Raises:
+            FileNotFoundError: There is no segment with the given name
+            ValueError: The segment is not a telemetry segment
+            ImportError: Shared memory is not available before Python 3.8
+        """
+        _check_shared_memory()
+        self.__memory = shared_memory.SharedMemory(name=name)
+        try:
+            # The creator removes the segment, the resource tracker of a reader must not
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.__memory._name, 'shared_memory')
+        except Exception:
+            pass
+        self.__buffer = self.__memory.buf
+        magic, version, count, size = _HEADER.unpack_from(self.__buffer, 0)
+        if (magic != _MAGIC) or (version != _VERSION) or (size != _RECORD_SIZE):
+            self.__buffer = None
+            self.__memory.close()
+            raise ValueError("{} is not a telemetry segment!".format(name))
+        self.__count = count
+        self.__slots = dict()
+        for slot in range(count):
+            self.__slots[_PREFIX.unpack_from(self.__buffer, _HEADER.size + slot * _RECORD_SIZE)[1]] = slot
+
+    @property
+    def ids(self) -> list:
+        return list(self.__slots)
+
+    def slot(self, id: int) -> int:
+        """ Return the position of the record of a driver in the segment.
+
+        Raises:
+            KeyError: The driver has no record in the segment
+        """
+        return self.__slots[id]
+
+    def begin(self, id: int, timeout=1.0) -> int:
+        """ Wait until no write of the record of a driver is in progress and
+        return its sequence counter, to be passed to retry after reading the
+        record from view or array.
+
+        Args:
+            id (int): The device ID of the driver
+            timeout (float, optional): Seconds to wait for a write in progress. Defaults to 1.0.
+
+        Raises:
+            KeyError: The driver has no record in the segment
+            TimeoutError: The write did not finish, e.g. the writer stopped in the middle of it
+        """
+        offset = _HEADER.size + self.__slots[id] * _RECORD_SIZE
+        deadline = None
+        while True:
+            sequence = _SEQUENCE.unpack_from(self.__buffer, offset)[0]
+            if not sequence & 1:
+                return sequence
+            # The clock is only read while a write is in progress
+            if deadline is None:
+                deadline = time.perf_counter() + timeout
+            elif time.perf_counter() > deadline:
+                raise TimeoutError("Record of driver {} is still being written!".format(id))
+
+    def retry(self, id: int, sequence: int) -> bool:
+        """ Return True if the record of a driver was written since begin
+        returned the given sequence counter, so the read must be repeated.
+        """
+        return _SEQUENCE.unpack_from(self.__buffer, _HEADER.size + self.__slots[id] * _RECORD_SIZE)[0] != sequence
+
+    def view(self) -> memoryview:
+        """ Return the records as a memoryview of the segment, without copying.
+        The record of a driver starts at slot(id) * record size. The view
+        must be released before the reader is closed.
+        """
+        return self.__buffer[_HEADER.size:_HEADER.size + self.__count * _RECORD_SIZE]
+
+    def array(self):
+        """ Return the records as a NumPy structured array mapped on the
+        segment, without copying. Fields are named as in dtype(). The array
+        must be deleted before the reader is closed.
+
+        Raises:
+            ImportError: NumPy is not installed
+        """
+        return numpy.frombuffer(self.__buffer, dtype=dtype(), count=self.__count, offset=_HEADER.size)
+
+    def read(self, id: int, timeout=1.0):
+        """ Read a consistent copy of the position, velocity and current of a driver.
+
+        Returns:
+            tuple | None: (timestamp, position, velocity, current, sequence), None if never written
+
+        Raises:
+            KeyError: The driver has no record in the segment
+            TimeoutError: No consistent copy was read in time
+        """
+        values = self.read_values(id, timeout)
+        if values is None:
+            return None
+        timestamp, values, sequence = values
+        return (timestamp, *[values[index] for index in _TELEMETRY], sequence)
+
+    def read_values(self, id: int, timeout=1.0):
+        """ Read a consistent copy of every register in the record of a driver.
+
+        Args:
+            id (int): The device ID of the driver
+            timeout (float, optional): Seconds to wait for a consistent copy. Defaults to 1.0.
+
+        Returns:
+            tuple | None: (timestamp, {Index: value}, sequence), None if never written
+
+        Raises:
+            KeyError: The driver has no record in the segment
+            TimeoutError: No consistent copy was read in time
+        """
+        offset = _HEADER.size + self.__slots[id] * _RECORD_SIZE
+        deadline = time.perf_counter() + timeout
+        while True:
+            sequence = self.begin(id, max(deadline - time.perf_counter(), 0.0))
+            record = bytes(self.__buffer[offset:offset + _RECORD_SIZE])
+            if not self.retry(id, sequence):
+                break
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Record of driver {} changed during every read!".format(id))
+        if sequence == 0:
+            return None
+        values = dict()
+        for index in INDEXES:
+            field_offset, packer = _FIELDS[index]
+            value = packer.unpack_from(record, field_offset)
+            values[index] = value[0] if len(value) == 1 else list(value)
+        return _TIMESTAMP.unpack_from(record, 8)[0], values, sequence >> 1
+
+    def close(self):
+        if self.__buffer is not None:
+            self.__buffer = None
+            self.__memory.close()
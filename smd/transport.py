@@ -0,0 +1,322 @@
+from abc import ABC, abstractmethod
+import io
+import os
+import select
+import struct
+import threading
+import time
+
+import serial
+
+try:
+    import fcntl
+    import termios
+    import tty
+except ImportError:
+    # Only the pyserial and in-memory transports are available on Windows
+    termios = None
+
+
+class Transport(ABC):
+    """ Byte stream which connects a master to the drivers. Subclasses
+    implement the methods below, Master and AsyncMaster only use this
+    interface.
+    """
+    name = None
+
+    @abstractmethod
+    def open(self):
+        """ Open the transport if it has been closed. """
+
+    @abstractmethod
+    def close(self):
+        """ Close the transport. """
+
+    @abstractmethod
+    def write(self, data) -> int:
+        """ Write the data, returns the number of written bytes. """
+
+    @abstractmethod
+    def readinto(self, buffer, timeout: float) -> int:
+        """ Read into the buffer until it is full or the timeout passes.
+
+        Args:
+            buffer (memoryview): Writable buffer
+            timeout (float): Seconds to wait at most, 0 reads only the available bytes
+
+        Returns:
+            int: Number of read bytes
+        """
+
+    @property
+    @abstractmethod
+    def in_waiting(self) -> int:
+        """ Number of received bytes which can be read without waiting. """
+
+    @abstractmethod
+    def set_baud(self, baudrate: int):
+        """ Change the baudrate of the transport. """
+
+    def fileno(self) -> int:
+        """ File descriptor which becomes readable when bytes are received. """
+        raise io.UnsupportedOperation("{} has no file descriptor!".format(self.__class__.__name__))
+
+    @abstractmethod
+    def reset_input_buffer(self):
+        """ Drop the received bytes which have not been read. """
+
+    @abstractmethod
+    def reset_output_buffer(self):
+        """ Drop the bytes which have not been transmitted yet. """
+
+
+class SerialTransport(Transport):
+    """ Transport over a pyserial port. Works on every platform and with
+    every port URL pyserial supports.
+
+    pyserial reconfigures the port whenever its timeout changes, while the
+    master passes the remaining time of a transaction to every read. Ports
+    with a file descriptor are therefore read non blocking and waiting is
+    done with select, other ports only set the timeout when it differs.
+    """
+
+    def __init__(self, portname, baudrate=115200) -> None:
+        self.name = portname
+        self.__port = serial.Serial(port=portname, baudrate=baudrate, timeout=0.1)
+        self.__timeout = 0.1
+        self.__open = True
+        self.__select()
+
+    def __select(self):
+        try:
+            self.__fd = self.__port.fileno()
+        except OSError:
+            # e.g. Windows ports and most port URLs
+            self.__fd = None
+            return
+        self.__port.timeout = 0
+        self.__timeout = 0
+
+    def open(self):
+        if not self.__open:
+            self.__port.open()
+            self.__open = True
+            self.__select()
+
+    def close(self):
+        self.__port.close()
+        self.__open = False
+
+    def write(self, data) -> int:
+        return self.__port.write(data)
+
+    def readinto(self, buffer, timeout: float) -> int:
+        if self.__fd is None:
+            if timeout != self.__timeout:
+                # Changing the timeout reconfigures the port, so it is only set when it differs
+                self.__port.timeout = timeout
+                self.__timeout = timeout
+            return self.__port.readinto(buffer)
+
+        view = memoryview(buffer)
+        n = self.__port.readinto(view)
+        deadline = time.perf_counter() + timeout
+        while n < len(view):
+            remaining = deadline - time.perf_counter()
+            if (remaining <= 0) or not select.select([self.__fd], [], [], remaining)[0]:
+                break
+            n += self.__port.readinto(view[n:])
+        return n
+
+    @property
+    def in_waiting(self) -> int:
+        return self.__port.in_waiting
+
+    def set_baud(self, baudrate: int):
+        self.__port.baudrate = baudrate
+
+    def fileno(self) -> int:
+        return self.__port.fileno()
+
+    def reset_input_buffer(self):
+        if self.__open:
+            self.__port.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        if self.__open:
+            self.__port.reset_output_buffer()
+
+
+class TermiosTransport(Transport):
+    """ Transport over a raw file descriptor of a tty on POSIX systems.
+    Bytes are read with os.readv straight into the receive buffer, and
+    waiting is done with select instead of pyserial's timeout handling.
+
+    The tty is opened non blocking with VMIN = 0 and VTIME = 0, so a read
+    returns the available bytes immediately. VTIME counts deciseconds,
+    which is far too coarse for the transaction timeouts of the bus.
+    """
+
+    def __init__(self, portname, baudrate=115200) -> None:
+        if termios is None:
+            raise OSError("Termios transport is not supported on this platform!")
+        self.name = portname
+        self.__baudrate = baudrate
+        self.__fd = None
+        self.open()
+
+    def _open_fd(self) -> int:
+        return os.open(self.name, os.O_RDWR | os.O_NOCTTY)
+
+    def open(self):
+        if self.__fd is not None:
+            return
+        self.__fd = self._open_fd()
+        fcntl.fcntl(self.__fd, fcntl.F_SETFL, fcntl.fcntl(self.__fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        tty.setraw(self.__fd)
+        attrs = termios.tcgetattr(self.__fd)
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        attrs[6][termios.VMIN] = 0
+        attrs[6][termios.VTIME] = 0
+        termios.tcsetattr(self.__fd, termios.TCSANOW, attrs)
+        self.set_baud(self.__baudrate)
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            try:
+                written += os.write(self.__fd, view[written:])
+            except BlockingIOError:
+                select.select([], [self.__fd], [])
+        return written
+
+    def readinto(self, buffer, timeout: float) -> int:
+        n = 0
+        deadline = time.perf_counter() + timeout
+        while n < len(buffer):
+            try:
+                count = os.readv(self.__fd, [buffer[n:]])
+            except BlockingIOError:
+                count = 0
+            n += count
+            if (count == 0) or (n < len(buffer)):
+                remaining = deadline - time.perf_counter()
+                if (remaining <= 0) or not select.select([self.__fd], [], [], remaining)[0]:
+                    break
+        return n
+
+    @property
+    def in_waiting(self) -> int:
+        return struct.unpack('I', fcntl.ioctl(self.__fd, termios.FIONREAD, b'\x00' * 4))[0]
+
+    def set_baud(self, baudrate: int):
+        speed = getattr(termios, 'B{}'.format(baudrate), None)
+        if speed is None:
+            raise ValueError("{} is not a standard baudrate of this platform!".format(baudrate))
+        attrs = termios.tcgetattr(self.__fd)
+        attrs[4] = speed
+        attrs[5] = speed
+        termios.tcsetattr(self.__fd, termios.TCSADRAIN, attrs)
+        self.__baudrate = baudrate
+
+    def fileno(self) -> int:
+        return self.__fd
+
+    def reset_input_buffer(self):
+        if self.__fd is not None:
+            termios.tcflush(self.__fd, termios.TCIFLUSH)
+
+    def reset_output_buffer(self):
+        if self.__fd is not None:
+            termios.tcflush(self.__fd, termios.TCOFLUSH)
+
+
+class PtyTransport(TermiosTransport):
+    """ Transport over a new pseudo terminal. The master holds the
+    controller side and name is the path of the other side, where an
+    emulator or another process can open it like a serial port.
+    """
+
+    def __init__(self, baudrate=115200) -> None:
+        self.__controller, self.__peer = os.openpty()
+        super().__init__(os.ttyname(self.__peer), baudrate)
+
+    def _open_fd(self) -> int:
+        return os.dup(self.__controller)
+
+    def __del__(self):
+        # Closing the transport keeps the pseudo terminal, so it can be opened again
+        self.close()
+        os.close(self.__controller)
+        os.close(self.__peer)
+
+
+class MemoryTransport(Transport):
+    """ In-process transport without any operating system calls. Every
+    written package is passed to the responder, whose return value is
+    received as if a driver had replied. Other threads may inject bytes
+    with feed.
+    """
+    name = 'memory'
+
+    def __init__(self, responder=None) -> None:
+        """
+        Args:
+            responder (function, optional): Called with every written package, returns the reply bytes or None. Defaults to None.
+        """
+        self.responder = responder
+        self.written = 0
+        self.__rx = bytearray()
+        self.__ready = threading.Condition()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def feed(self, data):
+        """ Receive the given bytes. """
+        with self.__ready:
+            self.__rx += data
+            self.__ready.notify_all()
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        if self.responder is not None:
+            reply = self.responder(bytes(data))
+            if reply:
+                self.feed(reply)
+        return len(data)
+
+    def readinto(self, buffer, timeout: float) -> int:
+        deadline = time.perf_counter() + timeout
+        with self.__ready:
+            while len(self.__rx) < len(buffer):
+                remaining = deadline - time.perf_counter()
+                if (remaining <= 0) or not self.__ready.wait(remaining):
+                    break
+            n = min(len(buffer), len(self.__rx))
+            buffer[:n] = self.__rx[:n]
+            del self.__rx[:n]
+        return n
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.__rx)
+
+    def set_baud(self, baudrate: int):
+        pass
+
+    def reset_input_buffer(self):
+        with self.__ready:
+            self.__rx.clear()
+
+    def reset_output_buffer(self):
+        pass
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import threading
+import unittest
+
+from smd import red
+from smd.aio import AsyncMaster
+from smd._internals import _FrameReceiver, _crc32_mpeg2
+
+
+def respond(fd, ids):
+    """ Reply to every READ package of the given IDs with zero values. """
+    receiver = _FrameReceiver(0x55, 0xBA, 10)
+    while True:
+        try:
+            receiver.feed(os.read(fd, 256))
+        except OSError:
+            return
+        frame = receiver.next_frame()
+        while frame is not None:
+            if (frame[red.Index.DeviceID] in ids) and (frame[red.Index.Command] == red.Commands.READ):
+                dev = red.Red(frame[red.Index.DeviceID])
+                index_list = list(frame[6:-4])
+                reply = bytearray(dev.set_variables(index_list, [dev.vars[index].value() for index in index_list]))
+                reply[red.Index.Command] = red.Commands.READ
+                reply[-4:] = _crc32_mpeg2(reply[:-4]).to_bytes(4, 'little')
+                os.write(fd, reply)
+            frame = receiver.next_frame()
+
+
+class TestAsyncMaster(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.fd, slave = os.openpty()
+        self.master = AsyncMaster(os.ttyname(slave), 115200)
+        os.close(slave)
+        threading.Thread(target=respond, args=(self.fd, [1, 2, 3]), daemon=True).start()
+        for id in range(5):
+            self.master.attach(red.Red(id))
+
+    def tearDown(self) -> None:
+        self.master.close()
+        os.close(self.fd)
+
+    def test_get_position(self):
+        self.assertEqual(asyncio.run(self.master.get_position(1)), 0.0)
+        self.assertIsNone(asyncio.run(self.master.get_position(4)))
+
+    def test_gather(self):
+        async def run():
+            return await asyncio.gather(*[self.master.get_velocity(id) for id in [1, 2, 3, 4]],
+                                        self.master.set_velocity(2, 10))
+
+        self.assertEqual(asyncio.run(run()), [0.0, 0.0, 0.0, None, None])
@@ -0,0 +1,152 @@
+import threading
+import time
+import unittest
+
+from smd import red
+from smd.arbiter import BusArbiter, Priority, method_priority
+from smd.emulator import Emulator, VirtualClock
+
+
+class HeldMaster(red.Master):
+    """ Master whose hold method keeps the I/O thread busy until released. """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    def hold(self):
+        self.release.wait()
+
+
+class TestBusArbiter(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bus = Emulator(ids=[1, 2])
+        self.master = HeldMaster(self.bus.transport())
+        for id in [1, 2]:
+            self.master.attach(red.Red(id))
+        # A loaded test machine may hold a setpoint longer than the default deadline
+        self.arbiter = BusArbiter(self.master, deadlines={Priority.CONTROL: 1.0})
+
+    def tearDown(self) -> None:
+        self.master.release.set()
+        self.arbiter.close()
+        self.bus.close()
+
+    def test_priority(self):
+        self.assertEqual(method_priority('set_velocity'), Priority.CONTROL)
+        self.assertEqual(method_priority('get_position'), Priority.TELEMETRY)
+        self.assertEqual(method_priority('set_shaft_cpr'), Priority.CONFIG)
+        with self.assertRaises(ValueError):
+            self.arbiter.submit('get_position', 1, priority=5)
+        with self.assertRaises(AttributeError):
+            self.arbiter.submit('no_such_method')
+
+    def test_calls(self):
+        self.arbiter.set_shaft_cpr(1, 64.0)
+        self.assertEqual(self.arbiter.get_shaft_cpr(1), 64.0)
+        self.assertEqual(self.arbiter.call('get_variables', 2, [red.Index.DeviceID]), [2])
+        future = self.arbiter.submit('ping', 2)
+        self.assertTrue(future.result())
+        with self.assertRaises(ValueError):
+            self.arbiter.get_position(7)
+
+        stats = self.arbiter.get_stats()
+        self.assertEqual(stats['config']['completed'], 2)
+        self.assertEqual(stats['telemetry']['completed'], 2)
+        self.assertEqual(stats['telemetry']['failed'], 1)
+        self.assertEqual(stats['telemetry']['wait']['count'], 3)
+
+    def hold(self, arbiter):
+        """ Keep the I/O thread of the arbiter busy until the master is released. """
+        future = arbiter.submit('hold')
+        while not future.running():
+            time.sleep(0.001)
+        return future
+
+    def test_preemption(self):
+        order = []
+        held = self.hold(self.arbiter)
+        futures = [self.arbiter.submit('get_position', 1), self.arbiter.submit('set_shaft_rpm', 1, 100.0),
+                   self.arbiter.submit('set_velocity', 1, 10.0), self.arbiter.submit('get_velocity', 2)]
+        for name, future in zip(['telemetry', 'config', 'control', 'telemetry 2'], futures):
+            future.add_done_callback(lambda _, name=name: order.append(name))
+        self.assertEqual(self.arbiter.pending(), 4)
+        self.master.release.set()
+        for future in futures + [held]:
+            future.result()
+        self.assertEqual(order, ['control', 'telemetry', 'telemetry 2', 'config'])
+
+    def test_deadline(self):
+        self.hold(self.arbiter)
+        late = self.arbiter.submit('set_velocity', 1, 10.0, deadline=0.001)
+        on_time = self.arbiter.submit('get_position', 1)
+        time.sleep(0.01)
+        self.master.release.set()
+        with self.assertRaises(TimeoutError):
+            late.result()
+        self.assertIsNotNone(on_time.result())
+        self.assertEqual(self.arbiter.get_stats()['control']['expired'], 1)
+
+    def test_threads(self):
+        errors = []
+
+        def worker(id, method, *args):
+            try:
+                for _ in range(50):
+                    getattr(self.arbiter, method)(id, *args)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(1, 'get_position')),
+                   threading.Thread(target=worker, args=(2, 'set_velocity', 5.0)),
+                   threading.Thread(target=worker, args=(2, 'get_velocity'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.bus.drivers[2].vars[red.Index.SetVelocity].value(), 5.0)
+        self.assertEqual(sum([stats['completed'] for stats in self.arbiter.get_stats().values()]), 150)
+
+    def test_close(self):
+        self.arbiter.close()
+        with self.assertRaises(RuntimeError):
+            self.arbiter.submit('get_position', 1)
+
+        arbiter = BusArbiter(self.master)
+        held = self.hold(arbiter)
+        queued = arbiter.submit('get_position', 1)
+        arbiter.close(wait=False)
+        self.master.release.set()
+        held.result()
+        self.assertTrue(queued.cancelled())
+        self.assertEqual(arbiter.get_stats()['telemetry']['cancelled'], 1)
+
+
+    def test_blocking_motion(self):
+        clock = VirtualClock()
+        bus = Emulator(ids=[1], clock=clock)
+        master = red.Master(bus.transport())
+        master.attach(red.Red(1))
+        master.set_shaft_rpm(1, 100)
+        master.set_shaft_cpr(1, 6533)
+        master.pid_tuner(1)
+        master.enable_torque(1, True)
+        master.set_operation_mode(1, red.OperationMode.Position)
+
+        with BusArbiter(master) as arbiter:
+            # The position polling of a blocking motion must not hold the I/O thread
+            with self.assertRaises(ValueError):
+                arbiter.submit('goTo', 1, 20000, 5, 0, 0, True)
+            arbiter.goTo(1, 20000, time_=5, blocking=True)
+            self.assertAlmostEqual(clock(), 5, delta=0.2)
+            stats = arbiter.get_stats()
+            self.assertEqual(stats['control']['completed'], 1)
+            self.assertGreater(stats['telemetry']['completed'], 1)
+            self.assertLess(abs(arbiter.get_position(1) - 20000), 10)
+        bus.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
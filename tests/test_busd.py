@@ -0,0 +1,113 @@
+import os
+import socket
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+from smd import red
+from smd.busd import BusClient, BusServer
+from smd.emulator import Emulator
+
+
+class TestBusServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'busd.sock')
+        self.bus = Emulator(ids=[1, 2])
+        self.master = red.Master(self.bus.transport())
+        for id in [1, 2]:
+            self.master.attach(red.Red(id))
+        self.server = BusServer([('emulator', self.master, [1, 2])], self.path, rate_hz=200)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = BusClient(self.path)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.bus.close()
+        self.directory.cleanup()
+
+    def test_requests(self):
+        ports = self.client.ports()
+        self.assertEqual([(port['name'], port['ids']) for port in ports], [('emulator', [1, 2])])
+
+        self.client.set_variables(0, 2, [[red.Index.SetVelocity, 12.5], [red.Index.TorqueLimit, 100]])
+        self.assertEqual(self.client.get_variables(0, 2, [red.Index.SetVelocity, red.Index.TorqueLimit]), [12.5, 100])
+        self.assertEqual(self.bus.drivers[2].vars[red.Index.SetVelocity].value(), 12.5)
+
+        self.client.call(0, 'set_shaft_cpr', 1, 64.0)
+        self.assertEqual(self.client.call(0, 'get_shaft_cpr', 1), 64.0)
+        with self.assertRaises(RuntimeError):
+            self.client.get_variables(0, 3, [red.Index.PresentPosition])
+        with self.assertRaises(RuntimeError):
+            self.client.call(0, '_Master__send', '')
+
+    def test_batching(self):
+        clients = [BusClient(self.path) for _ in range(4)]
+        results = dict()
+
+        def work(i, client):
+            for _ in range(20):
+                client.set_variables(0, 1 + i % 2, [[red.Index.SetVelocity, float(i)]])
+                results[i] = client.get_variables(0, 1 + i % 2, [red.Index.DeviceID])
+
+        threads = [threading.Thread(target=work, args=(i, client)) for i, client in enumerate(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for client in clients:
+            client.close()
+
+        self.assertEqual(results, {0: [1], 1: [2], 2: [1], 3: [2]})
+        stats = self.client.ports()[0]['stats']
+        self.assertEqual(stats['reads'], 80)
+        self.assertEqual(stats['writes'], 80)
+        # Requests of different clients share packages
+        self.assertLess(stats['transactions'], stats['reads'] + stats['writes'])
+
+    def test_socket(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        # A running server is never replaced
+        with self.assertRaises(OSError):
+            BusServer([], self.path)
+        self.assertEqual(self.client.ports()[0]['name'], 'emulator')
+
+        # The socket of a server which did not close it is replaced
+        stale = os.path.join(self.directory.name, 'stale.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        server = BusServer([], stale, mode=0o660)
+        self.assertEqual(stat.S_IMODE(os.stat(stale).st_mode), 0o660)
+        server.server_close()
+        self.assertFalse(os.path.exists(stale))
+
+        other = os.path.join(self.directory.name, 'file')
+        open(other, 'w').close()
+        with self.assertRaises(OSError):
+            BusServer([], other)
+        self.assertTrue(os.path.exists(other))
+
+    def test_telemetry(self):
+        self.bus.drivers[1].motor.position = 50.0
+        self.bus.drivers[1].vars[red.Index.PresentPosition].value(50.0)
+        telemetry = self.client.telemetry(0)
+        deadline = time.perf_counter() + 1
+        # Cycles which started before the position was moved publish the old one
+        while ((telemetry.read(1) is None) or (telemetry.read(1)[1] != 50.0)) and (time.perf_counter() < deadline):
+            time.sleep(0.005)
+        timestamp, position, velocity, current, sequence = telemetry.read(1)
+        self.assertGreater(sequence, 0)
+        self.assertEqual(position, 50.0)
+        self.assertAlmostEqual(timestamp, time.time(), delta=1)
+        self.assertIsNotNone(telemetry.read(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
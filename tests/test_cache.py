@@ -0,0 +1,109 @@
+import time
+import unittest
+
+from smd import red
+from smd.emulator import Emulator
+
+
+class TestRegisterCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bus = Emulator(ids=[1, 2])
+        self.master = red.Master(self.bus.transport())
+        for id in [1, 2]:
+            self.master.attach(red.Red(id))
+        self.master.reset_pacing_stats()
+
+    def tearDown(self) -> None:
+        self.bus.close()
+
+    def packages(self):
+        return self.master.get_pacing_stats()['packages']
+
+    def test_until_write(self):
+        self.bus.drivers[1].vars[red.Index.OutputShaftCPR].value(64.0)
+        self.assertEqual(self.master.get_shaft_cpr(1), 64.0)
+        self.assertEqual(self.master.get_shaft_cpr(1), 64.0)
+        self.assertEqual(self.packages(), 1)
+
+        # Changes behind the back of the master are not seen
+        self.bus.drivers[1].vars[red.Index.OutputShaftCPR].value(32.0)
+        self.assertEqual(self.master.get_shaft_cpr(1), 64.0)
+        self.master.set_shaft_cpr(1, 128.0)
+        self.assertEqual(self.master.get_shaft_cpr(1), 128.0)
+        self.assertEqual(self.packages(), 3)
+
+        # Acknowledged writes update the cache
+        self.master.set_variables(1, [[red.Index.OutputShaftCPR, 256.0]], ack=True)
+        self.assertEqual(self.master.get_shaft_cpr(1), 256.0)
+        self.assertEqual(self.packages(), 4)
+
+        # Reads with a register which is never cached go to the bus
+        self.master.get_variables(1, [red.Index.OutputShaftCPR, red.Index.PresentPosition])
+        self.assertEqual(self.packages(), 5)
+
+        stats = self.master.get_cache_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['invalidations'], 2)
+        self.assertEqual(stats['entries'], 1)
+
+    def test_invalidation(self):
+        self.master.get_control_parameters_velocity(1)
+        self.master.get_control_parameters_velocity(2)
+        self.master.get_position_limits(2)
+        self.assertEqual(self.master.get_cache_stats()['entries'], 14)
+
+        self.master.set_variables_sync_multi({1: [[red.Index.VelocityPGain, 2.0]], 2: [[red.Index.VelocityPGain, 3.0]]})
+        self.assertEqual(self.master.get_control_parameters_velocity(2)[0], 3.0)
+        self.master.set_variables_bulk({2: [[red.Index.MinimumPositionLimit, -100]]})
+        self.assertEqual(self.master.get_position_limits(2)[0], -100)
+        self.master.reboot(1)
+        self.assertEqual(self.master.get_cache_stats()['entries'], 14 - 6)
+        self.master.clear_cache()
+        self.assertEqual(self.master.get_cache_stats()['entries'], 0)
+
+    def test_policy(self):
+        self.assertEqual(self.master.get_cache_policy(red.Index.TorqueLimit), red.CachePolicy.UNTIL_WRITE)
+        self.assertEqual(self.master.get_cache_policy(red.Index.PresentPosition), red.CachePolicy.NEVER)
+        self.master.set_cache_policy(red.Index.PresentPosition, 0.05)
+        self.master.get_position(1)
+        self.master.get_position(1)
+        self.assertEqual(self.packages(), 1)
+        time.sleep(0.06)
+        self.master.get_position(1)
+        self.assertEqual(self.packages(), 2)
+
+        self.master.set_cache_policy(red.Index.TorqueLimit, red.CachePolicy.NEVER)
+        self.master.get_torque_limit(1)
+        self.master.get_torque_limit(1)
+        self.assertEqual(self.packages(), 4)
+        with self.assertRaises(ValueError):
+            self.master.set_cache_policy(red.Index.TorqueLimit, -1)
+
+    def test_broadcast(self):
+        self.assertEqual(self.master.get_torque_limit(1), 65535)
+        self.assertEqual(self.master.get_torque_limit(2), 65535)
+        self.master.get_shaft_cpr(1)
+        self.master.set_variables(255, [[red.Index.TorqueLimit, 77]])
+        self.assertEqual(self.bus.drivers[1].vars[red.Index.TorqueLimit].value(), 77)
+        self.assertEqual(self.master.get_torque_limit(1), 77)
+        self.assertEqual(self.master.get_torque_limit(2), 77)
+        self.assertEqual(self.master.get_cache_stats()['hits'], 0)
+        # Other registers stay cached
+        self.master.get_shaft_cpr(1)
+        self.assertEqual(self.master.get_cache_stats()['hits'], 1)
+
+    def test_firmware_routines(self):
+        self.master.get_control_parameters_position(1)
+        self.master.get_control_parameters_velocity(2)
+        self.master.pid_tuner(1)
+        self.assertEqual(self.master.get_cache_stats()['entries'], 6)
+        self.master.enter_bootloader(2)
+        self.assertEqual(self.master.get_cache_stats()['entries'], 0)
+        self.master.get_control_parameters_position(1)
+        self.assertEqual(self.master.get_cache_stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
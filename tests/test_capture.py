@@ -0,0 +1,113 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from smd import red
+from smd.capture import CaptureReader, CaptureWriter, RX, TX, analyze, decode, main
+from smd.emulator import Emulator
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'capture.bin')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_records(self):
+        writer = CaptureWriter(self.path, 115200, buffer_size=64)
+        writer.record(TX, b'\x01\x02', 10)
+        writer.record(RX, memoryview(b'\x03' * 100), 20)
+        writer.record(TX, b'', 30)
+        writer.close()
+        # A record cut short is ignored
+        with open(self.path, 'ab') as file:
+            file.write(b'\x00' * 5)
+
+        reader = CaptureReader(self.path)
+        self.assertEqual(reader.baudrate, 115200)
+        self.assertEqual([(t, d, bytes(data)) for t, d, data in reader.records()],
+                         [(10, TX, b'\x01\x02'), (20, RX, b'\x03' * 100), (30, TX, b'')])
+        reader.close()
+
+        with open(self.path, 'wb') as file:
+            file.write(b'not a capture file of the library')
+        with self.assertRaises(ValueError):
+            CaptureReader(self.path)
+
+    def test_master(self):
+        bus = Emulator(ids=[1, 2])
+        transport = bus.transport()
+        master = red.Master(transport)
+        for id in [1, 2, 3]:
+            master.attach(red.Red(id))
+
+        master.get_variables(1, [red.Index.PresentPosition])
+        master.start_capture(self.path)
+        for _ in range(5):
+            master.get_variables(1, [red.Index.PresentPosition, red.Index.PresentVelocity])
+        master.set_variables(2, [[red.Index.SetVelocity, 1.0]])
+        master.get_variables(3, [red.Index.PresentPosition])
+        master.get_variables_bulk({1: [red.Index.PresentPosition], 2: [red.Index.PresentPosition]})
+        master.stop_capture()
+        master.get_variables(1, [red.Index.PresentPosition])
+        transport.close()
+        bus.close()
+
+        reader = CaptureReader(self.path)
+        frames = list(reader.frames())
+        reader.close()
+        self.assertEqual([direction for _, direction, _ in frames], [TX, RX] * 5 + [TX, TX, TX, RX, RX])
+        self.assertEqual([t for t, _, _ in frames], sorted([t for t, _, _ in frames]))
+
+        self.assertEqual(decode(frames[0][2]), {'id': 1, 'command': 'READ',
+                                                'indexes': ['PresentPosition', 'PresentVelocity']})
+        reply = decode(frames[1][2], reply=True)
+        self.assertEqual(reply['id'], 1)
+        self.assertEqual(sorted(reply['values']), ['PresentPosition', 'PresentVelocity'])
+        self.assertEqual(decode(frames[10][2])['values'], {'SetVelocity': 1.0})
+
+        report = analyze(self.path)
+        self.assertEqual(report['packages'], {'tx': 8, 'rx': 7})
+        self.assertEqual(sorted(report['latency']), [1, 2])
+        self.assertEqual(report['latency'][1]['count'], 6)
+        self.assertEqual(report['errors'], {'timeouts': 1, 'crc_errors': 0, 'stale': 0})
+        self.assertGreater(report['utilization'], 0)
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(main([self.path, '--json']), 0)
+        self.assertEqual(json.loads(output.getvalue())['packages'], {'tx': 8, 'rx': 7})
+
+    def test_errors(self):
+        reply = red.Red._ping_frame(1)
+        writer = CaptureWriter(self.path, 115200)
+        for i in range(4):
+            start = i * 1000000000
+            writer.record(TX, red.Red._ping_frame(1), start)
+            writer.record(RX, reply, start + 2000000)
+        # Corrupt replies 10 ms apart form a burst
+        for i in range(3):
+            start = 5000000000 + i * 10000000
+            writer.record(TX, red.Red._ping_frame(1), start)
+            writer.record(RX, reply[:-1] + bytes([reply[-1] ^ 0xFF]), start + 2000000)
+        writer.close()
+
+        report = analyze(self.path)
+        self.assertEqual(report['latency'][1]['count'], 4)
+        self.assertAlmostEqual(report['latency'][1]['p50'], 2000, delta=50)
+        self.assertEqual(report['errors']['crc_errors'], 3)
+        self.assertEqual(report['errors']['timeouts'], 3)
+        self.assertEqual(len(report['bursts']), 1)
+        self.assertEqual(report['bursts'][0]['kinds'], {'timeout': 3, 'crc_error': 3})
+        self.assertAlmostEqual(report['gaps'][0]['length'], 2.0, delta=0.01)
+        self.assertEqual(len(report['gaps']), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
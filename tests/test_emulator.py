@@ -0,0 +1,235 @@
+import sys
+import threading
+import time
+import unittest
+
+from smd import red
+from smd.emulator import Emulator, VirtualClock
+from smd.transport import TermiosTransport
+
+
+class TestEmulator(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bus = Emulator(ids=[1, 2, 5], modules=['Button_1', 'RGB_2'], software_version=(1, 2, 3))
+        self.master = red.Master(self.bus.transport())
+        for id in [1, 2, 5]:
+            self.master.attach(red.Red(id))
+
+    def tearDown(self) -> None:
+        self.bus.close()
+
+    def test_ping_scan(self):
+        self.assertTrue(self.master.ping(2))
+        self.assertFalse(self.master.ping(3))
+        self.assertEqual(self.master.scan(ids=range(8)), [1, 2, 5])
+
+    def test_write_read(self):
+        self.master.set_variables(1, [[red.Index.SetVelocity, 100.0], [red.Index.TorqueEnable, 1]])
+        self.assertEqual(self.bus.drivers[1].vars[red.Index.SetVelocity].value(), 100.0)
+        self.assertEqual(self.master.get_variables(1, [red.Index.SetVelocity, red.Index.TorqueEnable]), [100.0, 1])
+        self.assertEqual(self.master.set_variables(2, [[red.Index.SetPosition, 42.0]], ack=True), [42.0])
+        self.assertEqual(self.master.get_driver_info(5)['SoftwareVersion'], 'v1.2.3')
+
+        # Read only registers are not written
+        self.master.set_variables(1, [[red.Index.DeviceFamily, 0x11]])
+        self.assertEqual(self.master.get_variables(1, [red.Index.DeviceFamily]), [red.Red._PRODUCT_TYPE])
+
+    def test_sync_bulk(self):
+        self.master.set_variables_sync(red.Index.SetVelocity, [[1, 10.0], [5, 50.0]])
+        self.master.set_variables_sync_multi({1: [[red.Index.SetTorque, 1.0], [red.Index.SetDutyCycle, 2.0]],
+                                              2: [[red.Index.SetTorque, 3.0], [red.Index.SetDutyCycle, 4.0]]})
+        self.master.set_variables_bulk({2: [[red.Index.SetPosition, 7.0]], 5: [[red.Index.TorqueEnable, 1]]})
+        self.assertEqual(self.master.get_variables_bulk({5: [red.Index.SetVelocity, red.Index.TorqueEnable],
+                                                         1: [red.Index.SetVelocity, red.Index.SetDutyCycle],
+                                                         2: [red.Index.SetTorque, red.Index.SetPosition]}),
+                         {5: [50.0, 1], 1: [10.0, 2.0], 2: [3.0, 7.0]})
+
+    def test_eeprom_reboot(self):
+        self.master.set_variables(1, [[red.Index.SetVelocity, 100.0]])
+        self.master.eeprom_write(1)
+        self.master.set_variables(1, [[red.Index.SetVelocity, 5.0]])
+        self.master.reboot(1)
+        self.assertEqual(self.master.get_velocity(1), 0.0)
+        self.assertEqual(self.master.get_variables(1, [red.Index.SetVelocity]), [100.0])
+
+        self.master.factory_reset(1)
+        self.assertEqual(self.master.get_variables(1, [red.Index.SetVelocity]), [0.0])
+
+    def test_update_id(self):
+        self.master.update_driver_id(5, 7)
+        self.assertEqual(sorted(self.bus.drivers), [1, 2, 7])
+        self.assertTrue(self.master.ping(7))
+
+    def test_modules(self):
+        self.bus.drivers[1].scan_modules()
+        self.assertEqual(self.master.get_variables(1, [red.Index.connected_bitfield]), [[1 << 1, 1 << (42 - 32)]])
+        self.assertEqual(self.bus.drivers[1].commands, {red.Commands.READ: 1})
+
+    def test_concurrent_frames(self):
+        # A poller builds frames in the broadcast and driver buffers while other calls write
+        master = red.Master(self.bus.transport(), baudrate=1000000)
+        for id in [1, 2, 5]:
+            master.attach(red.Red(id))
+        stop = threading.Event()
+
+        def poll():
+            while not stop.is_set():
+                master.get_variables_bulk({1: [red.Index.PresentPosition], 2: [red.Index.PresentPosition]})
+                master.get_variables(5, [red.Index.PresentPosition])
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        thread = threading.Thread(target=poll, daemon=True)
+        thread.start()
+        try:
+            for i in range(500):
+                master.set_variables_sync(red.Index.SetVelocity, [[1, float(i)], [2, float(i)]])
+                master.set_variables_bulk({5: [[red.Index.SetPosition, float(i)]]})
+                master.reset_encoder(5)
+        finally:
+            stop.set()
+            thread.join()
+            sys.setswitchinterval(interval)
+
+        self.assertEqual(self.bus.crc_errors, 0)
+        commands = self.bus.drivers[5].commands
+        self.assertEqual(self.bus.drivers[1].commands[red.Commands.SYNC_WRITE], 500)
+        self.assertEqual(commands[red.Commands.BULK_WRITE], 500)
+        self.assertEqual(commands[red.Commands.RESET_ENC], 500)
+        self.assertEqual(self.bus.drivers[2].vars[red.Index.SetVelocity].value(), 499.0)
+        self.assertEqual(self.bus.drivers[5].vars[red.Index.SetPosition].value(), 499.0)
+
+    def test_crc_error(self):
+        frame = bytearray(red.Red._ping_frame(1))
+        frame[-1] ^= 0xFF
+        transport = self.bus.transport()
+        transport.write(bytes(frame))
+        self.assertEqual(self.bus.crc_errors, 1)
+        self.assertEqual(transport.in_waiting, 0)
+
+
+class TestEmulatorTiming(unittest.TestCase):
+
+    def test_response_delay(self):
+        bus = Emulator(ids=[1], response_delay=0.02)
+        transport = bus.transport()
+        start = time.perf_counter()
+        transport.write(red.Red._ping_frame(1))
+        self.assertEqual(transport.in_waiting, 0)
+        self.assertEqual(transport.readinto(bytearray(10), 0.5), 10)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.02)
+
+        # The master gives up on replies later than its timeout
+        master = red.Master(bus.transport(), reply_timeout=0)
+        master.attach(red.Red(1))
+        self.assertFalse(master.ping(1))
+        master.set_reply_timeout(0.05)
+        self.assertTrue(master.ping(1))
+        bus.close()
+
+    def test_scan_latency(self):
+        # A USB serial adapter holds received bytes for a few milliseconds
+        bus = Emulator(ids=[1, 2, 3], response_delay=0.008)
+        master = red.Master(bus.transport())
+        self.assertEqual(master.scan(ids=range(6)), [1, 2, 3])
+        self.assertEqual(master.scan(ids=range(6), timeout=0), [])
+        time.sleep(0.02)
+        # Hinted IDs which miss the short probe are probed again with the full timeout
+        self.assertEqual(master.scan(ids=range(6), hints=[2, 4]), [1, 2, 3])
+        bus.close()
+
+    def test_byte_timing(self):
+        # 10 bits per byte at 9600 baud, the 10 byte ping and its reply take about 21 ms
+        bus = Emulator(ids=[1], baudrate=9600)
+        transport = bus.transport()
+        start = time.perf_counter()
+        transport.write(red.Red._ping_frame(1))
+        buffer = bytearray(10)
+        self.assertEqual(transport.readinto(buffer, 0.5), 10)
+        self.assertGreaterEqual(time.perf_counter() - start, 20 * 10 / 9600)
+        self.assertEqual(bytes(buffer), red.Red._ping_frame(1))
+        bus.close()
+
+    def test_pty(self):
+        bus = Emulator(ids=[3, 4])
+        transport = TermiosTransport(bus.pty(), 115200)
+        master = red.Master(transport)
+        self.assertEqual(master.scan(ids=range(6)), [3, 4])
+        master.set_variables(4, [[red.Index.SetVelocity, 12.5]])
+        self.assertEqual(master.get_variables(4, [red.Index.SetVelocity]), [12.5])
+        transport.close()
+        bus.close()
+
+
+class TestMotorModel(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.clock = VirtualClock()
+        self.bus = Emulator(ids=[1], clock=self.clock)
+        self.master = red.Master(self.bus.transport())
+        self.master.attach(red.Red(1))
+        self.master.set_shaft_rpm(1, 100)
+        self.master.set_shaft_cpr(1, 6533)
+        self.master.pid_tuner(1)
+        self.master.enable_torque(1, True)
+
+    def test_untuned(self):
+        self.master.set_shaft_cpr(1, 0)
+        self.master.set_operation_mode(1, red.OperationMode.PWM)
+        self.master.set_duty_cycle(1, 50)
+        self.clock.advance(1)
+        self.assertEqual(self.master.get_velocity(1), 0.0)
+
+    def test_goto_blocking(self):
+        self.master.set_operation_mode(1, red.OperationMode.Position)
+        start = time.perf_counter()
+        self.master.goTo(1, 20000, time_=5, blocking=True)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertAlmostEqual(self.clock(), 5, delta=0.2)
+
+    def test_long_motion(self):
+        self.master.set_operation_mode(1, red.OperationMode.Position)
+        self.master.goTo(1, -100000, time_=60)
+        start = time.perf_counter()
+        self.clock.advance(30)
+        self.assertAlmostEqual(self.master.get_position(1), -50000, delta=500)
+        self.assertAlmostEqual(self.master.get_velocity(1), -100000 / 60 * 60 / 6533, delta=1)
+        self.clock.advance(31)
+        self.assertAlmostEqual(self.master.get_position(1), -100000, delta=10)
+        self.assertLess(time.perf_counter() - start, 5)
+
+        self.master.reset_encoder(1)
+        self.master.set_position(1, 0)
+        self.clock.advance(1)
+        self.assertAlmostEqual(self.master.get_position(1), 0, delta=1)
+
+    def test_velocity(self):
+        self.master.set_operation_mode(1, red.OperationMode.Velocity)
+        self.master.set_velocity(1, 50, accel=100)
+        self.clock.advance(0.25)
+        self.assertAlmostEqual(self.master.get_velocity(1), 25, delta=2)
+        self.clock.advance(1)
+        self.assertAlmostEqual(self.master.get_velocity(1), 50, delta=0.5)
+
+        self.master.set_velocity_limit(1, 20)
+        self.clock.advance(1)
+        self.assertAlmostEqual(self.master.get_velocity(1), 20, delta=0.5)
+
+    def test_torque_limit(self):
+        self.master.set_operation_mode(1, red.OperationMode.PWM)
+        self.master.set_torque_limit(1, 1000)
+        self.master.set_duty_cycle(1, 100)
+        self.clock.advance(0.001)
+        self.bus.update()
+        self.assertLessEqual(self.bus.drivers[1].motor.current, 1000)
+        self.clock.advance(2)
+        self.assertAlmostEqual(self.master.get_velocity(1), 100, delta=1)
+
+        self.master.enable_torque(1, False)
+        self.clock.advance(1)
+        self.assertAlmostEqual(self.master.get_velocity(1), 0, delta=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
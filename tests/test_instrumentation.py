@@ -0,0 +1,154 @@
+import unittest
+
+from smd import red
+from smd.emulator import Emulator
+from smd.instrumentation import LatencyHistogram
+from smd.transport import MemoryTransport
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for us in range(1, 10001):
+            histogram.record(us / 1e6)
+
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual((histogram.min, histogram.max), (1, 10000))
+        for percent in [50, 90, 99, 99.9]:
+            self.assertAlmostEqual(histogram.percentile(percent), 100 * percent, delta=100 * percent / 64)
+        self.assertEqual(histogram.percentile(100), 10000)
+        self.assertEqual(sum([count for _, count in histogram.buckets()]), 10000)
+
+        # Values below 128 us are exact
+        histogram.reset()
+        histogram.record(100e-6)
+        self.assertEqual(histogram.snapshot()['p50'], 100)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bus = Emulator(ids=[1, 2])
+        self.transport = self.bus.transport()
+        self.master = red.Master(self.transport)
+        for id in [1, 2, 3]:
+            self.master.attach(red.Red(id))
+
+    def tearDown(self) -> None:
+        self.bus.close()
+
+    def test_disabled(self):
+        self.master.get_variables(1, [red.Index.PresentPosition])
+        self.assertIsNone(self.master.get_instrumentation())
+
+        self.master.enable_instrumentation()
+        self.master.enable_instrumentation(False)
+        self.master.get_variables(1, [red.Index.PresentPosition])
+        stats = self.master.get_instrumentation()
+        self.assertFalse(stats['enabled'])
+        self.assertEqual(stats['totals']['sent'], 0)
+
+    def test_counters(self):
+        self.master.enable_instrumentation()
+        for _ in range(10):
+            self.master.get_variables(1, [red.Index.PresentPosition])
+        self.master.set_variables(2, [[red.Index.SetVelocity, 1.0]])
+        self.master.get_variables(3, [red.Index.PresentPosition])
+        self.master.get_variables(3, [red.Index.PresentPosition])
+        self.master.get_variables_bulk({1: [red.Index.PresentPosition], 2: [red.Index.PresentPosition]})
+
+        stats = self.master.get_instrumentation()
+        self.assertTrue(stats['enabled'])
+        self.assertEqual(stats['ids'][1]['commands']['READ'], dict(sent=10, acked=10, crc_errors=0,
+                                                                   short_reads=0, timeouts=0, retries=0))
+        self.assertEqual(stats['ids'][2]['commands']['WRITE']['sent'], 1)
+        self.assertEqual(stats['ids'][3]['commands']['READ']['timeouts'], 2)
+        self.assertEqual(stats['ids'][3]['commands']['READ']['retries'], 1)
+        self.assertEqual(stats['ids'][255]['commands']['BULK_READ']['sent'], 1)
+        self.assertEqual(stats['commands']['BULK_READ']['acked'], 2)
+        self.assertEqual(stats['totals']['sent'], 14)
+        self.assertEqual(stats['latency']['count'], 12)
+        self.assertEqual(stats['bytes_out'], self.transport.written)
+        self.assertGreater(stats['bytes_in'], 0)
+
+        self.master.reset_instrumentation()
+        self.assertEqual(self.master.get_instrumentation()['totals']['sent'], 0)
+
+    def test_failures(self):
+        def corrupt(data):
+            reply = bytearray(red.Red._ping_frame(data[red.Index.DeviceID]))
+            if data[red.Index.DeviceID] == 1:
+                reply[-1] ^= 0xFF
+                return bytes(reply)
+            return bytes(reply[:5])
+
+        master = red.Master(MemoryTransport(corrupt))
+        master.attach(red.Red(1))
+        master.attach(red.Red(2))
+        master.enable_instrumentation()
+        self.assertFalse(master.ping(1))
+        self.assertFalse(master.ping(2))
+        stats = master.get_instrumentation()
+        self.assertEqual(stats['ids'][1]['commands']['PING']['crc_errors'], 1)
+        self.assertEqual(stats['ids'][2]['commands']['PING']['short_reads'], 1)
+
+    def test_pipelined(self):
+        self.master.enable_instrumentation()
+        self.master.get_variables_pipelined({1: [red.Index.PresentPosition], 3: [red.Index.PresentPosition]})
+        stats = self.master.get_instrumentation()
+        self.assertEqual(stats['ids'][1]['commands']['READ']['acked'], 1)
+        self.assertEqual(stats['ids'][3]['commands']['READ']['timeouts'], 1)
+
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bus = Emulator(ids=[1, 2])
+        self.master = red.Master(self.bus.transport())
+        for id in [1, 2, 3]:
+            self.master.attach(red.Red(id))
+        self.events = []
+        self.hooks = {event: self.recorder(event) for event in ['pre_write', 'post_write', 'reply', 'error']}
+        for event, hook in self.hooks.items():
+            self.master.add_hook(event, hook)
+
+    def tearDown(self) -> None:
+        self.bus.close()
+
+    def recorder(self, event):
+        def hook(frame, id, command, start, now, *args):
+            self.assertIsInstance(frame, memoryview)
+            self.assertLessEqual(start, now)
+            self.events.append((event, bytes(frame), id, command) + args)
+        return hook
+
+    def test_transaction(self):
+        request = red.Red(1).get_variables([red.Index.PresentPosition])
+        self.master.get_variables(1, [red.Index.PresentPosition])
+        self.assertEqual([event[0] for event in self.events], ['pre_write', 'post_write', 'reply'])
+        self.assertEqual(self.events[0][1:], (request, 1, red.Commands.READ))
+        self.assertEqual(self.events[2][2:], (1, red.Commands.READ))
+        self.assertEqual(len(self.events[2][1]), 15)
+
+    def test_error(self):
+        self.master.get_variables(3, [red.Index.PresentPosition])
+        self.master.get_variables_bulk({1: [red.Index.PresentPosition], 3: [red.Index.PresentPosition]})
+        errors = [event for event in self.events if event[0] == 'error']
+        self.assertEqual([error[2:] for error in errors],
+                         [(3, red.Commands.READ, 'timeouts'), (3, red.Commands.BULK_READ, 'timeouts')])
+        self.assertEqual([event[2] for event in self.events if event[0] == 'reply'], [1])
+
+    def test_remove(self):
+        with self.assertRaises(ValueError):
+            self.master.add_hook('read', print)
+        for event, hook in self.hooks.items():
+            self.master.remove_hook(event, hook)
+        self.master.remove_hook('reply', print)
+        self.master.get_variables(1, [red.Index.PresentPosition])
+        self.assertEqual(self.events, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
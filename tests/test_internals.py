@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from crccheck.crc import Crc32Mpeg2 as CRC32
+
+from smd import _internals
+
+
+class TestCRC32MPEG2(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.rng = random.Random(0x55BA)
+
+    def test_matches_crccheck(self):
+        for _ in range(500):
+            frame = bytes(self.rng.getrandbits(8) for _ in range(self.rng.randint(0, 255)))
+            self.assertEqual(_internals._crc32_mpeg2(frame), CRC32.calc(frame))
+            self.assertEqual(_internals._crc32_mpeg2(bytearray(frame)), CRC32.calc(frame))
+            self.assertEqual(_internals._crc32_mpeg2(memoryview(frame)), CRC32.calc(frame))
+
+    def test_incremental(self):
+        for _ in range(100):
+            frame = bytes(self.rng.getrandbits(8) for _ in range(self.rng.randint(3, 64)))
+            header = _internals._crc32_mpeg2(frame[:3])
+            self.assertEqual(_internals._crc32_mpeg2(memoryview(frame)[3:], header), CRC32.calc(frame))
+
+
+class TestRegisterFile(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.layout = _internals._RegisterLayout([
+            (_internals.Index.Header, 'B', False, 0x55),
+            (_internals.Index.DeviceID, 'B', True, 0),
+            (_internals.Index.DeviceFamily, 'f', True, 0),
+            (_internals.Index.PackageSize, 'iiB', True, 0),
+        ])
+        self.vars = _internals._RegisterFile(self.layout)
+
+    def test_layout(self):
+        self.assertEqual(self.layout.sizes, (1, 1, 4, 9))
+        self.assertEqual(self.layout.offsets, (0, 1, 2, 6))
+        self.assertEqual(self.layout.size, 15)
+
+    def test_values(self):
+        self.assertEqual(self.vars[0].value(), 0x55)
+        self.vars[0].value(1)
+        self.assertEqual(self.vars[0].value(), 0x55)
+
+        self.vars[_internals.Index.DeviceFamily].value(0.1)
+        self.assertNotEqual(self.vars[2].value(), 0.1)
+        self.assertAlmostEqual(self.vars[2].value(), 0.1, places=6)
+
+        self.assertEqual(self.vars[3].value(), [0, 0, 0])
+        self.vars[3].value([-1, 2, 3])
+        self.assertEqual(self.vars[-1].value(), [-1, 2, 3])
+        with self.assertRaises(Exception):
+            self.vars[1].value(256)
+
+    def test_accessors(self):
+        self.assertEqual([var.type() for var in self.vars[1:3]], ['B', 'f'])
+        self.assertEqual(self.vars[3].size(), 9)
+        self.assertIs(self.vars[2].index(), _internals.Index.DeviceFamily)
+        self.assertEqual(len(self.vars), 4)
+        with self.assertRaises(IndexError):
+            self.vars[4]
+
+    def test_independent_devices(self):
+        other = _internals._RegisterFile(self.layout)
+        self.vars[1].value(7)
+        self.assertEqual(other[1].value(), 0)
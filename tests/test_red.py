@@ -1,7 +1,13 @@
+import io
+import os
+import struct
+import tempfile
+import time
 import unittest
 import unittest.mock
 from unittest.mock import patch
 from smd import red
+from smd._internals import _crc32_mpeg2
 
 
 class TestRed(unittest.TestCase):
@@ -13,19 +19,53 @@ class TestRed(unittest.TestCase):
         pass
 
     def test_set_variables(self):
-        pass
+        frame = self.dev.set_variables([red.Index.SetVelocity, red.Index.TorqueEnable], [12.5, 1])
+        self.assertEqual(frame, b'U\x01\xba\x11\x01\x00-\x00\x00HA\n\x01@LG\xbf')
+        self.assertEqual(self.dev.get_ack_size(), 13)
+        self.assertEqual(self.dev.vars[red.Index.SetVelocity].value(), 12.5)
 
     def test_get_variables(self):
-        pass
+        frame = self.dev.get_variables([red.Index.PresentPosition, red.Index.PresentVelocity])
+        self.assertEqual(frame, b'U\x01\xba\x0c\x02\x00KL\x1b]<\xf5')
+        self.assertEqual(self.dev.get_ack_size(), 20)
 
     def test_reboot(self):
-        pass
+        self.assertEqual(self.dev.reboot(), b'U\x01\xba\n\x05\x00=\x01\x99\x06')
+        self.assertEqual(self.dev.get_ack_size(), 0)
 
     def test_EEPROM_write(self):
-        pass
+        self.assertEqual(self.dev.EEPROM_write(), b'U\x01\xba\n\x03\x00\x9b\xbeO\xe3')
 
     def test_ping(self):
-        pass
+        self.assertEqual(self.dev.ping(), b'U\x01\xba\n\x00\x00H\xe1\xa4\x91')
+        self.assertEqual(self.dev.get_ack_size(), 10)
+
+    def test_frame_buffer_reuse(self):
+        first = self.dev.get_variables([red.Index.PresentPosition])
+        self.dev.set_variables([red.Index.SetVelocity], [1.0])
+        self.assertEqual(self.dev.get_variables([red.Index.PresentPosition]), first)
+
+    def reply(self, index_list, value_list):
+        frame = bytearray(red.Red(1).set_variables(index_list, value_list))
+        frame[red.Index.Command] = red.Commands.READ
+        return bytes(frame)
+
+    def test_parse_reply(self):
+        self.dev.get_variables([red.Index.PresentPosition, red.Index.Joystick_1])
+        self.dev.parse_reply(self.reply([red.Index.PresentPosition, red.Index.Joystick_1], [1.5, [-1, 2, 3]]))
+        self.assertEqual(self.dev.vars[red.Index.PresentPosition].value(), 1.5)
+        self.assertEqual(self.dev.vars[red.Index.Joystick_1].value(), [-1, 2, 3])
+
+        # Replies which do not match the request are walked field by field
+        self.dev.parse_reply(self.reply([red.Index.MotorCurrent, red.Index.PresentPosition], [0.5, 2.5]))
+        self.assertEqual(self.dev.vars[red.Index.PresentPosition].value(), 2.5)
+        self.assertEqual(self.dev.vars[red.Index.MotorCurrent].value(), 0.5)
+
+        self.dev.parse_reply(self.reply([red.Index.PresentVelocity], [4.0]), [red.Index.PresentVelocity])
+        self.assertEqual(self.dev.vars[red.Index.PresentVelocity].value(), 4.0)
+
+        with self.assertRaises(ValueError):
+            self.dev.parse_reply(self.reply([red.Index.PresentVelocity], [4.0])[:-5] + bytes(4))
 
     def change_id(self):
         pass
@@ -33,14 +73,38 @@ class TestRed(unittest.TestCase):
 
 class TestMaster(unittest.TestCase):
     def setUp(self) -> None:
-        patcher = patch("smd.red.serial.Serial", autospec=True)
+        patcher = patch("smd.transport.serial.Serial", autospec=True)
         self.mock = patcher.start()
         self.addCleanup(patcher.stop)
         self.mock.reset_mock()
+        # Without a file descriptor the transport waits with the port timeout, as modelled by readinto
+        self.mock.return_value.fileno.side_effect = io.UnsupportedOperation
+        self.master = red.Master('/dev/ttyUSB0')
+        self.port = self.mock.return_value
+        self.port.in_waiting = 0
+        self.port.readinto.side_effect = self.readinto
+        self.rx = bytearray()
 
     def tearDown(self) -> None:
         pass
 
+    def readinto(self, b):
+        # Like a serial port, an empty read blocks until data arrives or the timeout passes
+        deadline = time.perf_counter() + (self.port.timeout or 0)
+        while not self.rx and (time.perf_counter() < deadline):
+            time.sleep(0.0002)
+        n = min(len(b), len(self.rx))
+        b[:n] = self.rx[:n]
+        del self.rx[:n]
+        return n
+
+    def reply(self, id, index_list, value_list, command=red.Commands.READ):
+        # A reply has the same layout as a write package from the device
+        frame = bytearray(red.Red(id).set_variables(index_list, value_list))
+        frame[red.Index.Command] = command
+        frame[-4:] = _crc32_mpeg2(frame[:-4]).to_bytes(4, 'little')
+        return bytes(frame)
+
     def test_set_variables(self):
         pass
 
@@ -58,3 +122,264 @@ class TestMaster(unittest.TestCase):
 
     def test_update_baudrate(self):
         pass
+
+    def test_get_variables_bulk(self):
+        self.master.attach(red.Red(1))
+        self.master.attach(red.Red(2))
+        self.rx += b'\x00' + self.reply(1, [red.Index.PresentPosition, red.Index.MotorCurrent], [5.0, 0.5]) \
+            + self.reply(2, [red.Index.PresentPosition, red.Index.MotorCurrent], [7.0, 1.5])
+
+        ret = self.master.get_variables_bulk({1: [red.Index.PresentPosition, red.Index.MotorCurrent],
+                                              2: [red.Index.PresentPosition, red.Index.MotorCurrent],
+                                              })
+        self.assertEqual(ret, {1: [5.0, 0.5], 2: [7.0, 1.5]})
+        self.port.write.assert_called_once()
+        frame = self.port.write.call_args[0][0]
+        self.assertEqual(frame[:6], bytes([0x55, 0xFF, 0xBA, len(frame), red.Commands.BULK_READ, 0]))
+        self.assertEqual(frame[6:-4], bytes([1, 2, red.Index.PresentPosition, red.Index.MotorCurrent,
+                                             2, 2, red.Index.PresentPosition, red.Index.MotorCurrent]))
+        self.assertEqual(len(self.port.readinto.call_args_list[0][0][0]), 40)
+
+    def test_get_variables_bulk_missing_reply(self):
+        self.master.attach(red.Red(1))
+        self.master.attach(red.Red(2))
+        self.rx += self.reply(2, [red.Index.PresentVelocity], [3.0])
+
+        ret = self.master.get_variables_bulk({1: [red.Index.PresentVelocity], 2: [red.Index.PresentVelocity]})
+        self.assertEqual(ret, {1: None, 2: [3.0]})
+
+    def test_set_variables_bulk(self):
+        for id in range(40):
+            self.master.attach(red.Red(id))
+
+        self.master.set_variables_bulk({id: [[red.Index.SetVelocity, id], [red.Index.TorqueEnable, 1]] for id in range(40)})
+
+        frames = [call[0][0] for call in self.port.write.call_args_list]
+        self.assertEqual(len(frames), 2)
+        for frame in frames:
+            self.assertLessEqual(len(frame), 255)
+            self.assertEqual(frame[red.Index.Command], red.Commands.BULK_WRITE)
+        self.assertEqual(frames[0][6:17], bytes([0, 2, red.Index.SetVelocity, 0, 0, 0, 0, red.Index.TorqueEnable, 1, 1, 2]))
+
+    def test_bulk_unattached_id(self):
+        with self.assertRaises(ValueError):
+            self.master.get_variables_bulk({3: [red.Index.PresentPosition]})
+
+    def test_set_variables_sync_multi(self):
+        for id in range(4):
+            self.master.attach(red.Red(id))
+        move = [[red.Index.SCurveTime, 1.0], [red.Index.SCurveMaxVelocity, 100.0],
+                [red.Index.ScurveAccel, 50.0], [red.Index.SCurveSetpoint, 0.0]]
+
+        self.master.set_variables_sync_multi({id: move for id in range(4)})
+
+        # One standard single index SYNC_WRITE per register, shared by every driver
+        frames = [call[0][0] for call in self.port.write.call_args_list]
+        self.assertEqual(len(frames), 4)
+        for frame, (index, value) in zip(frames, move):
+            self.assertEqual(len(frame), 6 + 1 + 4 * 5 + 4)
+            self.assertEqual(frame[red.Index.Command], red.Commands.SYNC_WRITE)
+            self.assertEqual(frame[6], index)
+            self.assertEqual(frame[7:27:5], bytes(range(4)))
+            self.assertEqual(struct.unpack_from('<f', frame, 8)[0], value)
+
+    def test_set_variables_sync_multi_order(self):
+        for id in range(3):
+            self.master.attach(red.Red(id))
+        self.master.set_variables_sync_multi({0: [[red.Index.SetPosition, 1.0]],
+                                              1: [[red.Index.PositionControlMode, 0], [red.Index.SetPosition, 2.0]],
+                                              2: [[red.Index.SetVelocity, 3.0], [red.Index.SetPosition, 4.0]]})
+        frames = [call[0][0] for call in self.port.write.call_args_list]
+        # Every driver gets its registers in the given order, drivers share the SetPosition package
+        self.assertEqual([(frame[6], list(frame[7:-4:5])) for frame in frames],
+                         [(red.Index.PositionControlMode, [1]), (red.Index.SetVelocity, [2]),
+                          (red.Index.SetPosition, [0, 1, 2])])
+
+    def test_set_variables_sync_multi_split(self):
+        for id in range(64):
+            self.master.attach(red.Red(id))
+        self.master.set_variables_sync_multi({id: [[red.Index.SetVelocity, 10.0], [red.Index.SetTorque, 5.0]] for id in range(64)})
+        frames = [call[0][0] for call in self.port.write.call_args_list]
+        self.assertEqual([frame[6] for frame in frames], [red.Index.SetVelocity] * 2 + [red.Index.SetTorque] * 2)
+        self.assertEqual(sum([(len(frame) - 11) // 5 for frame in frames]), 128)
+
+    def fake_fleet(self, ids):
+        probes = []
+
+        def write(data):
+            probes.append(data[red.Index.DeviceID])
+            if probes[-1] in ids:
+                self.rx += red.Red._ping_frame(probes[-1])
+
+        self.port.write.side_effect = write
+        return probes
+
+    def test_scan(self):
+        probes = self.fake_fleet([3, 17, 200])
+        self.master.attach(red.Red(5))
+        start = time.perf_counter()
+        self.assertEqual(self.master.scan(timeout=0), [3, 17, 200])
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(probes, list(range(255)))
+        self.assertEqual(self.master.attached(), [3, 17, 200])
+        with self.assertRaises(ValueError):
+            self.master.get_variables(5, [red.Index.PresentPosition])
+
+    def test_scan_hints_and_cache(self):
+        probes = self.fake_fleet([40, 41])
+        cache_file = os.path.join(tempfile.mkdtemp(), 'scan.json')
+
+        self.assertEqual(self.master.scan(ids=range(100), hints=[41], cache_file=cache_file, timeout=0), [40, 41])
+        self.assertEqual(probes[:2], [41, 0])
+        self.assertEqual(len(probes), 100)
+
+        probes.clear()
+        self.assertEqual(self.master.scan(ids=range(100), cache_file=cache_file, timeout=0), [40, 41])
+        self.assertEqual(probes[:3], [40, 41, 0])
+
+    def test_pacing(self):
+        self.master.attach(red.Red(1))
+        self.master.set_velocity(1, 10)
+        self.master.set_velocity(1, 20)
+        stats = self.master.get_pacing_stats()
+        self.assertEqual(stats['packages'], 2)
+        self.assertEqual(stats['paced'], 1)
+
+        time.sleep(0.01)
+        self.master.set_velocity(1, 30)
+        stats = self.master.get_pacing_stats()
+        self.assertEqual(stats['paced'], 1)
+        self.assertGreater(stats['saved_time'], 0)
+
+        self.master.reset_pacing_stats()
+        self.assertEqual(self.master.get_pacing_stats()['packages'], 0)
+
+    def test_read_resync(self):
+        self.master.attach(red.Red(1))
+        self.rx += b'\x55\xba\x01' + self.reply(1, [red.Index.PresentPosition], [42.0])
+        self.assertEqual(self.master.get_position(1), 42.0)
+
+    def test_read_short_reply(self):
+        self.master.attach(red.Red(1))
+        # Without a minimum reply timeout a short reply fails within about one package time
+        self.master.set_reply_timeout(0)
+        self.rx += self.reply(1, [red.Index.PresentPosition], [42.0])[:-1]
+        start = time.perf_counter()
+        self.assertIsNone(self.master.get_variables(1, [red.Index.PresentPosition]))
+        self.assertLess(time.perf_counter() - start, 0.01)
+
+    def test_reply_timeout(self):
+        self.master.attach(red.Red(1))
+        self.assertEqual(self.master.get_reply_timeout(), 0.1)
+        self.master.set_reply_timeout(0.03)
+        start = time.perf_counter()
+        self.assertIsNone(self.master.get_variables(1, [red.Index.PresentPosition]))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.03)
+
+        # Complete replies do not wait for the timeout
+        self.rx += self.reply(1, [red.Index.PresentPosition], [42.0])
+        start = time.perf_counter()
+        self.assertEqual(self.master.get_position(1), 42.0)
+        self.assertLess(time.perf_counter() - start, 0.02)
+        with self.assertRaises(ValueError):
+            self.master.set_reply_timeout(-1)
+
+    def test_read_stale_reply(self):
+        self.master.attach(red.Red(1))
+        self.rx += self.reply(1, [red.Index.PresentPosition], [1.0])
+        self.port.in_waiting = len(self.rx)
+        self.master.set_velocity(1, 10)
+        self.port.in_waiting = 0
+        self.rx += self.reply(1, [red.Index.PresentPosition], [2.0])
+        self.assertEqual(self.master.get_position(1), 2.0)
+
+    def test_get_variables_pipelined(self):
+        ids = list(range(20))
+        for id in ids:
+            self.master.attach(red.Red(id))
+        def write(data):
+            # Driver 7 does not reply, driver 3 replies twice
+            id = data[red.Index.DeviceID]
+            if id != 7:
+                self.rx += self.reply(id, [red.Index.PresentPosition], [float(id)]) * (2 if id == 3 else 1)
+
+        self.port.write.side_effect = write
+        self.master.set_pipeline_window(8)
+
+        ret = self.master.get_variables_pipelined({id: [red.Index.PresentPosition] for id in ids})
+        self.assertEqual(ret, {id: (None if id == 7 else [float(id)]) for id in ids})
+        self.assertEqual(self.port.write.call_count, 20)
+
+    def test_get_variables_future_window(self):
+        for id in range(3):
+            self.master.attach(red.Red(id))
+        self.master.set_pipeline_window(2)
+        futures = [self.master.get_variables_future(id, [red.Index.PresentVelocity]) for id in range(2)]
+        self.assertFalse(any([future.done() for future in futures]))
+
+        self.rx += self.reply(0, [red.Index.PresentVelocity], [5.0])
+        third = self.master.get_variables_future(2, [red.Index.PresentVelocity])
+        self.assertEqual(futures[0].result(), [5.0])
+
+        self.rx += self.reply(1, [red.Index.PresentVelocity], [6.0]) + self.reply(2, [red.Index.PresentVelocity], [7.0])
+        self.master.flush_pipeline()
+        self.assertEqual([futures[1].result(), third.result()], [[6.0], [7.0]])
+
+    def fake_bulk_fleet(self, ids, delay=0):
+        def write(data):
+            time.sleep(delay)
+            if data[red.Index.Command] == red.Commands.BULK_READ:
+                body = data[6:-4]
+                while body:
+                    id, index_list, body = body[0], list(body[2:2 + body[1]]), body[2 + body[1]:]
+                    if id in ids:
+                        self.rx += self.reply(id, index_list, [float(id)] * len(index_list))
+            elif data[red.Index.Command] == red.Commands.READ:
+                self.rx += self.reply(data[red.Index.DeviceID], [red.Index.PresentVelocity], [-1.0])
+
+        self.port.write.side_effect = write
+
+    def test_polling(self):
+        for id in range(3):
+            self.master.attach(red.Red(id))
+        # ID 2 never replies, which must not slow down the cycles
+        self.master.set_reply_timeout(0)
+        self.fake_bulk_fleet([0, 1])
+        self.assertIsNone(self.master.get_snapshot(0))
+
+        self.master.start_polling({id: [red.Index.PresentPosition, red.Index.MotorCurrent] for id in range(3)}, 40)
+        time.sleep(0.15)
+        self.assertEqual(self.master.get_velocity(1), -1.0)
+        time.sleep(0.15)
+        self.master.stop_polling()
+
+        timestamp, values = self.master.get_snapshot(1)
+        self.assertEqual(values, {red.Index.PresentPosition: 1.0, red.Index.MotorCurrent: 1.0})
+        self.assertLessEqual(timestamp, time.perf_counter())
+        self.assertEqual(set(self.master.get_snapshot().keys()), {0, 1})
+
+        stats = self.master.get_polling_stats()
+        self.assertGreater(stats['cycles'], 8)
+        self.assertEqual(stats['no_reply'], stats['cycles'])
+        self.assertLessEqual(stats['dropped'], 1)
+        self.assertAlmostEqual(stats['achieved_hz'], 40, delta=8)
+
+    def test_polling_overrun(self):
+        self.master.attach(red.Red(1))
+        self.fake_bulk_fleet([1], delay=0.005)
+        self.master.start_polling({1: [red.Index.PresentPosition]}, 1000)
+        time.sleep(0.1)
+        self.master.stop_polling()
+
+        stats = self.master.get_polling_stats()
+        self.assertGreater(stats['dropped'], stats['cycles'])
+        self.assertLess(stats['achieved_hz'], 250)
+
+    def test_polling_invalid(self):
+        with self.assertRaises(ValueError):
+            self.master.start_polling({1: [red.Index.PresentPosition]}, 100)
+        self.master.attach(red.Red(1))
+        with self.assertRaises(ValueError):
+            self.master.start_polling({1: [red.Index.PresentPosition]}, 0)
+        with self.assertRaises(IndexError):
+            self.master.start_polling({1: []}, 100)
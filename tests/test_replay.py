@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+from smd import red
+from smd.emulator import Emulator
+from smd.replay import compare, load, recorded, replay_emulator, replay_master
+
+
+class TestReplay(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'capture.bin')
+
+        bus = Emulator(ids=[1, 2])
+        transport = bus.transport()
+        master = red.Master(transport)
+        for id in [1, 2, 3]:
+            master.attach(red.Red(id))
+        master.start_capture(cls.path)
+        for _ in range(5):
+            master.get_variables(1, [red.Index.PresentPosition, red.Index.PresentVelocity])
+        master.set_variables(2, [[red.Index.SetVelocity, 3.0]], ack=True)
+        master.set_variables_sync(red.Index.SetVelocity, [[1, 2.0], [2, 4.0]])
+        master.set_variables_sync_multi({1: [[red.Index.SetVelocity, 2.0], [red.Index.SetPosition, 5]],
+                                         2: [[red.Index.SetVelocity, 1.0], [red.Index.SetPosition, 6]]})
+        master.set_variables_bulk({1: [[red.Index.SetVelocity, 2.0]], 2: [[red.Index.SetPosition, 7]]})
+        master.get_variables(3, [red.Index.PresentPosition])
+        master.ping(1)
+        master.get_variables_bulk({1: [red.Index.PresentPosition], 2: [red.Index.SetVelocity]})
+        master.stop_capture()
+        transport.close()
+        bus.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def test_load(self):
+        baudrate, exchanges = load(self.path)
+        self.assertEqual(baudrate, 115200)
+        self.assertEqual(len(exchanges), 13)
+        self.assertEqual([list(exchange.replies) for exchange in exchanges],
+                         [[1]] * 5 + [[2]] + [[]] * 5 + [[1], [1, 2]])
+        self.assertEqual(exchanges[0].time, 0.0)
+        self.assertEqual([exchange.time for exchange in exchanges], sorted([exchange.time for exchange in exchanges]))
+
+        report = recorded(exchanges)
+        self.assertEqual((report['exchanges'], report['replies']), (13, 9))
+        self.assertEqual(sorted(report['ids']), [1, 2])
+
+    def test_emulator(self):
+        _, exchanges = load(self.path)
+        bus = Emulator(ids=[1, 2])
+        report = replay_emulator(exchanges, bus, speed=0)
+        bus.close()
+        self.assertEqual(report['exchanges'], 13)
+        self.assertEqual(report['replies'], 9)
+        self.assertEqual((report['missing'], report['extra'], report['different']), (0, 0, 0))
+
+        # A driver which is not emulated is missing, and the state of the emulated drivers shows up
+        bus = Emulator(ids=[1])
+        bus.drivers[1].motor.position = 100.0
+        bus.drivers[1].vars[red.Index.PresentPosition].value(100.0)
+        report = replay_emulator(exchanges, bus, speed=0, timeout=0.01)
+        bus.close()
+        self.assertEqual(report['missing'], 2)
+        self.assertEqual(report['different'], 6)
+
+    def test_master(self):
+        _, exchanges = load(self.path)
+        report = replay_master(exchanges)
+        self.assertEqual(report['exchanges'], 13)
+        self.assertEqual((report['missing'], report['extra'], report['different'], report['skipped']), (0, 0, 0, 0))
+        self.assertGreater(report['throughput'], 0)
+
+        class Changed(red.Master):
+            def get_variables(self, id, index_list):
+                return super().get_variables(id, list(reversed(index_list)))
+
+        report = replay_master(exchanges, master_class=Changed)
+        # The five requests with two indexes are written in another order
+        self.assertEqual(report['different'], 5)
+
+        class Cached(red.Master):
+            def get_variables(self, id, index_list):
+                if id == 1:
+                    return [0.0] * len(index_list)
+                return super().get_variables(id, index_list)
+
+        report = replay_master(exchanges, master_class=Cached)
+        # The five reads of ID 1 are answered without a package
+        self.assertEqual((report['exchanges'], report['missing'], report['different']), (13, 5, 5))
+
+    def test_compare(self):
+        _, exchanges = load(self.path)
+        report = recorded(exchanges)
+        faster = dict(report, throughput=report['throughput'] * 2)
+        changes = compare(faster, report)
+        self.assertAlmostEqual(changes['throughput'], 1.0)
+        self.assertEqual(changes['p50'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import time
+import unittest
+
+from smd import red
+from smd.emulator import Emulator
+from smd.setpoints import SetpointQueue
+
+
+class FailingMaster():
+    """ Master whose writes always fail. """
+
+    def set_variables(self, id, pairs):
+        raise ValueError("{} is not an attached ID!".format(id))
+
+    set_variables_sync_multi = set_variables
+
+
+class RecordingMaster():
+    """ Master which records the written index lists. """
+
+    def __init__(self):
+        self.writes = []
+        self.fail = False
+
+    def set_variables(self, id, pairs):
+        if self.fail:
+            raise ValueError("{} is not an attached ID!".format(id))
+        self.writes.append({id: [int(index) for index, value in pairs]})
+
+    def set_variables_sync_multi(self, id_idx_val_pairs):
+        if self.fail:
+            raise ValueError("Write failed!")
+        self.writes.append({id: [int(index) for index, value in pairs] for id, pairs in id_idx_val_pairs.items()})
+
+
+class TestSetpointQueue(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.bus = Emulator(ids=[1, 2, 3])
+        self.master = red.Master(self.bus.transport())
+        for id in [1, 2, 3]:
+            self.master.attach(red.Red(id))
+        self.master.reset_pacing_stats()
+
+    def tearDown(self) -> None:
+        self.bus.close()
+
+    def value(self, id, index):
+        return self.bus.drivers[id].vars[index].value()
+
+    def test_coalescing(self):
+        queue = SetpointQueue(self.master)
+        for i in range(10):
+            queue.set_velocity(1, float(i))
+        self.assertEqual(queue.pending(), 1)
+        self.assertEqual(self.master.get_pacing_stats()['packages'], 0)
+
+        self.assertEqual(queue.flush(), 1)
+        self.assertEqual(self.master.get_pacing_stats()['packages'], 1)
+        self.assertEqual(self.value(1, red.Index.SetVelocity), 9.0)
+        self.assertEqual(queue.flush(), 0)
+
+        stats = queue.get_stats()
+        self.assertEqual(stats['submitted'], 10)
+        self.assertEqual(stats['coalesced'], 9)
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(stats['flushes'], 1)
+
+    def test_sync_write(self):
+        queue = SetpointQueue(self.master)
+        for id in [3, 1, 2]:
+            queue.set_velocity(id, 10.0 * id)
+            queue.set_velocity(id, 20.0 * id)
+        queue.set_torque(2, 50.0)
+        self.assertEqual(queue.flush(), 4)
+        # IDs 1 and 3 share a package, ID 2 writes another index list
+        self.assertEqual(self.master.get_pacing_stats()['packages'], 2)
+        self.assertEqual(queue.get_stats()['packages'], 2)
+        self.assertEqual([self.value(id, red.Index.SetVelocity) for id in [1, 2, 3]], [20.0, 40.0, 60.0])
+        self.assertEqual(self.value(2, red.Index.SetTorque), 50.0)
+
+    def test_order(self):
+        master = RecordingMaster()
+        queue = SetpointQueue(master)
+        queue.set_position(2, 100.0)
+        queue.set_velocity(1, 10.0)
+        self.assertEqual(queue.flush(), 3)
+        self.assertEqual(master.writes[-1], {2: [red.Index.PositionControlMode, red.Index.SetPosition],
+                                             1: [red.Index.SetVelocity]})
+
+        # The newest value of a register is sent after the registers set before it
+        queue.set(1, red.Index.SetPosition, 5.0)
+        queue.set_position(1, 200.0)
+        queue.flush()
+        self.assertEqual(master.writes[-1], {1: [red.Index.PositionControlMode, red.Index.SetPosition]})
+
+    def test_acceleration(self):
+        queue = SetpointQueue(self.master)
+        queue.set_velocity(1, 10.0, accel=50.0)
+        queue.flush()
+        self.assertEqual(self.value(1, red.Index.SetVelocityAcceleration), 50.0)
+        self.assertEqual(self.value(1, red.Index.SetVelocity), 10.0)
+
+        queue.set_velocity(1, 20.0)
+        queue.flush()
+        self.assertEqual(self.value(1, red.Index.SetVelocityAcceleration), 50.0)
+        self.assertEqual(self.value(1, red.Index.SetVelocity), 20.0)
+
+        queue.set_velocity(1, 30.0, accel=red.MotorConstants.MAX_ACCEL)
+        queue.flush()
+        self.assertEqual(self.value(1, red.Index.SetVelocityAcceleration), 0.0)
+        self.assertEqual(self.value(1, red.Index.SetVelocity), 30.0)
+
+    def test_thread(self):
+        with SetpointQueue(self.master, rate_hz=200) as queue:
+            for i in range(100):
+                queue.set_velocity(1, float(i))
+                queue.set_position(2, float(i))
+                time.sleep(0.0005)
+        stats = queue.get_stats()
+        self.assertEqual(stats['submitted'], 300)
+        self.assertEqual(stats['sent'] + stats['coalesced'], 300)
+        self.assertGreater(stats['coalesced'], 0)
+        self.assertEqual(queue.pending(), 0)
+        self.assertEqual(self.value(1, red.Index.SetVelocity), 99.0)
+        self.assertEqual(self.value(2, red.Index.SetPosition), 99.0)
+
+    def test_error(self):
+        queue = SetpointQueue(FailingMaster())
+        queue.set_velocity(7, 1.0)
+        self.assertEqual(queue.flush(), 0)
+        self.assertIsInstance(queue.last_error, ValueError)
+        self.assertEqual(queue.pending(), 1)
+        queue.set_velocity(7, 2.0)
+        self.assertEqual(queue.get_stats()['errors'], 1)
+
+        queue.close(flush=False)
+        self.assertEqual(queue.pending(), 0)
+
+        # Values queued after a failed flush are sent after the failed ones
+        master = RecordingMaster()
+        master.fail = True
+        queue = SetpointQueue(master)
+        queue.set_position(7, 1.0)
+        self.assertEqual(queue.flush(), 0)
+        queue.set(7, red.Index.PositionControlMode, 1.0)
+        master.fail = False
+        self.assertEqual(queue.flush(), 2)
+        self.assertEqual(master.writes, [{7: [red.Index.SetPosition, red.Index.PositionControlMode]}])
+
+
+if __name__ == '__main__':
+    unittest.main()
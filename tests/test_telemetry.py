@@ -0,0 +1,132 @@
+import struct
+import time
+import unittest
+
+from smd import red
+from smd.emulator import Emulator
+from smd.telemetry import TelemetryReader, TelemetryWriter, dtype, numpy
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.writer = TelemetryWriter([1, 5])
+        self.reader = TelemetryReader(self.writer.name)
+
+    def tearDown(self) -> None:
+        self.reader.close()
+        self.writer.close()
+
+    def test_segment(self):
+        self.assertEqual(self.reader.ids, [1, 5])
+        self.assertIsNone(self.reader.read(1))
+
+        self.writer.write(5, 10.0, -2.5, 300.0, timestamp=1.5)
+        self.writer.write(5, 11.0, -2.5, 300.0, timestamp=2.5)
+        self.assertEqual(self.reader.read(5), (2.5, 11.0, -2.5, 300.0, 2))
+        with self.assertRaises(KeyError):
+            self.reader.read(2)
+        self.reader.close()
+        self.writer.close()
+        with self.assertRaises(FileNotFoundError):
+            TelemetryReader(self.writer.name)
+
+    def test_modules(self):
+        self.writer.update(1, {red.Index.PresentPosition: 4.0, red.Index.Button_2: 1,
+                               red.Index.Joystick_1: [-100, 50, 1], red.Index.IMU_3: [1.5, -0.5],
+                               red.Index.SetVelocity: 20.0}, timestamp=3.0)
+        self.writer.update(1, {red.Index.Distance_5: 250})
+        timestamp, values, sequence = self.reader.read_values(1)
+        self.assertEqual(sequence, 2)
+        self.assertAlmostEqual(timestamp, time.time(), delta=1)
+        self.assertEqual(values[red.Index.PresentPosition], 4.0)
+        self.assertEqual(values[red.Index.Button_2], 1)
+        self.assertEqual(values[red.Index.Joystick_1], [-100, 50, 1])
+        self.assertEqual(values[red.Index.IMU_3], [1.5, -0.5])
+        self.assertEqual(values[red.Index.Distance_5], 250)
+        self.assertEqual(values[red.Index.Light_1], 0)
+        self.assertNotIn(red.Index.SetVelocity, values)
+
+    def test_view(self):
+        self.writer.write(5, 10.0, -2.5, 300.0, timestamp=1.5)
+        view = self.reader.view()
+        size = len(view) // len(self.reader.ids)
+        offset = self.reader.slot(5) * size
+        sequence = self.reader.begin(5)
+        record = struct.unpack_from('<IIdf', view, offset)
+        self.assertFalse(self.reader.retry(5, sequence))
+        self.assertEqual(record, (2, 5, 1.5, 10.0))
+        self.writer.write(5, 11.0, -2.5, 300.0)
+        self.assertTrue(self.reader.retry(5, sequence))
+        view.release()
+
+    def test_wrapped_sequence(self):
+        view = self.reader.view()
+        struct.pack_into('<I', view, self.reader.slot(5) * (len(view) // 2), 0xFFFFFFFE)
+        view.release()
+        self.writer.write(5, 10.0, -2.5, 300.0, timestamp=1.5)
+        self.assertEqual(self.reader.read(5), (1.5, 10.0, -2.5, 300.0, 1))
+
+    def test_stalled_writer(self):
+        self.writer.write(1, 1.0, 0.0, 0.0)
+        # A writer which stopped in the middle of a write leaves the sequence odd
+        view = self.reader.view()
+        struct.pack_into('<I', view, self.reader.slot(1) * (len(view) // 2), 3)
+        view.release()
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            self.reader.read(1, timeout=0.05)
+        with self.assertRaises(TimeoutError):
+            self.reader.begin(1, timeout=0.05)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertIsNone(self.reader.read(5, timeout=0.05))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_array(self):
+        self.writer.update(5, {red.Index.PresentVelocity: 3.0, red.Index.Joystick_2: [1, 2, 0]})
+        array = self.reader.array()
+        self.assertEqual(array.dtype, dtype())
+        self.assertEqual(list(array['id']), [1, 5])
+        self.assertEqual(array['PresentVelocity'][1], 3.0)
+        self.assertEqual(array['Joystick_2']['f1'][1], 2)
+        self.writer.update(5, {red.Index.PresentVelocity: 4.0})
+        self.assertEqual(array['PresentVelocity'][1], 4.0)
+        del array
+
+
+class TestPolling(unittest.TestCase):
+
+    def test_poller(self):
+        bus = Emulator(ids=[1, 2])
+        master = red.Master(bus.transport())
+        for id in [1, 2]:
+            master.attach(red.Red(id))
+        writer = TelemetryWriter([1, 2])
+        reader = TelemetryReader(writer.name)
+        bus.drivers[2].motor.position = 75.0
+        bus.drivers[2].vars[red.Index.PresentPosition].value(75.0)
+        bus.drivers[2].vars[red.Index.Distance_1].value(120)
+        other = TelemetryWriter([2])
+        with self.assertRaises(ValueError):
+            master.start_polling({1: [red.Index.PresentPosition]}, 100, telemetry=other)
+        other.close()
+
+        master.start_polling({1: [red.Index.PresentPosition], 2: [red.Index.PresentPosition, red.Index.Distance_1]},
+                             200, telemetry=writer)
+        deadline = time.perf_counter() + 1
+        while ((reader.read(2) is None) or (reader.read(2)[1] != 75.0)) and (time.perf_counter() < deadline):
+            time.sleep(0.005)
+        master.stop_polling()
+        timestamp, values, sequence = reader.read_values(2)
+        self.assertEqual(values[red.Index.PresentPosition], 75.0)
+        self.assertEqual(values[red.Index.Distance_1], 120)
+        self.assertEqual(sequence, master.get_polling_stats()['cycles'])
+        self.assertIsNotNone(reader.read(1))
+
+        reader.close()
+        writer.close()
+        bus.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
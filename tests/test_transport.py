@@ -0,0 +1,175 @@
+import asyncio
+import os
+import termios
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from smd import red
+from smd.aio import AsyncMaster
+from smd.transport import MemoryTransport, PtyTransport, SerialTransport, TermiosTransport, Transport
+from smd._internals import _FrameReceiver, _crc32_mpeg2
+
+
+def reply_to(frame, ids):
+    """ Reply to PING and READ packages of the given IDs, read values are the device ID. """
+    if frame[red.Index.DeviceID] not in ids:
+        return None
+    if frame[red.Index.Command] == red.Commands.PING:
+        return red.Red._ping_frame(frame[red.Index.DeviceID])
+    if frame[red.Index.Command] != red.Commands.READ:
+        return None
+    id = frame[red.Index.DeviceID]
+    index_list = list(frame[6:-4])
+    reply = bytearray(red.Red(id).set_variables(index_list, [float(id)] * len(index_list)))
+    reply[red.Index.Command] = red.Commands.READ
+    reply[-4:] = _crc32_mpeg2(reply[:-4]).to_bytes(4, 'little')
+    return bytes(reply)
+
+
+def respond(fd, ids):
+    receiver = _FrameReceiver(0x55, 0xBA, 10)
+    while True:
+        try:
+            receiver.feed(os.read(fd, 256))
+        except OSError:
+            return
+        frame = receiver.next_frame()
+        while frame is not None:
+            reply = reply_to(frame, ids)
+            if reply is not None:
+                os.write(fd, reply)
+            frame = receiver.next_frame()
+
+
+class TestMemoryTransport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.transport = MemoryTransport(lambda data: reply_to(data, [1, 2]))
+        self.master = red.Master(self.transport)
+        for id in range(4):
+            self.master.attach(red.Red(id))
+
+    def test_round_trip(self):
+        self.assertEqual(self.master.get_position(2), 2.0)
+        self.assertIsNone(self.master.get_variables(3, [red.Index.PresentPosition]))
+        self.assertEqual(self.master.get_variables_bulk({1: [red.Index.MotorCurrent], 3: [red.Index.MotorCurrent]}),
+                         {1: None, 3: None})
+        self.assertEqual(self.master.scan(ids=range(5)), [1, 2])
+        self.assertGreater(self.transport.written, 0)
+
+    def test_feed(self):
+        buffer = bytearray(4)
+        threading.Timer(0.01, self.transport.feed, args=(b'\x01\x02\x03\x04',)).start()
+        start = time.perf_counter()
+        self.assertEqual(self.transport.readinto(memoryview(buffer), 1.0), 4)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(buffer, b'\x01\x02\x03\x04')
+        self.assertEqual(self.transport.readinto(memoryview(buffer), 0.01), 0)
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            Transport()
+
+        class Incomplete(Transport):
+            def write(self, data):
+                return len(data)
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+class TestPtyTransport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.transport = PtyTransport(115200)
+        self.peer = os.open(self.transport.name, os.O_RDWR | os.O_NOCTTY)
+        threading.Thread(target=respond, args=(self.peer, [1]), daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.transport.close()
+        os.close(self.peer)
+
+    def test_round_trip(self):
+        master = red.Master(self.transport)
+        master.attach(red.Red(1))
+        master.attach(red.Red(2))
+        self.assertEqual(master.get_velocity(1), 1.0)
+        self.assertIsNone(master.get_variables(2, [red.Index.PresentVelocity]))
+        self.assertEqual(master.get_position(1), 1.0)
+
+    def test_async(self):
+        master = AsyncMaster(self.transport)
+        master.attach(red.Red(1))
+
+        async def run():
+            return await asyncio.gather(master.get_position(1), master.get_torque(1))
+
+        self.assertEqual(asyncio.run(run()), [1.0, 1.0])
+
+    def test_in_waiting(self):
+        os.write(self.peer, b'\x00' * 7)
+        time.sleep(0.01)
+        self.assertEqual(self.transport.in_waiting, 7)
+        self.transport.reset_input_buffer()
+        self.assertEqual(self.transport.in_waiting, 0)
+
+
+class TestTermiosTransport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.controller, peer = os.openpty()
+        self.transport = TermiosTransport(os.ttyname(peer), 1000000)
+        os.close(peer)
+        threading.Thread(target=respond, args=(self.controller, [5]), daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.transport.close()
+        os.close(self.controller)
+
+    def test_round_trip(self):
+        master = red.Master(self.transport, 1000000)
+        master.attach(red.Red(5))
+        self.assertEqual(master.get_position(5), 5.0)
+        self.assertEqual(master.scan(ids=range(8)), [5])
+
+    def test_set_baud(self):
+        self.transport.set_baud(57600)
+        with self.assertRaises(ValueError):
+            self.transport.set_baud(123456)
+
+
+class TestSerialTransport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.controller, peer = os.openpty()
+        self.transport = SerialTransport(os.ttyname(peer), 1000000)
+        os.close(peer)
+        threading.Thread(target=respond, args=(self.controller, [3]), daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.transport.close()
+        os.close(self.controller)
+
+    def test_round_trip(self):
+        master = red.Master(self.transport, 1000000)
+        master.attach(red.Red(3))
+        self.assertEqual(master.get_position(3), 3.0)
+        self.assertEqual(master.scan(ids=range(8)), [3])
+
+    def test_timeout(self):
+        buffer = bytearray(10)
+        # Reads with changing timeouts do not reconfigure the port
+        with patch('termios.tcgetattr', wraps=termios.tcgetattr) as tcgetattr:
+            start = time.perf_counter()
+            self.assertEqual(self.transport.readinto(buffer, 0.05), 0)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+            self.assertEqual(self.transport.readinto(buffer, 0), 0)
+            # The reply arrives while the read waits
+            writer = threading.Timer(0.02, self.transport.write, args=(red.Red._ping_frame(3),))
+            writer.start()
+            self.assertEqual(self.transport.readinto(buffer, 0.5), 10)
+            writer.join()
+            self.assertEqual(tcgetattr.call_count, 0)
+        self.assertEqual(bytes(buffer), red.Red._ping_frame(3))